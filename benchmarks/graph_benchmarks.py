@@ -0,0 +1,230 @@
+"""
+Headless benchmarks for graph construction, editing and rendering.
+
+Synthetic graphs are built through NodeFactory and NodeGraphController, every
+benchmark is timed with time.perf_counter and the results are written as JSON so
+runs from different versions can be compared:
+
+    python benchmarks/graph_benchmarks.py --sizes 1000 10000 --output results.json
+
+The serialize benchmark saves and loads the graph through the controller's
+saveGraph and loadGraph, in both the JSON and the binary format, so it includes
+rebuilding the scene. The checkout's src directory is put on sys.path, so the
+script runs without installing the package. The offscreen QPA platform is used
+unless QT_QPA_PLATFORM is already set.
+"""
+
+import argparse
+import contextlib
+import datetime
+import importlib.metadata
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+# run from a checkout without installing the package
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src")
+sys.path.insert(0, os.path.normpath(SRC))
+
+from qtpy import QtCore, QtGui, QtWidgets
+
+from QtNodes.controller import NodeGraphController
+from QtNodes.factory import NodeType, PortType
+from QtNodes.view import NodeGraphView
+
+COLUMNS = 100
+SPACING = QtCore.QPointF(220, 120)
+
+
+class Recorder:
+    def __init__(self):
+        self.results = []
+
+    @contextlib.contextmanager
+    def measure(self, name: str, nodes: int, **extra):
+        start = time.perf_counter()
+        yield
+        seconds = time.perf_counter() - start
+        self.results.append({"name": name, "nodes": nodes, "seconds": seconds, **extra})
+        print(f"{name:<24} {nodes:>8} {seconds * 1000:>10.1f} ms", file=sys.stderr)
+
+
+def make_controller():
+    controller = NodeGraphController()
+    factory = controller.factory
+    factory.port_types["image"] = PortType("image", color=QtGui.QColor(127, 32, 32))
+    factory.node_types["merge"] = NodeType(
+        "merge", "image", {"a": "image", "b": "image"}, {"out": "image"}
+    )
+    factory.node_types["constant"] = NodeType(
+        "constant", "image", {}, {"image": "image"}
+    )
+    return controller
+
+
+def grid_position(i: int):
+    return QtCore.QPointF((i % COLUMNS) * SPACING.x(), (i // COLUMNS) * SPACING.y())
+
+
+def build_graph(controller: NodeGraphController, count: int):
+    """
+    A grid of merge nodes, each one's output feeding the next one's first input.
+    """
+    nodes = controller.createNodes(
+        ("merge", grid_position(i)) for i in range(count)
+    )
+    controller.createConnections(
+        (nodes[i].outputPort("out"), nodes[i + 1].inputPort("a"))
+        for i in range(count - 1)
+    )
+    controller.undo_stack.clear()
+    return nodes
+
+
+def bench_create(recorder: Recorder, count: int):
+    controller = make_controller()
+    with recorder.measure("createNode", count):
+        for i in range(count):
+            controller.createNode("merge").setPos(grid_position(i))
+
+    controller = make_controller()
+    with recorder.measure("createNodes", count):
+        controller.createNodes(("merge", grid_position(i)) for i in range(count))
+
+
+def bench_edit(recorder: Recorder, count: int, moves: int):
+    controller = make_controller()
+    with recorder.measure("buildGraph", count):
+        nodes = build_graph(controller, count)
+
+    offset = QtCore.QPointF(0, (count // COLUMNS + 2) * SPACING.y())
+    positions = [n.pos() + offset for n in nodes]
+    with recorder.measure("cloneNodes", count):
+        controller.cloneNodes(nodes, positions)
+
+    selection = nodes[: max(1, count // 10)]
+    delta = QtCore.QPointF(3, 2)
+    with recorder.measure("moveNodes", len(selection), steps=moves):
+        for step in range(moves):
+            controller.moveNodes(selection, delta, f"move {step}")
+
+    with recorder.measure("undoMoves", len(selection), steps=moves):
+        for _ in range(moves):
+            controller.undo_stack.undo()
+
+    with recorder.measure("redoMoves", len(selection), steps=moves):
+        for _ in range(moves):
+            controller.undo_stack.redo()
+
+    with recorder.measure("removeNodes", count):
+        controller.removeNodes(nodes)
+
+    with recorder.measure("undoRemoveNodes", count):
+        controller.undo_stack.undo()
+
+
+def bench_serialize(recorder: Recorder, count: int):
+    controller = make_controller()
+    build_graph(controller, count)
+
+    with tempfile.TemporaryDirectory() as directory:
+        for binary in (False, True):
+            path = os.path.join(directory, "graph.qtng" if binary else "graph.json")
+            suffix = "Binary" if binary else "Json"
+            with recorder.measure(f"saveGraph{suffix}", count):
+                controller.saveGraph(path, binary)
+
+            with recorder.measure(f"loadGraph{suffix}", count):
+                controller.loadGraph(path)
+
+
+def bench_render(
+    recorder: Recorder,
+    count: int,
+    zooms: list[float],
+    frames: int,
+    opengl: bool,
+):
+    controller = make_controller()
+    build_graph(controller, count)
+
+    view = NodeGraphView()
+    if not opengl:
+        view.setViewport(QtWidgets.QWidget())
+    view.setScene(controller.scene)
+    view.resize(1920, 1080)
+    image = QtGui.QImage(view.size(), QtGui.QImage.Format.Format_ARGB32_Premultiplied)
+
+    center = controller.scene.itemsBoundingRect().center()
+    for zoom in zooms:
+        view.resetTransform()
+        view.scale(zoom, zoom)
+        view.centerOn(center)
+
+        def render():
+            image.fill(0)
+            painter = QtGui.QPainter(image)
+            view.render(painter)
+            painter.end()
+
+        with recorder.measure("renderFirstFrame", count, zoom=zoom):
+            render()
+
+        with recorder.measure("renderFrames", count, zoom=zoom, frames=frames):
+            for _ in range(frames):
+                render()
+
+
+def package_version():
+    try:
+        return importlib.metadata.version("qtnodes")
+    except importlib.metadata.PackageNotFoundError:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--zooms", type=float, nargs="+", default=[0.1, 0.4, 1.0, 2.0])
+    parser.add_argument("--frames", type=int, default=10)
+    parser.add_argument("--moves", type=int, default=50)
+    parser.add_argument(
+        "--opengl", action="store_true", help="render through QOpenGLWidget"
+    )
+    parser.add_argument("--output", help="write results to this file, default stdout")
+    args = parser.parse_args(argv)
+
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+    recorder = Recorder()
+    for count in args.sizes:
+        bench_create(recorder, count)
+        bench_edit(recorder, count, args.moves)
+        bench_serialize(recorder, count)
+        bench_render(recorder, count, args.zooms, args.frames, args.opengl)
+        app.processEvents()
+
+    report = {
+        "version": package_version(),
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "qt": QtCore.qVersion(),
+        "platform": platform.platform(),
+        "qpa": QtGui.QGuiApplication.platformName(),
+        "results": recorder.results,
+    }
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+from PySide6 import QtAsyncio
 from qtpy import QtWidgets, QtGui
 
 from QtNodes.view import NodeGraphView
@@ -41,7 +42,10 @@ def main():
     view.addAction(delete_action)
 
     view.show()
-    app.exec()
+
+    # run the Qt event loop through asyncio so NodeGraphController.evaluateAsync
+    # shares it with the view.
+    QtAsyncio.run(handle_sigint=True)
 
 
 if __name__ == "__main__":
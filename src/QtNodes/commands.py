@@ -1,53 +1,400 @@
 from __future__ import annotations
+import json
 import typing
 import uuid
+import weakref
+import zlib
 from typing import no_type_check_decorator
 
 from PySide6 import QtWidgets, QtCore, QtGui
-from QtNodes.connection import ConnectionItem
+from QtNodes.connection import ConnectionItem, layout_queue
+from QtNodes.instrumentation import probe
+from QtNodes.node import NodeItem
+from QtNodes.spatial import suspended_index
 
 if typing.TYPE_CHECKING:
-    from QtNodes.node import NodeItem
+    from QtNodes.model import GraphModel
 
 
 class CommandIDs:
     MoveCommand = 1
 
 
-class AddItemToSceneCommand(QtGui.QUndoCommand):
+def add_item_to_model(model: GraphModel | None, item: QtWidgets.QGraphicsItem):
+    """
+    Register a node or connection item with the model, other items are ignored.
+    """
+    if model is None:
+        return
+
+    if isinstance(item, NodeItem):
+        record = model.addNode(
+            item.name(),
+            {p.name(): p.datatype() for p in item.iterInputs()},
+            {p.name(): p.datatype() for p in item.iterOutputs()},
+            item.x(),
+            item.y(),
+            category=item.category(),
+            node_id=item.nodeId(),
+            item=item,
+        )
+        item.setNodeId(record.id)
+        item.setModel(model)
+
+    elif isinstance(item, ConnectionItem):
+        output_port = item.outputPort()
+        input_port = item.inputPort()
+        record = model.addEdge(
+            output_port.node().nodeId(),
+            output_port.name(),
+            input_port.node().nodeId(),
+            input_port.name(),
+            edge_id=item.connectionId(),
+            item=item,
+        )
+        item.setConnectionId(record.id)
+
+
+def remove_item_from_model(model: GraphModel | None, item: QtWidgets.QGraphicsItem):
+    if model is None:
+        return
+
+    if isinstance(item, NodeItem):
+        model.removeNode(item.nodeId())
+        item.setModel(None)
+    elif isinstance(item, ConnectionItem):
+        model.removeEdge(item.connectionId())
+
+
+def node_connections(model: GraphModel | None, node: NodeItem) -> list[ConnectionItem]:
+    """
+    The connections attached to a node. With a model they are looked up from its
+    edges, so connections whose items haven't been created yet are included.
+    """
+    if model is None or not model.hasNode(node.nodeId()):
+        connections = []
+        for port in node.iterPorts():
+            connections.extend(port.iterConnections())
+        return connections
+
+    connections = [model.edgeItem(e.id) for e in model.nodeEdges(node.nodeId())]
+    return [c for c in connections if c is not None]
+
+
+def node_template(node: NodeItem) -> list:
+    """
+    Everything a node is rebuilt from except its id and position.
+    """
+    return [
+        node.name(),
+        node.category(),
+        [[p.name(), p.datatype(), p.color().rgba()] for p in node.iterInputs()],
+        [[p.name(), p.datatype(), p.color().rgba()] for p in node.iterOutputs()],
+    ]
+
+
+def connection_state(connection: ConnectionItem) -> list:
+    output_port = connection.outputPort()
+    input_port = connection.inputPort()
+    return [
+        connection.connectionId(),
+        output_port.node().nodeId(),
+        output_port.name(),
+        input_port.node().nodeId(),
+        input_port.name(),
+    ]
+
+
+class GraphSnapshot:
+    """
+    Nodes and connections removed from the scene, kept as serialized state.
+
+    Nodes are stored as rows of id, position and an index into a table of
+    distinct node templates, so a snapshot of thousands of nodes of a few types
+    stays small and is rebuilt in one pass without parsing each node's ports.
+
+    The state is kept zlib compressed. Until the snapshot is released it also
+    holds on to the removed items, so undoing a recent large edit only puts them
+    back. After that items are only reused if something else kept them alive,
+    otherwise they are rebuilt with their original ids.
+    """
+
+    __slots__ = ("__data", "__held", "__nodes", "__connections")
+
+    def __init__(
+        self,
+        nodes: typing.Iterable[NodeItem] = (),
+        connections: typing.Iterable[ConnectionItem] = (),
+    ):
+        nodes = list(nodes)
+        connections = list(connections)
+
+        templates: typing.Dict[str, int] = {}
+        rows = []
+        for node in nodes:
+            key = json.dumps(node_template(node), separators=(",", ":"))
+            template = templates.setdefault(key, len(templates))
+            rows.append([node.nodeId(), template, node.x(), node.y()])
+
+        state = {
+            "templates": [json.loads(key) for key in templates],
+            "nodes": rows,
+            "edges": [connection_state(c) for c in connections],
+        }
+        self.__data = zlib.compress(json.dumps(state, separators=(",", ":")).encode())
+        self.__held = nodes + connections
+        self.__nodes = {n.nodeId(): weakref.ref(n) for n in nodes}
+        self.__connections = {c.connectionId(): weakref.ref(c) for c in connections}
+
+    def __len__(self):
+        return len(self.__nodes) + len(self.__connections)
+
+    def cost(self):
+        """
+        The size of the compressed state in bytes.
+        """
+        return len(self.__data)
+
+    def heldItems(self):
+        """
+        The number of removed items the snapshot keeps alive.
+        """
+        return len(self.__held)
+
+    def release(self):
+        """
+        Stop keeping the removed items alive.
+        """
+        self.__held = []
+
+    def state(self) -> dict:
+        return json.loads(zlib.decompress(self.__data))
+
+    def restoreNodes(self, state: dict) -> list[NodeItem]:
+        def ports(data):
+            return [
+                (port_name, datatype, QtGui.QColor.fromRgba(rgba))
+                for port_name, datatype, rgba in data
+            ]
+
+        templates = [
+            (name, category, ports(inputs), ports(outputs))
+            for name, category, inputs, outputs in state["templates"]
+        ]
+
+        nodes = []
+        for node_id, template, x, y in state["nodes"]:
+            ref = self.__nodes.get(node_id)
+            node = ref() if ref is not None else None
+            if node is None:
+                name, category, inputs, outputs = templates[template]
+                node = NodeItem(name, category)
+                for port_name, datatype, color in inputs:
+                    node.addInput(port_name, datatype).setColor(QtGui.QColor(color))
+                for port_name, datatype, color in outputs:
+                    node.addOutput(port_name, datatype).setColor(QtGui.QColor(color))
+                node.resolveLayout()
+                node.setNodeId(node_id)
+            node.setPos(x, y)
+            nodes.append(node)
+        return nodes
+
+    def restoreConnections(
+        self, state: dict, model: GraphModel
+    ) -> list[ConnectionItem]:
+        """
+        Rebuild the connections, the nodes at both ends must be in the model.
+        """
+        connections = []
+        for edge_id, output_node, output_name, input_node, input_name in state["edges"]:
+            output_port = model.nodeItem(output_node).outputPort(output_name)
+            input_port = model.nodeItem(input_node).inputPort(input_name)
+
+            ref = self.__connections.get(edge_id)
+            connection = ref() if ref is not None else None
+            if (
+                connection is None
+                or connection.outputPort() is not output_port
+                or connection.inputPort() is not input_port
+            ):
+                connection = ConnectionItem(output_port, input_port)
+                connection.setConnectionId(edge_id)
+            connections.append(connection)
+        return connections
+
+
+class GraphEditCommand(QtGui.QUndoCommand):
+    """
+    Base for commands which add nodes, connections or other items to the scene
+    and remove them again.
+
+    Given a model, the command only remembers the ids of its nodes and connections
+    while they are in the scene, and a GraphSnapshot of them while they are not,
+    so the undo history doesn't keep detached items alive. Without a model, or for
+    other items, the items themselves are kept.
+
+    registered should be True when the items are already in the scene and model.
+    """
+
     def __init__(
         self,
         scene: QtWidgets.QGraphicsScene,
-        instance: QtWidgets.QGraphicsItem,
+        items: typing.Iterable[QtWidgets.QGraphicsItem],
+        model: GraphModel = None,
+        registered: bool = False,
         parent=None,
     ):
         super().__init__(parent=parent)
         self.scene = scene
-        self.instance = instance
+        self.model = model
+        self.__nodes: list[NodeItem] = []
+        self.__connections: list[ConnectionItem] = []
+        self.__others: list[QtWidgets.QGraphicsItem] = []
+        self.__node_ids: list[int] | None = None
+        self.__edge_ids: list[int] | None = None
+        self.__snapshot: GraphSnapshot | None = None
+
+        for item in items:
+            if isinstance(item, NodeItem):
+                self.__nodes.append(item)
+            elif isinstance(item, ConnectionItem):
+                self.__connections.append(item)
+            else:
+                self.__others.append(item)
+
+        if registered:
+            self.__release()
+
+    def __release(self):
+        if self.model is None:
+            return
+
+        self.__node_ids = [n.nodeId() for n in self.__nodes]
+        self.__edge_ids = [c.connectionId() for c in self.__connections]
+        self.__nodes = []
+        self.__connections = []
+
+    def nodes(self) -> list[NodeItem]:
+        if self.__node_ids is None:
+            return list(self.__nodes)
+        return [self.model.nodeItem(i) for i in self.__node_ids]
+
+    def connections(self) -> list[ConnectionItem]:
+        if self.__edge_ids is None:
+            return list(self.__connections)
+        return [self.model.edgeItem(i) for i in self.__edge_ids]
+
+    def count(self):
+        if self.__node_ids is None:
+            nodes, connections = len(self.__nodes), len(self.__connections)
+        else:
+            nodes, connections = len(self.__node_ids), len(self.__edge_ids)
+        return nodes + connections + len(self.__others)
+
+    def cost(self):
+        return 0 if self.__snapshot is None else self.__snapshot.cost()
+
+    def heldItems(self):
+        return 0 if self.__snapshot is None else self.__snapshot.heldItems()
+
+    def release(self):
+        if self.__snapshot is not None:
+            self.__snapshot.release()
+
+    def evict(self):
+        """
+        Drop everything the command remembers, it can't be undone or redone after.
+        """
+        self.__snapshot = None
+        self.__nodes = []
+        self.__connections = []
+        self.__others = []
+        self.__node_ids = []
+        self.__edge_ids = []
+        self.setObsolete(True)
+
+    def insertItems(self):
+        snapshot = self.__snapshot
+        state = snapshot.state() if snapshot is not None else None
+
+        with suspended_index(self.scene, self.count()):
+            nodes = snapshot.restoreNodes(state) if snapshot else self.nodes()
+            for node in nodes:
+                self.scene.addItem(node)
+                add_item_to_model(self.model, node)
+
+            if snapshot is not None:
+                connections = snapshot.restoreConnections(state, self.model)
+            else:
+                connections = self.connections()
+            for connection in connections:
+                self.scene.addItem(connection)
+                connection.attach()
+                add_item_to_model(self.model, connection)
+
+            for item in self.__others:
+                self.scene.addItem(item)
+
+        self.__snapshot = None
+        if self.__node_ids is None:
+            self.__release()
 
+    def removeItems(self):
+        nodes = self.nodes()
+        connections = self.connections()
+        if self.model is not None:
+            self.__snapshot = GraphSnapshot(nodes, connections)
+
+        with suspended_index(self.scene, self.count()):
+            for item in reversed(self.__others):
+                self.scene.removeItem(item)
+
+            for connection in reversed(connections):
+                remove_item_from_model(self.model, connection)
+                connection.detache()
+                self.scene.removeItem(connection)
+
+            for node in reversed(nodes):
+                remove_item_from_model(self.model, node)
+                self.scene.removeItem(node)
+
+
+class AddItemToSceneCommand(GraphEditCommand):
+    def __init__(
+        self,
+        scene: QtWidgets.QGraphicsScene,
+        instance: QtWidgets.QGraphicsItem,
+        model: GraphModel = None,
+        parent=None,
+    ):
+        super().__init__(scene, [instance], model, parent=parent)
+
+    @probe
     def redo(self):
-        self.scene.addItem(self.instance)
+        self.insertItems()
 
+    @probe
     def undo(self):
-        self.scene.removeItem(self.instance)
+        self.removeItems()
 
 
-class RemoveItemFromSceneCommand(QtGui.QUndoCommand):
+class RemoveItemFromSceneCommand(GraphEditCommand):
     def __init__(
         self,
         scene: QtWidgets.QGraphicsScene,
         instance: QtWidgets.QGraphicsItem,
+        model: GraphModel = None,
         parent=None,
     ):
-        super().__init__(parent=parent)
-        self.scene = scene
-        self.instance = instance
+        super().__init__(scene, [instance], model, registered=True, parent=parent)
 
+    @probe
     def redo(self):
-        self.scene.removeItem(self.instance)
+        self.removeItems()
 
+    @probe
     def undo(self):
-        self.scene.addItem(self.instance)
+        self.insertItems()
 
 
 class MoveItemsCommand(QtGui.QUndoCommand):
@@ -56,25 +403,44 @@ class MoveItemsCommand(QtGui.QUndoCommand):
         items: list[QtWidgets.QGraphicsItem],
         delta: QtCore.QPointF,
         drag_id: typing.Hashable = None,
+        model: GraphModel = None,
         parent=None,
     ):
         super().__init__(parent=parent)
-        self.items = items
         self.drag_id = drag_id or uuid.uuid4().int
         self.delta = delta
+        self.model = model
+
+        # nodes are remembered by id, so the command still applies after they
+        # have been removed and rebuilt by other commands.
+        self.__items = []
+        self.__node_ids = []
+        for item in items:
+            if model is not None and isinstance(item, NodeItem):
+                self.__node_ids.append(item.nodeId())
+            else:
+                self.__items.append(item)
+
+    def items(self) -> list[QtWidgets.QGraphicsItem]:
+        nodes = [self.model.nodeItem(i) for i in self.__node_ids]
+        return nodes + self.__items
 
     def id(self):
         return CommandIDs.MoveCommand
 
+    @probe
     def redo(self):
         x, y = self.delta.toTuple()
-        for item in self.items:
-            item.moveBy(x, y)
+        with layout_queue.deferred():
+            for item in self.items():
+                item.moveBy(x, y)
 
+    @probe
     def undo(self):
         x, y = self.delta.toTuple()
-        for item in self.items:
-            item.moveBy(-x, -y)
+        with layout_queue.deferred():
+            for item in self.items():
+                item.moveBy(-x, -y)
 
     def mergeWith(self, other):
         if not isinstance(other, MoveItemsCommand):
@@ -91,47 +457,372 @@ class RemoveNodeCommand(QtGui.QUndoCommand):
         self,
         scene: QtWidgets.QGraphicsScene,
         node: NodeItem,
+        model: GraphModel = None,
         parent=None,
     ):
         super().__init__(parent=parent)
         self.scene = scene
-        self.node = node
+        self.model = model
         self.sub_commands = []
 
-        for port in node.iterInputs():
-            for connection in port.iterConnections():
-                self.sub_commands.append(RemoveConnectionCommand(scene, connection))
+        for connection in node_connections(model, node):
+            self.sub_commands.append(RemoveConnectionCommand(scene, connection, model))
 
-        for port in node.iterOutputs():
-            for connection in port.iterConnections():
-                self.sub_commands.append(RemoveConnectionCommand(scene, connection))
-
-        self.sub_commands.append(RemoveItemFromSceneCommand(scene, node))
+        self.sub_commands.append(RemoveItemFromSceneCommand(scene, node, model))
 
+    @probe
     def redo(self):
         for command in self.sub_commands:
             command.redo()
 
+    @probe
     def undo(self):
         for command in reversed(self.sub_commands):
             command.undo()
 
 
-class RemoveConnectionCommand(QtGui.QUndoCommand):
+class AddConnectionCommand(GraphEditCommand):
     def __init__(
         self,
         scene: QtWidgets.QGraphicsScene,
         connection: ConnectionItem,
+        model: GraphModel = None,
         parent=None,
     ):
-        super().__init__(parent=parent)
-        self.scene = scene
-        self.connection = connection
+        super().__init__(scene, [connection], model, parent=parent)
+
+    @probe
+    def redo(self):
+        self.insertItems()
+
+    @probe
+    def undo(self):
+        self.removeItems()
+
+
+class RemoveConnectionCommand(GraphEditCommand):
+    def __init__(
+        self,
+        scene: QtWidgets.QGraphicsScene,
+        connection: ConnectionItem,
+        model: GraphModel = None,
+        parent=None,
+    ):
+        super().__init__(scene, [connection], model, registered=True, parent=parent)
+
+    @probe
+    def redo(self):
+        self.removeItems()
+
+    @probe
+    def undo(self):
+        self.insertItems()
+
+
+class AddItemsCommand(GraphEditCommand):
+    """
+    Add many nodes and connections to the scene as a single undo step.
+    """
+
+    def __init__(
+        self,
+        scene: QtWidgets.QGraphicsScene,
+        nodes: typing.Iterable[NodeItem] = (),
+        connections: typing.Iterable[ConnectionItem] = (),
+        model: GraphModel = None,
+        parent=None,
+    ):
+        super().__init__(scene, [*nodes, *connections], model, parent=parent)
+
+    @probe
+    def redo(self):
+        self.insertItems()
+
+    @probe
+    def undo(self):
+        self.removeItems()
+
+
+class RemoveItemsCommand(GraphEditCommand):
+    """
+    Remove many nodes, and every connection attached to them, as a single undo step.
+    """
+
+    def __init__(
+        self,
+        scene: QtWidgets.QGraphicsScene,
+        nodes: typing.Iterable[NodeItem] = (),
+        connections: typing.Iterable[ConnectionItem] = (),
+        model: GraphModel = None,
+        parent=None,
+    ):
+        nodes = list(nodes)
+        connections = dict.fromkeys(connections)
+        for node in nodes:
+            connections.update(dict.fromkeys(node_connections(model, node)))
+
+        super().__init__(
+            scene, [*nodes, *connections], model, registered=True, parent=parent
+        )
 
+    @probe
     def redo(self):
-        self.connection.detache()
-        self.scene.removeItem(self.connection)
+        self.removeItems()
 
+    @probe
     def undo(self):
-        self.scene.addItem(self.connection)
-        self.connection.attach()
+        self.insertItems()
+
+
+def iter_commands(command: QtGui.QUndoCommand):
+    """
+    Yield command and all of its child commands, depth first.
+
+    Both Qt child commands and the sub_commands of composites like
+    RemoveNodeCommand are walked.
+    """
+    yield command
+    for i in range(command.childCount()):
+        yield from iter_commands(command.child(i))
+    for sub_command in getattr(command, "sub_commands", ()):
+        yield from iter_commands(sub_command)
+
+
+def command_cost(command: QtGui.QUndoCommand) -> int:
+    """
+    The number of bytes of compressed graph state an undo command and its
+    children hold.
+    """
+    return sum(
+        c.cost() for c in iter_commands(command) if isinstance(c, GraphEditCommand)
+    )
+
+
+def held_items(command: QtGui.QUndoCommand) -> int:
+    """
+    The number of removed items an undo command and its children keep alive.
+    """
+    return sum(
+        c.heldItems() for c in iter_commands(command) if isinstance(c, GraphEditCommand)
+    )
+
+
+def evict_command(command: QtGui.QUndoCommand):
+    """
+    Drop the state of a command and its children and mark it obsolete, the stack
+    discards obsolete commands instead of undoing them.
+    """
+    for c in iter_commands(command):
+        if isinstance(c, GraphEditCommand):
+            c.evict()
+    command.setObsolete(True)
+
+
+def _noop():
+    pass
+
+
+class UndoHistory:
+    """
+    Keeps a QUndoStack's history within a command limit, a byte budget and a
+    bound on the removed items it holds.
+
+    The cost and held items of each command are measured when the stack's index
+    moves across it and kept with running totals, so a push only looks at the new
+    command and the commands it evicts. sync() must be called after the stack
+    changes, before trim() or cost().
+    """
+
+    # evicted commands are only deleted from the stack once there are at least
+    # this many, and as many as there are live commands.
+    MIN_COMPACT = 64
+
+    def __init__(self, stack: QtGui.QUndoStack):
+        self.stack = stack
+        self.__commands: list[QtGui.QUndoCommand] = []
+        self.__costs: list[int] = []
+        self.__held: list[int] = []
+        self.__cost = 0
+        self.__held_total = 0
+        self.__index = 0
+        # commands below __live are evicted, those below __released hold no items.
+        self.__live = 0
+        self.__released = 0
+        self.sync()
+
+    def cost(self) -> int:
+        """
+        The number of bytes of compressed graph state the history holds.
+        """
+        return self.__cost
+
+    def heldItems(self) -> int:
+        return self.__held_total
+
+    def evicted(self) -> int:
+        """
+        The number of evicted commands still at the bottom of the stack.
+        """
+        return self.__live
+
+    def sync(self):
+        """
+        Measure the commands the stack changed since the last sync.
+        """
+        stack = self.stack
+        count = stack.count()
+        index = stack.index()
+
+        # the stack deletes commands from the bottom when its own undo limit is
+        # exceeded, and all of them when cleared.
+        dropped = 0
+        while dropped < len(self.__commands) and (
+            dropped >= count or self.__commands[dropped] is not stack.command(0)
+        ):
+            dropped += 1
+        if dropped:
+            self.__truncate(0, dropped)
+            del self.__commands[:dropped], self.__costs[:dropped]
+            del self.__held[:dropped]
+            self.__index = max(0, self.__index - dropped)
+            self.__live = max(0, self.__live - dropped)
+            self.__released = max(0, self.__released - dropped)
+
+        start = min(self.__index, index)
+        if count != len(self.__commands):
+            # pushing discards the undone commands, and undo deletes obsolete
+            # commands, both change everything from start up.
+            end = count
+            self.__truncate(start, len(self.__commands))
+        else:
+            # merged commands and finished macros leave the index unchanged.
+            if start == index == self.__index:
+                start = max(0, index - 1)
+            end = max(self.__index, index, start + 1 if count else 0)
+            self.__truncate(start, end)
+
+        for i in range(start, end):
+            command = stack.command(i)
+            cost = command_cost(command)
+            held = held_items(command)
+            if i < len(self.__commands):
+                self.__commands[i] = command
+                self.__costs[i] = cost
+                self.__held[i] = held
+            else:
+                self.__commands.append(command)
+                self.__costs.append(cost)
+                self.__held.append(held)
+            self.__cost += cost
+            self.__held_total += held
+
+        self.__index = index
+        self.__released = min(self.__released, start)
+        self.__live = min(self.__live, start)
+        while (
+            self.__live < len(self.__commands)
+            and self.__commands[self.__live].isObsolete()
+        ):
+            self.__live += 1
+
+    def trim(self, budget: int = 0, limit: int = 0, max_held_items: int = 0) -> int:
+        """
+        Bound what the history keeps, returns the resulting cost in bytes.
+
+        Items held by the oldest commands are released until at most
+        max_held_items remain. Then the oldest commands which have been done are
+        evicted until at most limit commands are left and their cost fits in
+        budget bytes. Zero disables a bound.
+        """
+        stack = self.stack
+        if stack.index() and not stack.canUndo():
+            # a macro is being recorded
+            return self.__cost
+
+        if max_held_items:
+            while (
+                self.__held_total > max_held_items
+                and self.__released < len(self.__commands)
+            ):
+                i = self.__released
+                if self.__held[i]:
+                    for c in iter_commands(self.__commands[i]):
+                        if isinstance(c, GraphEditCommand):
+                            c.release()
+                    self.__held_total -= self.__held[i]
+                    self.__held[i] = 0
+                self.__released += 1
+
+        index = stack.index()
+        while self.__live < index:
+            over_limit = limit and len(self.__commands) - self.__live > limit
+            over_budget = budget and self.__cost > budget
+            if not over_limit and not over_budget:
+                break
+            i = self.__live
+            evict_command(self.__commands[i])
+            self.__cost -= self.__costs[i]
+            self.__held_total -= self.__held[i]
+            self.__costs[i] = self.__held[i] = 0
+            self.__live += 1
+
+        if self.__live >= max(self.MIN_COMPACT, len(self.__commands) - self.__live):
+            self.compact()
+        return self.__cost
+
+    def compact(self):
+        """
+        Delete the evicted commands from the bottom of the stack.
+
+        QUndoStack only deletes an obsolete command when undo or redo reaches
+        it, so the stack is walked down to the bottom and back up with the undo
+        and redo of the live commands in between suspended.
+        """
+        stack = self.stack
+        evicted = self.__live
+        index = stack.index()
+        if not evicted or (index and not stack.canUndo()):
+            return
+
+        clean = stack.cleanIndex() - evicted
+        top = max(index, clean)
+        suspended = [
+            c
+            for command in self.__commands[evicted:top]
+            for c in iter_commands(command)
+        ]
+        # the stack calls overrides set on the instance, like the ones the
+        # instrumentation installs, which are restored afterwards.
+        saved = [
+            {a: vars(c)[a] for a in ("redo", "undo") if a in vars(c)}
+            for c in suspended
+        ]
+        for c in suspended:
+            c.redo = c.undo = _noop
+        try:
+            for _ in range(index):
+                stack.undo()
+            for _ in range(top - evicted):
+                if stack.index() == clean:
+                    stack.setClean()
+                stack.redo()
+            if stack.index() == clean:
+                stack.setClean()
+            for _ in range(top - index):
+                stack.undo()
+        finally:
+            for c, attributes in zip(suspended, saved):
+                del c.redo, c.undo
+                for name, value in attributes.items():
+                    setattr(c, name, value)
+
+        del self.__commands[:evicted], self.__costs[:evicted], self.__held[:evicted]
+        self.__index = stack.index()
+        self.__live = 0
+        self.__released = max(0, self.__released - evicted)
+
+    def __truncate(self, start: int, end: int):
+        self.__cost -= sum(self.__costs[start:end])
+        self.__held_total -= sum(self.__held[start:end])
+        if end >= len(self.__commands):
+            del self.__commands[start:], self.__costs[start:], self.__held[start:]
@@ -1,8 +1,14 @@
-__all__ = ["LineItem", "ConnectionItem"]
+__all__ = ["LineItem", "ConnectionItem", "LayoutQueue", "layout_queue"]
 
+import contextlib
 import typing
 
 from qtpy import QtWidgets, QtGui, QtCore
+from shiboken6 import Shiboken
+
+from QtNodes.instrumentation import probe
+from QtNodes.items import DetailLevel, detail_level
+from QtNodes.spatial import scene_index
 
 if typing.TYPE_CHECKING:
     from QtNodes.port import PortItem, OutputPort, InputPort
@@ -16,12 +22,73 @@ class LineItem(QtWidgets.QGraphicsLineItem):
         self.setPen(pen)
 
 
+class LayoutQueue:
+    """
+    Coalesces connection layouts to at most one per connection per frame.
+
+    Scheduled connections are laid out from a zero interval timer, so however
+    many times the nodes at their ends move before the event loop gets to paint,
+    each is laid out once. Inside a deferred block they are laid out when the
+    outermost block exits instead, for callers like the undo commands which want
+    the result straight away. flush lays out anything pending immediately.
+    """
+
+    def __init__(self):
+        self.__depth = 0
+        self.__dirty: typing.Dict["ConnectionItem", None] = {}
+        self.__timer: QtCore.QTimer | None = None
+
+    @contextlib.contextmanager
+    def deferred(self):
+        self.__depth += 1
+        try:
+            yield
+        finally:
+            self.__depth -= 1
+            if self.__depth == 0:
+                self.flush()
+
+    def schedule(self, connection: "ConnectionItem"):
+        self.__dirty[connection] = None
+        if self.__depth:
+            return
+
+        if self.__timer is None:
+            # without an event loop there are no frames to wait for
+            if QtCore.QCoreApplication.instance() is None:
+                self.flush()
+                return
+            self.__timer = QtCore.QTimer()
+            self.__timer.setSingleShot(True)
+            self.__timer.setInterval(0)
+            self.__timer.timeout.connect(self.flush)
+        if not self.__timer.isActive():
+            self.__timer.start()
+
+    def isPending(self):
+        return bool(self.__dirty)
+
+    def flush(self):
+        if self.__timer is not None:
+            self.__timer.stop()
+        dirty = self.__dirty
+        self.__dirty = {}
+        for connection in dirty:
+            # the scene may have been deleted along with its items since
+            if Shiboken.isValid(connection):
+                connection.layout()
+
+
+layout_queue = LayoutQueue()
+
+
 class ConnectionItem(LineItem):
     def __init__(self, output_port: "OutputPort", input_port: "InputPort", parent=None):
         super().__init__(parent=parent)
         self.setAcceptHoverEvents(True)
         self.__output_port = output_port
         self.__input_port = input_port
+        self.__connection_id: int | None = None
 
         pen = QtGui.QPen(input_port.color().darker(125), 8)
         pen.setCapStyle(QtCore.Qt.PenCapStyle.RoundCap)
@@ -38,6 +105,15 @@ class ConnectionItem(LineItem):
         self.__output_port.removeConnection(self)
         self.__input_port.removeConnection(self)
 
+    def itemChange(self, change, value):
+        if change == self.GraphicsItemChange.ItemSceneChange:
+            if self.scene() is not None:
+                scene_index(self.scene()).removeConnection(self)
+        elif change == self.GraphicsItemChange.ItemSceneHasChanged:
+            if value is not None:
+                scene_index(value).updateConnection(self)
+        return super().itemChange(change, value)
+
     def hoverEnterEvent(self, event):
         self.setCursor(QtCore.Qt.CursorShape.ClosedHandCursor)
         super().hoverEnterEvent(event)
@@ -46,15 +122,31 @@ class ConnectionItem(LineItem):
         self.setCursor(QtCore.Qt.CursorShape.LastCursor)
         super().hoverLeaveEvent(event)
 
+    def connectionId(self):
+        return self.__connection_id
+
+    def setConnectionId(self, connection_id: int | None):
+        self.__connection_id = connection_id
+
     def outputPort(self):
         return self.__output_port
 
     def inputPort(self):
         return self.__input_port
 
+    @probe
+    def paint(self, painter, option, widget=...):
+        if detail_level(painter, option, widget) == DetailLevel.Shapes:
+            painter.setPen(QtGui.QPen(self.pen().color(), 0))
+            painter.drawLine(self.line())
+            return
+
+        super().paint(painter, option, widget)
+
+    @probe
     def layout(self):
-        self.setLine(
-            *self.__output_port.sceneBoundingRect().center().toTuple(),
-            *self.__input_port.sceneBoundingRect().center().toTuple(),
-        )
-        self.update()
+        line = QtCore.QLineF(self.__output_port.anchor(), self.__input_port.anchor())
+        if line != self.line():
+            self.setLine(line)
+            if self.scene() is not None:
+                scene_index(self.scene()).updateConnection(self)
@@ -1,3 +1,4 @@
+import asyncio
 import typing
 
 from qtpy import QtWidgets, QtCore, QtGui
@@ -5,68 +6,347 @@ from qtpy import QtWidgets, QtCore, QtGui
 from QtNodes.node import NodeItem
 from QtNodes.connection import ConnectionItem
 from QtNodes.port import PortItem, InputPort, OutputPort
-from QtNodes.scene_events import ConnectionEventFilter, NodeEventFilter
+from QtNodes.scene_events import (
+    ConnectionInteraction,
+    HitKind,
+    NodeInteraction,
+    SceneEventRouter,
+)
 from QtNodes.factory import NodeFactory
+from QtNodes.model import GraphModel, NodeRecord, EdgeRecord
+from QtNodes.loader import GraphLoader
+from QtNodes import serialization
+from QtNodes.evaluation import IncrementalEvaluator, AsyncEvaluator
+from QtNodes.virtual import SceneVirtualizer
 from QtNodes import commands
 
 
 class NodeGraphController(QtCore.QObject):
+    evaluationStarted = QtCore.Signal(int)
+    evaluationProgress = QtCore.Signal(int, int)
+    nodeEvaluated = QtCore.Signal(int, object)
+    nodeCancelled = QtCore.Signal(int)
+    evaluationFinished = QtCore.Signal(object)
+    evaluationFailed = QtCore.Signal(str)
+
     def __init__(
         self,
         scene: QtWidgets.QGraphicsScene = None,
         undo_stack: QtGui.QUndoStack = None,
         factory: "NodeFactory" = None,
+        model: GraphModel = None,
+        undo_limit: int = 0,
+        undo_budget: int = 64 * 1024 * 1024,
+        undo_held_items: int = 10000,
         parent=None,
     ):
         super().__init__(parent=parent)
-        self.undo_stack = undo_stack or QtGui.QUndoStack()
+        self.undo_stack = undo_stack or QtGui.QUndoStack(self)
+        # bounds on the undo history, see commands.UndoHistory.
+        self.undo_limit = 0
+        self.undo_budget = undo_budget
+        self.undo_held_items = undo_held_items
+        self.undo_history = commands.UndoHistory(self.undo_stack)
+        self.__undo_index = self.undo_stack.index()
+        self.__undo_count = self.undo_stack.count()
+        self.__trimming = False
+        self.undo_stack.indexChanged.connect(self.__undoIndexChanged)
+        self.setUndoLimit(undo_limit)
         self.scene = scene or QtWidgets.QGraphicsScene()
         self.factory = factory or NodeFactory()
+        self.model = model or GraphModel()
+        self.evaluator = IncrementalEvaluator(self.model, self.factory)
+        self.async_evaluator = AsyncEvaluator(self.evaluator)
         self.scene.setSceneRect(-100000, -100000, 200000, 200000)
 
-        self.connection_event_filter = ConnectionEventFilter()
-        self.node_event_filter = NodeEventFilter()
+        self.event_router = SceneEventRouter(parent=self)
+        self.connection_interaction = ConnectionInteraction(parent=self)
+        self.node_interaction = NodeInteraction(parent=self)
 
-        self.scene.installEventFilter(self.connection_event_filter)
-        self.scene.installEventFilter(self.node_event_filter)
+        self.event_router.register(HitKind.Port, self.connection_interaction)
+        self.event_router.register(HitKind.Connection, self.connection_interaction)
+        self.event_router.register(HitKind.Node, self.node_interaction)
+        self.scene.installEventFilter(self.event_router)
 
-        self.connection_event_filter.requestCreateConnection.connect(
+        self.connection_interaction.requestCreateConnection.connect(
             self.createConnection
         )
-        self.connection_event_filter.requestRemoveConnection.connect(
+        self.connection_interaction.requestRemoveConnection.connect(
             self.removeConnection
         )
 
-        self.node_event_filter.requestCloneNodes.connect(self.cloneNodes)
-        self.node_event_filter.requestMoveNodes.connect(self.moveNodes)
+        self.node_interaction.requestCloneNodes.connect(self.cloneNodes)
+        self.node_interaction.requestMoveNodes.connect(self.moveNodes)
+
+        self.virtualizer = SceneVirtualizer(self, parent=self)
+        # the GraphLoader of the last incremental load
+        self.__loader: GraphLoader | None = None
+
+    def isVirtualized(self):
+        return self.virtualizer.isEnabled()
+
+    def setVirtualized(self, enabled: bool):
+        """
+        Only keep scene items for the nodes near what the scene's views show, the
+        rest are created when scrolled into view or looked up. Disabling creates
+        items for every node again.
+        """
+        self.virtualizer.setEnabled(enabled)
+
+    def setUndoLimit(self, limit: int):
+        """
+        Keep at most limit commands in the undo history, zero for no limit.
+        """
+        self.undo_limit = limit
+        # the stack only deletes old commands itself when its limit is set while
+        # it's empty, otherwise they are evicted by trimUndoHistory.
+        if self.undo_stack.count() == 0:
+            self.undo_stack.setUndoLimit(limit)
+        self.trimUndoHistory()
+
+    def trimUndoHistory(self):
+        """
+        Apply the undo limit, budget and held items bound to the history, this
+        happens automatically whenever a command is pushed.
+        """
+        self.undo_history.sync()
+        self.undo_history.trim(self.undo_budget, self.undo_limit, self.undo_held_items)
+
+    def undoCost(self):
+        """
+        The number of bytes of compressed graph state held by the undo history.
+        """
+        self.undo_history.sync()
+        return self.undo_history.cost()
+
+    def __undoIndexChanged(self, index: int):
+        if self.__trimming:
+            return
+
+        stack = self.undo_stack
+        self.__trimming = True
+        try:
+            if index < self.__undo_index:
+                # evicted commands are discarded by the stack without doing
+                # anything, skip them so undo doesn't appear to do nothing.
+                while stack.index() and stack.command(stack.index() - 1).isObsolete():
+                    stack.undo()
+                self.undo_history.sync()
+            elif stack.count() != self.__undo_count:
+                self.trimUndoHistory()
+            else:
+                self.undo_history.sync()
+        finally:
+            self.__trimming = False
+        self.__undo_index = stack.index()
+        self.__undo_count = stack.count()
 
     def createNode(self, type_name: str):
         node = self.factory.createNode(type_name)
-        command = commands.AddItemToSceneCommand(self.scene, node)
+        command = commands.AddItemToSceneCommand(self.scene, node, self.model)
         command.setText(f"Add: {node.name()}")
         self.undo_stack.push(command)
+        return node
+
+    def createNodes(
+        self,
+        specs: typing.Iterable[tuple[str, QtCore.QPointF]],
+    ) -> list[NodeItem]:
+        """
+        Create a node for each (type_name, position) pair as a single undo step,
+        nothing is pushed if there are none.
+        """
+        nodes = []
+        for type_name, pos in specs:
+            node = self.factory.createNode(type_name)
+            node.setPos(pos)
+            nodes.append(node)
+        if not nodes:
+            return nodes
+
+        command = commands.AddItemsCommand(self.scene, nodes, model=self.model)
+        command.setText(f"Add: {len(nodes)} nodes")
+        self.undo_stack.push(command)
+        return nodes
 
     def removeNode(self, node: NodeItem):
-        command = commands.RemoveNodeCommand(self.scene, node)
+        command = commands.RemoveNodeCommand(self.scene, node, self.model)
         command.setText(f"Remove: {node.name()}")
         self.undo_stack.push(command)
 
     def removeNodes(self, nodes: typing.Iterable[NodeItem]):
-        self.undo_stack.beginMacro("delete nodes")
-        for node in nodes:
-            self.removeNode(node)
-        self.undo_stack.endMacro()
+        command = commands.RemoveItemsCommand(self.scene, nodes, model=self.model)
+        command.setText("delete nodes")
+        self.undo_stack.push(command)
+
+    def populateScene(self):
+        """
+        Create scene items for any model records which don't have one yet.
+
+        This is used to display a graph which was built or loaded headless, it is
+        not recorded on the undo stack. When virtualized only the visible records
+        get items.
+        """
+        if self.isVirtualized():
+            self.virtualizer.update()
+            return
+
+        nodes = [r for r in self.model.nodes() if r.item is None]
+        edges = [r for r in self.model.edges() if r.item is None]
+
+        with commands.suspended_index(self.scene, len(nodes) + len(edges)):
+            for record in nodes:
+                self.materializeNode(record)
+
+            for record in edges:
+                self.materializeConnection(record)
+
+    def materializeNode(self, record: NodeRecord) -> NodeItem:
+        """
+        Create and add the scene item for a node record.
+        """
+        record.item = self.factory.createNodeFromRecord(record)
+        record.item.setModel(self.model)
+        self.scene.addItem(record.item)
+        return record.item
+
+    def materializeConnection(self, record: EdgeRecord) -> ConnectionItem:
+        """
+        Create and add the scene item for an edge record, both nodes must already
+        have scene items.
+        """
+        output_node = self.model.node(record.output_node).item
+        input_node = self.model.node(record.input_node).item
+        record.item = ConnectionItem(
+            output_node.outputPort(record.output_port),
+            input_node.inputPort(record.input_port),
+        )
+        record.item.setConnectionId(record.id)
+        self.scene.addItem(record.item)
+        return record.item
+
+    def clear(self):
+        """
+        Remove every node and connection and clear the undo history, an
+        incremental load in progress is cancelled.
+        """
+        if self.__loader is not None:
+            self.__loader.cancel()
+            self.__loader = None
+        self.undo_stack.clear()
+        items = [r.item for r in self.model.edges()]
+        items += [r.item for r in self.model.nodes()]
+        with commands.suspended_index(self.scene, len(items)):
+            for item in items:
+                if item is not None and item.scene() is self.scene:
+                    self.scene.removeItem(item)
+        self.model.clear()
+
+    def saveGraph(self, path: str, binary: bool = False):
+        serialization.save(self.model, path, binary)
+
+    def loadGraph(self, path: str):
+        """
+        Replace the current graph with one loaded from path.
+        """
+        self.clear()
+        serialization.load(path, self.model)
+        self.populateScene()
+
+    def loadGraphIncrementally(self, path: str, chunk_size: int = 200):
+        """
+        Replace the current graph with one loaded from path, the scene is filled
+        in chunks from the event loop so the view stays responsive.
+
+        A load which is still running is cancelled first.
+        """
+        self.clear()
+        self.__loader = GraphLoader(self, path, chunk_size, parent=self)
+        self.__loader.start()
+        return self.__loader
+
+    def __items(self, records: typing.Iterable[NodeRecord | EdgeRecord]):
+        return [record.item for record in records if record.item is not None]
 
     def nodes(self):
-        return [n for n in self.scene.items() if isinstance(n, NodeItem)]
+        """
+        The node items, with a virtualized scene only the nodes which currently
+        have items are returned. Use the model's records, or node() which creates
+        the item, to reach the others.
+        """
+        return self.__items(self.model.nodes())
+
+    def node(self, node_id: int) -> NodeItem | None:
+        if not self.model.hasNode(node_id):
+            return None
+        return self.model.nodeItem(node_id)
+
+    def nodesOfType(self, type_name: str):
+        """
+        The node items of a type, like nodes() only those which have items.
+        """
+        return self.__items(self.model.nodesOfType(type_name))
+
+    def nodesInCategory(self, category: str):
+        """
+        The node items in a category, like nodes() only those which have items.
+        """
+        return self.__items(self.model.nodesInCategory(category))
 
     def selectedNodes(self):
-        return [n for n in self.scene.selectedItems() if isinstance(n, NodeItem)]
+        return [
+            n
+            for n in self.scene.selectedItems()
+            if isinstance(n, NodeItem) and self.node(n.nodeId()) is n
+        ]
+
+    def connections(self):
+        """
+        The connection items, like nodes() only those which currently have items.
+        """
+        return self.__items(self.model.edges())
+
+    def connection(self, connection_id: int) -> ConnectionItem | None:
+        if not self.model.hasEdge(connection_id):
+            return None
+        return self.model.edgeItem(connection_id)
 
     def createConnection(self, port_a: "PortItem", port_b: "PortItem"):
-        if not port_a.canConnectTo(port_b):
+        connection = self.__makeConnection(port_a, port_b)
+        if connection is None:
             return
 
+        cmd = commands.AddConnectionCommand(self.scene, connection, self.model)
+        self.undo_stack.push(cmd)
+        return connection
+
+    def createConnections(
+        self,
+        pairs: typing.Iterable[tuple["PortItem", "PortItem"]],
+    ) -> list[ConnectionItem]:
+        """
+        Connect each pair of ports as a single undo step, invalid pairs are skipped
+        and nothing is pushed if no pair is valid.
+        """
+        connections = []
+        for port_a, port_b in pairs:
+            connection = self.__makeConnection(port_a, port_b)
+            if connection is not None:
+                connections.append(connection)
+        if not connections:
+            return connections
+
+        cmd = commands.AddItemsCommand(
+            self.scene, connections=connections, model=self.model
+        )
+        cmd.setText(f"Connect: {len(connections)} ports")
+        self.undo_stack.push(cmd)
+        return connections
+
+    def __makeConnection(self, port_a: "PortItem", port_b: "PortItem"):
+        if not port_a.canConnectTo(port_b):
+            return None
+
         if isinstance(port_a, InputPort) and isinstance(port_b, OutputPort):
             input_port = port_a
             output_port = port_b
@@ -74,13 +354,10 @@ class NodeGraphController(QtCore.QObject):
             input_port = port_b
             output_port = port_a
 
-        connection = ConnectionItem(output_port, input_port)
-        cmd = commands.AddItemToSceneCommand(self.scene, connection)
-        self.undo_stack.push(cmd)
-        return connection
+        return ConnectionItem(output_port, input_port)
 
     def removeConnection(self, connection):
-        cmd = commands.RemoveConnectionCommand(self.scene, connection)
+        cmd = commands.RemoveConnectionCommand(self.scene, connection, self.model)
         self.undo_stack.push(cmd)
 
     def cloneNodes(
@@ -88,38 +365,32 @@ class NodeGraphController(QtCore.QObject):
         nodes: list[NodeItem],
         positions: list[QtCore.QPointF],
     ):
-        self.undo_stack.beginMacro("clone nodes")
-
         old_to_new_inputs: dict[InputPort, InputPort] = {}
-        old_to_new_outputs: dict[InputPort, InputPort] = {}
-        new_connections = []
+        new_nodes = []
+        pending = []
         for node, pos in zip(nodes, positions):
+            # clones have their layout resolved on creation, so port positions are
+            # valid as soon as the node is placed.
             new_node = node.clone()
             new_node.setPos(pos)
-
-            cmd = commands.AddItemToSceneCommand(self.scene, new_node)
-            self.undo_stack.push(cmd)
+            new_nodes.append(new_node)
 
             for old, new in zip(node.iterInputs(), new_node.iterInputs()):
                 old_to_new_inputs[old] = new
 
             for old, new in zip(node.iterOutputs(), new_node.iterOutputs()):
-                old_to_new_outputs[old] = new
-
-        # NOTE: port positions won't be correct unless an update is run. without this
-        #       connection start/end points may have offsets.
-        QtCore.QCoreApplication.processEvents()
-
-        for old_output, new_output in old_to_new_outputs.items():
-            for connection in old_output.connections():
+                for connection in old.iterConnections():
+                    pending.append((new, connection.inputPort()))
 
-                new_input = old_to_new_inputs.get(connection.inputPort())
-                if not new_input:
-                    continue
+        connections = []
+        for new_output, old_input in pending:
+            new_input = old_to_new_inputs.get(old_input)
+            if new_input is not None:
+                connections.append(ConnectionItem(new_output, new_input))
 
-                new_connections.append(self.createConnection(new_output, new_input))
-
-        self.undo_stack.endMacro()
+        cmd = commands.AddItemsCommand(self.scene, new_nodes, connections, self.model)
+        cmd.setText("clone nodes")
+        self.undo_stack.push(cmd)
 
     def moveNodes(
         self,
@@ -127,9 +398,46 @@ class NodeGraphController(QtCore.QObject):
         delta: QtCore.QPointF,
         drag_id: str,
     ):
-        command = commands.MoveItemsCommand(nodes, delta, drag_id)
+        command = commands.MoveItemsCommand(nodes, delta, drag_id, self.model)
         self.undo_stack.push(command)
 
+    def evaluateAsync(self, node_ids: typing.Iterable[int] | None = None):
+        """
+        Evaluate nodes on the running asyncio loop, which must be integrated with
+        the Qt event loop (e.g. via PySide6.QtAsyncio), so the view keeps painting.
+        Progress and results are reported through the evaluation signals.
+        """
+        if node_ids is None:
+            node_ids = [r.id for r in self.model.nodes()]
+        node_ids = list(node_ids)
+        total = len(self.evaluator.dependencies(node_ids))
+        done = 0
+
+        def nodeFinished(node_id: int, outputs: dict | None):
+            nonlocal done
+            done += 1
+            if outputs is None:
+                self.nodeCancelled.emit(node_id)
+            else:
+                self.nodeEvaluated.emit(node_id, outputs)
+            self.evaluationProgress.emit(done, total)
+
+        def evaluationDone(future: asyncio.Future):
+            if future.cancelled():
+                self.evaluationFailed.emit("evaluation cancelled")
+            elif future.exception() is not None:
+                self.evaluationFailed.emit(str(future.exception()))
+            else:
+                self.evaluationFinished.emit(future.result())
+
+        self.evaluationStarted.emit(total)
+        future = self.async_evaluator.start(node_ids, nodeFinished)
+        future.add_done_callback(evaluationDone)
+        return future
+
+    def cancelEvaluation(self, node_id: int | None = None):
+        self.async_evaluator.cancel(node_id)
+
     def createDeleteSelectedAction(self):
         action = QtGui.QAction("delete selected")
         action.setShortcut("Delete")
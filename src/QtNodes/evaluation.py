@@ -0,0 +1,728 @@
+"""
+Pull based evaluation of a GraphModel.
+
+Every node type which takes part in evaluation has a compute callable registered
+with the NodeFactory. It is called with the node's input values as keyword
+arguments and returns a dict of output values keyed by port name, node types
+with a single output may return the value itself.
+
+An input takes its value from the output connected to it. Unconnected inputs use
+a value set with Evaluator.setInputValue, or None.
+"""
+
+__all__ = [
+    "ComputeError",
+    "Evaluator",
+    "ParallelEvaluator",
+    "IncrementalEvaluator",
+    "AsyncEvaluator",
+    "BatchEvaluator",
+    "ResultCache",
+    "call_compute",
+    "normalize_outputs",
+]
+
+import asyncio
+import collections
+import concurrent.futures
+import hashlib
+import inspect
+import itertools
+import os
+import sys
+import time
+import typing
+
+from QtNodes.model import GraphModel, GraphEvent, NodeRecord, PortKey
+
+if typing.TYPE_CHECKING:
+    from QtNodes.factory import NodeFactory
+
+
+class ComputeError(Exception):
+    def __init__(self, node_id: int, message: str):
+        super().__init__(f"node {node_id}: {message}")
+        self.node_id = node_id
+
+
+def call_compute(
+    compute: typing.Callable,
+    record: NodeRecord,
+    inputs: typing.Dict[str, typing.Any],
+) -> typing.Dict[str, typing.Any]:
+    """
+    Call a compute callable and normalise its result to a dict of outputs.
+    """
+    return normalize_outputs(record, compute(**inputs))
+
+
+def normalize_outputs(record: NodeRecord, result: typing.Any):
+    if len(record.outputs) == 1:
+        (name,) = record.outputs
+        return {name: result}
+
+    if not isinstance(result, dict):
+        raise ComputeError(
+            record.id, f"{record.type_name} must return a dict of output values"
+        )
+    return result
+
+
+class Evaluator:
+    def __init__(self, model: GraphModel, factory: "NodeFactory"):
+        self.model = model
+        self.factory = factory
+        self.__input_values: typing.Dict[PortKey, typing.Any] = {}
+
+    def setInputValue(self, node_id: int, port_name: str, value: typing.Any):
+        self.__input_values[PortKey(node_id, port_name, True)] = value
+
+    def inputValue(self, node_id: int, port_name: str):
+        return self.__input_values.get(PortKey(node_id, port_name, True))
+
+    def clearInputValues(self):
+        self.__input_values.clear()
+
+    def computeFunction(self, record: NodeRecord) -> typing.Callable:
+        compute = self.factory.computeFunction(record.type_name)
+        if compute is None:
+            raise ComputeError(record.id, f"{record.type_name} has no compute callable")
+        return compute
+
+    def dependencies(self, node_ids: typing.Iterable[int]) -> typing.Set[int]:
+        """
+        The given nodes together with every node upstream of them.
+        """
+        pending = list(node_ids)
+        found = set(pending)
+        while pending:
+            for upstream in self.model.upstream(pending.pop()):
+                if upstream not in found:
+                    found.add(upstream)
+                    pending.append(upstream)
+        return found
+
+    def schedule(self, node_ids: typing.Iterable[int]) -> typing.List[int]:
+        """
+        The nodes needed to compute the given nodes, in the order to compute them.
+        """
+        return self.model.topologicalOrder(self.dependencies(node_ids))
+
+    def gatherInputs(
+        self,
+        record: NodeRecord,
+        results: typing.Dict[int, typing.Dict[str, typing.Any]],
+    ) -> typing.Dict[str, typing.Any]:
+        inputs = {}
+        for name in record.inputs:
+            key = record.inputKey(name)
+            edges = self.model.portEdges(key)
+            if edges:
+                edge = edges[0]
+                inputs[name] = results[edge.output_node].get(edge.output_port)
+            else:
+                inputs[name] = self.__input_values.get(key)
+        return inputs
+
+    def computeNode(
+        self,
+        node_id: int,
+        results: typing.Dict[int, typing.Dict[str, typing.Any]],
+    ) -> typing.Dict[str, typing.Any]:
+        record = self.model.node(node_id)
+        compute = self.computeFunction(record)
+        return call_compute(compute, record, self.gatherInputs(record, results))
+
+    def evaluate(
+        self,
+        node_ids: typing.Iterable[int] | None = None,
+    ) -> typing.Dict[int, typing.Dict[str, typing.Any]]:
+        """
+        Compute the outputs of the given nodes, or of every node if none are
+        given. Only the nodes they depend on are computed. Returns the outputs of
+        every computed node keyed by node id.
+        """
+        if node_ids is None:
+            node_ids = [r.id for r in self.model.nodes()]
+
+        results = {}
+        for node_id in self.schedule(node_ids):
+            results[node_id] = self.computeNode(node_id, results)
+        return results
+
+    def evaluateOutput(self, node_id: int, port_name: str):
+        return self.evaluate([node_id])[node_id][port_name]
+
+
+def timed_call(compute: typing.Callable, inputs: typing.Dict[str, typing.Any]):
+    """
+    Run a compute callable and time it, this runs inside the worker.
+    """
+    start = time.perf_counter()
+    result = compute(**inputs)
+    return result, time.perf_counter() - start
+
+
+class ParallelEvaluator(Evaluator):
+    """
+    Evaluate independent branches of the graph concurrently.
+
+    Nodes whose type's executor is "process" run on a process pool, so their
+    compute callable, inputs and outputs must be picklable. Everything else runs
+    on a thread pool. At most max_concurrency nodes are in flight at once and
+    the compute time of every node from the last run is kept in timings.
+    """
+
+    def __init__(
+        self,
+        model: GraphModel,
+        factory: "NodeFactory",
+        max_concurrency: int | None = None,
+    ):
+        super().__init__(model, factory)
+        self.max_concurrency = max_concurrency or os.cpu_count() or 1
+        self.timings: typing.Dict[int, float] = {}
+        self.__thread_pool: concurrent.futures.ThreadPoolExecutor | None = None
+        self.__process_pool: concurrent.futures.ProcessPoolExecutor | None = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+
+    def shutdown(self):
+        for pool in (self.__thread_pool, self.__process_pool):
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+        self.__thread_pool = None
+        self.__process_pool = None
+
+    def pool(self, kind: str) -> concurrent.futures.Executor:
+        if kind == "process":
+            if self.__process_pool is None:
+                self.__process_pool = concurrent.futures.ProcessPoolExecutor(
+                    self.max_concurrency
+                )
+            return self.__process_pool
+
+        if self.__thread_pool is None:
+            self.__thread_pool = concurrent.futures.ThreadPoolExecutor(
+                self.max_concurrency
+            )
+        return self.__thread_pool
+
+    def evaluate(
+        self,
+        node_ids: typing.Iterable[int] | None = None,
+    ) -> typing.Dict[int, typing.Dict[str, typing.Any]]:
+        if node_ids is None:
+            node_ids = [r.id for r in self.model.nodes()]
+
+        subset = self.dependencies(node_ids)
+        pending = {n: len(self.model.upstream(n) & subset) for n in subset}
+        ready = [n for n, count in pending.items() if count == 0]
+        running: typing.Dict[concurrent.futures.Future, int] = {}
+        results = {}
+        self.timings = {}
+
+        try:
+            while ready or running:
+                while ready and len(running) < self.max_concurrency:
+                    node_id = ready.pop()
+                    record = self.model.node(node_id)
+                    pool = self.pool(self.factory.executorKind(record.type_name))
+                    future = pool.submit(
+                        timed_call,
+                        self.computeFunction(record),
+                        self.gatherInputs(record, results),
+                    )
+                    running[future] = node_id
+
+                done, _ = concurrent.futures.wait(
+                    running, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                for future in done:
+                    node_id = running.pop(future)
+                    record = self.model.node(node_id)
+                    try:
+                        result, elapsed = future.result()
+                    except Exception as e:
+                        raise ComputeError(node_id, str(e)) from e
+
+                    results[node_id] = normalize_outputs(record, result)
+                    self.timings[node_id] = elapsed
+
+                    for downstream in self.model.downstream(node_id) & subset:
+                        pending[downstream] -= 1
+                        if pending[downstream] == 0:
+                            ready.append(downstream)
+        finally:
+            for future in running:
+                future.cancel()
+
+        if len(results) != len(subset):
+            raise ValueError("graph contains a cycle")
+
+        return results
+
+
+def value_size(value: typing.Any) -> int:
+    """
+    Estimate the memory held by a value, arrays report their buffer size.
+    """
+    nbytes = getattr(value, "nbytes", None)
+    if isinstance(nbytes, int):
+        return nbytes
+    return sys.getsizeof(value)
+
+
+def value_key(value: typing.Any) -> typing.Hashable:
+    """
+    A hashable stand in for an input value, raises TypeError if there isn't one.
+    Hashable values stand for themselves, values exposing a buffer like NumPy
+    arrays are keyed by a digest of their contents, so the key doesn't keep them
+    alive.
+    """
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        pass
+
+    try:
+        digest = hashlib.blake2b(memoryview(value), digest_size=16)
+    except (TypeError, ValueError, BufferError):
+        # non-contiguous arrays don't export a buffer but can copy their bytes
+        tobytes = getattr(value, "tobytes", None)
+        if tobytes is None:
+            raise TypeError(f"{type(value).__name__} values have no key") from None
+        digest = hashlib.blake2b(tobytes(), digest_size=16)
+    shape = getattr(value, "shape", None)
+    dtype = str(getattr(value, "dtype", ""))
+    return (type(value).__qualname__, shape, dtype, digest.digest())
+
+
+class ResultCache:
+    """
+    Least recently used output values keyed by (node id, port name, input key),
+    evicted once their estimated size exceeds the budget. Each node's outputs
+    for a key carry a version, which downstream input keys refer to.
+    """
+
+    def __init__(self, budget: int = 256 * 1024 * 1024):
+        self.budget = budget
+        self.__size = 0
+        self.__entries: collections.OrderedDict[
+            tuple, tuple[typing.Any, int, int]
+        ] = collections.OrderedDict()
+        # the entry keys of each node, so a node's entries are discarded
+        # without scanning the whole cache.
+        self.__node_entries: typing.Dict[int, typing.Dict[tuple, None]] = {}
+
+    def size(self):
+        return self.__size
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def get(self, record: NodeRecord, key: typing.Hashable):
+        """
+        The cached outputs of a node for the given input key, or None on a miss.
+        """
+        outputs = {}
+        for port in record.outputs:
+            entry = self.__entries.get((record.id, port, key))
+            if entry is None:
+                return None
+            self.__entries.move_to_end((record.id, port, key))
+            outputs[port] = entry[0]
+        return outputs
+
+    def version(self, record: NodeRecord, key: typing.Hashable) -> int:
+        """
+        The version the node's outputs for the given input key were inserted
+        with, zero if there are none.
+        """
+        for port in record.outputs:
+            entry = self.__entries.get((record.id, port, key))
+            return 0 if entry is None else entry[2]
+        return 0
+
+    def insert(
+        self,
+        record: NodeRecord,
+        key: typing.Hashable,
+        outputs: dict,
+        version: int = 0,
+    ):
+        for port, value in outputs.items():
+            entry_key = (record.id, port, key)
+            previous = self.__entries.pop(entry_key, None)
+            if previous is not None:
+                self.__size -= previous[1]
+            size = value_size(value)
+            self.__entries[entry_key] = (value, size, version)
+            self.__node_entries.setdefault(record.id, {})[entry_key] = None
+            self.__size += size
+
+        while self.__size > self.budget and self.__entries:
+            entry_key, (_, size, _) = self.__entries.popitem(last=False)
+            self.__size -= size
+            node_entries = self.__node_entries[entry_key[0]]
+            del node_entries[entry_key]
+            if not node_entries:
+                del self.__node_entries[entry_key[0]]
+
+    def discardNode(self, node_id: int):
+        for entry_key in self.__node_entries.pop(node_id, ()):
+            self.__size -= self.__entries.pop(entry_key)[1]
+
+    def clear(self):
+        self.__entries.clear()
+        self.__node_entries.clear()
+        self.__size = 0
+
+
+class IncrementalEvaluator(Evaluator):
+    """
+    Re-evaluate only what changed.
+
+    The evaluator watches the model, adding or removing a connection marks the
+    input side dirty, and dirty flags spread to everything downstream. Clean
+    nodes reuse their last outputs. Dirty nodes look their inputs up in a
+    ResultCache before computing, so undoing an edit is usually free.
+
+    Every computed result gets a new version, connected inputs are keyed by the
+    version of the upstream result rather than its value. Cache hits bring back
+    the version they were computed with, so hits carry on downstream.
+    """
+
+    def __init__(
+        self,
+        model: GraphModel,
+        factory: "NodeFactory",
+        cache_budget: int = 256 * 1024 * 1024,
+    ):
+        super().__init__(model, factory)
+        self.cache = ResultCache(cache_budget)
+        self.computed: typing.Set[int] = set()
+        self.__results: typing.Dict[int, typing.Dict[str, typing.Any]] = {}
+        self.__versions: typing.Dict[int, int] = {}
+        self.__next_version = itertools.count(1)
+        self.__dirty: typing.Set[int] = set()
+        model.subscribe(self.__modelChanged)
+
+    def __modelChanged(self, event: GraphEvent, record):
+        if event in (GraphEvent.EdgeAdded, GraphEvent.EdgeRemoved):
+            self.invalidate(record.input_node)
+        elif event == GraphEvent.NodeAdded:
+            self.invalidate(record.id)
+        elif event == GraphEvent.NodeRemoved:
+            self.__results.pop(record.id, None)
+            self.__versions.pop(record.id, None)
+            self.__dirty.discard(record.id)
+            self.cache.discardNode(record.id)
+        elif event == GraphEvent.Cleared:
+            self.__results.clear()
+            self.__versions.clear()
+            self.__dirty.clear()
+            self.cache.clear()
+
+    def isDirty(self, node_id: int):
+        return node_id in self.__dirty or node_id not in self.__results
+
+    def invalidate(self, node_id: int):
+        """
+        Mark a node and everything downstream of it as needing evaluation.
+        """
+        pending = [node_id]
+        while pending:
+            current = pending.pop()
+            if current in self.__dirty or not self.model.hasNode(current):
+                continue
+            self.__dirty.add(current)
+            pending.extend(self.model.downstream(current))
+
+    def setInputValue(self, node_id: int, port_name: str, value: typing.Any):
+        super().setInputValue(node_id, port_name, value)
+        self.invalidate(node_id)
+
+    def clearInputValues(self):
+        super().clearInputValues()
+        for record in self.model.nodes():
+            self.invalidate(record.id)
+
+    def inputKey(
+        self, record: NodeRecord, compute: typing.Callable
+    ) -> typing.Hashable | None:
+        """
+        A hashable key for calling compute with the node's current inputs, or None
+        if an input value has no key. Re-registering a node type's compute
+        callable changes the key, so stale outputs aren't reused.
+        """
+        parts = []
+        for name in record.inputs:
+            edges = self.model.portEdges(record.inputKey(name))
+            if edges:
+                edge = edges[0]
+                version = self.__versions.get(edge.output_node, 0)
+                part = (edge.output_node, edge.output_port, version)
+            else:
+                try:
+                    part = value_key(self.inputValue(record.id, name))
+                except TypeError:
+                    return None
+            parts.append((name, part))
+        return compute, tuple(parts)
+
+    def computeNode(
+        self,
+        node_id: int,
+        results: typing.Dict[int, typing.Dict[str, typing.Any]],
+    ) -> typing.Dict[str, typing.Any]:
+        record = self.model.node(node_id)
+        compute = self.computeFunction(record)
+        key = self.inputKey(record, compute)
+
+        if key is not None:
+            outputs = self.cache.get(record, key)
+            if outputs is not None:
+                self.__versions[node_id] = self.cache.version(record, key)
+                return outputs
+
+        outputs = call_compute(compute, record, self.gatherInputs(record, results))
+        self.computed.add(node_id)
+        version = next(self.__next_version)
+        self.__versions[node_id] = version
+        if key is not None:
+            self.cache.insert(record, key, outputs, version)
+        return outputs
+
+    def evaluate(
+        self,
+        node_ids: typing.Iterable[int] | None = None,
+    ) -> typing.Dict[int, typing.Dict[str, typing.Any]]:
+        """
+        As Evaluator.evaluate, but only dirty nodes are recomputed. The ids of
+        nodes whose compute callable actually ran are left in computed.
+        """
+        if node_ids is None:
+            node_ids = [r.id for r in self.model.nodes()]
+
+        self.computed = set()
+        results = {}
+        for node_id in self.schedule(node_ids):
+            if self.isDirty(node_id):
+                self.__results[node_id] = self.computeNode(node_id, results)
+                self.__dirty.discard(node_id)
+            results[node_id] = self.__results[node_id]
+        return results
+
+
+class AsyncEvaluator:
+    """
+    Evaluate a graph on an asyncio event loop.
+
+    Compute callables may be coroutine functions, plain functions are run on a
+    worker thread so they never block the loop. Input values and compute
+    callables come from the wrapped evaluator. Each node runs as its own task,
+    cancelling one cancels everything downstream of it which is still waiting.
+    """
+
+    def __init__(self, evaluator: Evaluator):
+        self.evaluator = evaluator
+        self.__tasks: typing.Dict[int, asyncio.Task] = {}
+
+    def isRunning(self):
+        return bool(self.__tasks)
+
+    def cancel(self, node_id: int | None = None):
+        """
+        Cancel one node, or the whole evaluation if no node is given.
+        """
+        if node_id is None:
+            tasks = list(self.__tasks.values())
+        else:
+            tasks = [self.__tasks[node_id]] if node_id in self.__tasks else []
+
+        for task in tasks:
+            task.cancel()
+
+    async def computeNode(self, record: NodeRecord, inputs: dict):
+        compute = self.evaluator.computeFunction(record)
+        if inspect.iscoroutinefunction(compute):
+            result = await compute(**inputs)
+        else:
+            result = await asyncio.to_thread(compute, **inputs)
+            if inspect.isawaitable(result):
+                result = await result
+        return normalize_outputs(record, result)
+
+    def start(
+        self,
+        node_ids: typing.Iterable[int] | None = None,
+        callback: typing.Callable[[int, dict | None], None] | None = None,
+    ) -> asyncio.Future:
+        """
+        Create a task for each node needed to compute the given nodes, on the
+        running loop, so they can be cancelled straight away. callback(node_id,
+        outputs) is called as each node finishes, with None for outputs if it was
+        cancelled. The returned future resolves to the outputs of every node which
+        completed.
+        """
+        if self.__tasks:
+            raise RuntimeError("an evaluation is already running")
+
+        model = self.evaluator.model
+        if node_ids is None:
+            node_ids = [r.id for r in model.nodes()]
+        order = self.evaluator.schedule(node_ids)
+        results = {}
+        reported = set()
+
+        def report(node_id: int, outputs: dict | None):
+            reported.add(node_id)
+            if callback is not None:
+                callback(node_id, outputs)
+
+        async def run(node_id: int):
+            # asyncio.wait rather than gather, as gather relies on task internals
+            # which Qt's asyncio loop doesn't provide. Cancellation is swallowed
+            # here so it doesn't surface as a task error.
+            try:
+                upstream = [self.__tasks[n] for n in model.upstream(node_id)]
+                if upstream:
+                    await asyncio.wait(upstream)
+                if any(n not in results for n in model.upstream(node_id)):
+                    report(node_id, None)
+                    return
+
+                record = model.node(node_id)
+                inputs = self.evaluator.gatherInputs(record, results)
+                results[node_id] = await self.computeNode(record, inputs)
+            except asyncio.CancelledError:
+                report(node_id, None)
+                return
+            report(node_id, results[node_id])
+
+        async def collect():
+            tasks = dict(self.__tasks)
+            try:
+                await asyncio.wait(tasks.values())
+            finally:
+                self.__tasks.clear()
+
+            for node_id, task in tasks.items():
+                if node_id not in reported:
+                    report(node_id, None)
+            for node_id, task in tasks.items():
+                if not task.cancelled() and task.exception() is not None:
+                    error = task.exception()
+                    raise ComputeError(node_id, str(error)) from error
+            return results
+
+        loop = asyncio.get_running_loop()
+        for node_id in order:
+            self.__tasks[node_id] = loop.create_task(run(node_id))
+        return loop.create_task(collect())
+
+    async def evaluate(
+        self,
+        node_ids: typing.Iterable[int] | None = None,
+        callback: typing.Callable[[int, dict | None], None] | None = None,
+    ) -> typing.Dict[int, typing.Dict[str, typing.Any]]:
+        return await self.start(node_ids, callback)
+
+
+def stack(values: typing.List[typing.Any]):
+    """
+    Join per sample values into one batched value, a NumPy array if NumPy is
+    available and the values stack, otherwise a list.
+    """
+    try:
+        import numpy
+    except ImportError:
+        return list(values)
+
+    try:
+        return numpy.stack([numpy.asarray(v) for v in values])
+    except ValueError:
+        return list(values)
+
+
+def repeat(value: typing.Any, count: int):
+    """
+    Give an unbatched value a leading batch dimension of the given size.
+    """
+    try:
+        import numpy
+    except ImportError:
+        return [value] * count
+
+    array = numpy.asarray(value)
+    if array.dtype == object:
+        return [value] * count
+    return numpy.broadcast_to(array, (count, *array.shape))
+
+
+class BatchEvaluator(Evaluator):
+    """
+    Evaluate the graph for many parameter sets in one traversal.
+
+    Inputs set with setBatchInputValue carry one value per sample, every other
+    unconnected input is repeated across the batch. Node types with a vectorized
+    callable are called once with every input batched, the rest fall back to
+    calling compute once per sample and stacking the results.
+    """
+
+    def __init__(self, model: GraphModel, factory: "NodeFactory"):
+        super().__init__(model, factory)
+        self.__batch_values: typing.Dict[PortKey, typing.Any] = {}
+        self.batch_size = 0
+
+    def setBatchInputValue(self, node_id: int, port_name: str, values: typing.Any):
+        count = len(values)
+        if self.__batch_values and count != self.batch_size:
+            raise ValueError(
+                f"batch of {count} values doesn't match batch size {self.batch_size}"
+            )
+        self.batch_size = count
+        self.__batch_values[PortKey(node_id, port_name, True)] = values
+
+    def clearBatchInputValues(self):
+        self.__batch_values.clear()
+        self.batch_size = 0
+
+    def gatherInputs(
+        self,
+        record: NodeRecord,
+        results: typing.Dict[int, typing.Dict[str, typing.Any]],
+    ) -> typing.Dict[str, typing.Any]:
+        inputs = super().gatherInputs(record, results)
+        for name in record.inputs:
+            key = record.inputKey(name)
+            if key in self.__batch_values:
+                inputs[name] = self.__batch_values[key]
+            elif not self.model.portEdges(key):
+                inputs[name] = repeat(inputs[name], self.batch_size)
+        return inputs
+
+    def computeNode(
+        self,
+        node_id: int,
+        results: typing.Dict[int, typing.Dict[str, typing.Any]],
+    ) -> typing.Dict[str, typing.Any]:
+        record = self.model.node(node_id)
+        inputs = self.gatherInputs(record, results)
+
+        vectorized = self.factory.vectorizedFunction(record.type_name)
+        if vectorized is not None:
+            return call_compute(vectorized, record, inputs)
+
+        compute = self.computeFunction(record)
+        samples = [
+            call_compute(compute, record, {k: v[i] for k, v in inputs.items()})
+            for i in range(self.batch_size)
+        ]
+        return {name: stack([s[name] for s in samples]) for name in record.outputs}
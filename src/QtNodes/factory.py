@@ -1,6 +1,7 @@
 import dataclasses
 import typing
 from qtpy import QtWidgets, QtGui, QtCore
+from QtNodes.model import GraphModel, NodeRecord
 from QtNodes.node import NodeItem
 from QtNodes.port import PortItem, InputPort, OutputPort
 
@@ -18,6 +19,15 @@ class NodeType:
     inputs: typing.Dict[str, str]
     outputs: typing.Dict[str, str]
     color: QtGui.QColor = None
+    # called with the node's input values as keyword arguments, see
+    # QtNodes.evaluation for the calling convention.
+    compute: typing.Callable | None = None
+    # "thread" for compute callables which release the GIL, "process" for pure
+    # python ones, only used by QtNodes.evaluation.ParallelEvaluator.
+    executor: str = "thread"
+    # optional version of compute which takes and returns values with a leading
+    # batch dimension, used by QtNodes.evaluation.BatchEvaluator.
+    vectorized: typing.Callable | None = None
 
 
 class NodeFactory:
@@ -25,16 +35,66 @@ class NodeFactory:
         self.node_types: typing.Dict[str, NodeType] = {}
         self.port_types: typing.Dict[str, PortType] = {}
 
+    def registerCompute(self, type_name: str, compute: typing.Callable):
+        """
+        Set the compute callable used to evaluate nodes of the given type.
+        """
+        node_type = self.node_types[type_name]
+        self.node_types[type_name] = dataclasses.replace(node_type, compute=compute)
+
+    def computeFunction(self, type_name: str) -> typing.Callable | None:
+        return self.node_types[type_name].compute
+
+    def vectorizedFunction(self, type_name: str) -> typing.Callable | None:
+        return self.node_types[type_name].vectorized
+
+    def executorKind(self, type_name: str) -> str:
+        return self.node_types[type_name].executor
+
     def createNode(self, type_name: str):
         node_type = self.node_types[type_name]
 
-        node = NodeItem(node_type.name)
+        node = NodeItem(node_type.name, node_type.category)
         for name, port_type in node_type.inputs.items():
             node.addPort(self.createPort(name, port_type, node, True))
 
         for name, port_type in node_type.outputs.items():
             node.addPort(self.createPort(name, port_type, node, False))
 
+        node.resolveLayout()
+        return node
+
+    def createNodeRecord(
+        self,
+        model: GraphModel,
+        type_name: str,
+        x: float = 0.0,
+        y: float = 0.0,
+        node_id: int | None = None,
+    ) -> NodeRecord:
+        """
+        Add a node of the given type to the model without creating any scene items.
+        """
+        node_type = self.node_types[type_name]
+        inputs = {k: self.port_types[v].datatype for k, v in node_type.inputs.items()}
+        outputs = {k: self.port_types[v].datatype for k, v in node_type.outputs.items()}
+        return model.addNode(
+            node_type.name,
+            inputs,
+            outputs,
+            x,
+            y,
+            category=node_type.category,
+            node_id=node_id,
+        )
+
+    def createNodeFromRecord(self, record: NodeRecord):
+        """
+        Create the scene item which mirrors a model record.
+        """
+        node = self.createNode(record.type_name)
+        node.setNodeId(record.id)
+        node.setPos(record.x, record.y)
         return node
 
     def createPort(self, name: str, port_type: str, node: NodeItem, is_input: bool):
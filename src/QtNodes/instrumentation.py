@@ -0,0 +1,229 @@
+"""
+Opt-in counting and timing of hot paths.
+
+Methods and module functions are marked with the probe decorator, or registered
+with Instrumentation.probe. While instrumentation is disabled the original
+functions are left in place, enabling it swaps in timed wrappers, so there is no
+cost at all until it is turned on.
+
+Overrides of Qt virtual methods can't be swapped on their class, shiboken caches
+the override an object resolves on its first call. Their wrappers are set on each
+object instead, which shiboken checks before the cache. Enabling walks the live
+wrapper objects once and hooks __init__ of the probed classes for new ones,
+disabling removes the wrappers again.
+
+Call counts and times accumulate until endFrame, which emits a FrameStats
+snapshot and starts the next frame. NodeGraphView does this after every paint
+while its HUD is shown.
+"""
+
+__all__ = ["FrameStats", "Instrumentation", "instrumentation", "probe"]
+
+import collections
+import dataclasses
+import functools
+import sys
+import time
+import types
+import typing
+
+from qtpy import QtCore
+from shiboken6 import Shiboken
+
+
+@dataclasses.dataclass(frozen=True)
+class FrameStats:
+    frame: int
+    # wall time since the previous frame ended, in seconds.
+    interval: float
+    calls: typing.Dict[str, int]
+    times: typing.Dict[str, float]
+
+    @property
+    def fps(self):
+        return 1.0 / self.interval if self.interval > 0 else 0.0
+
+    def count(self, *names: str):
+        return sum(self.calls.get(name, 0) for name in names)
+
+
+class Instrumentation(QtCore.QObject):
+    enabledChanged = QtCore.Signal(bool)
+    frameFinished = QtCore.Signal(object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent=parent)
+        self.__enabled = False
+        self.__probes: typing.List[tuple[typing.Any, str, typing.Callable, str]] = []
+        # probed Qt virtuals, by class and method name, with their timed wrappers
+        self.__virtuals: typing.Dict[type, typing.Dict[str, typing.Callable]] = {}
+        self.__inits: typing.Dict[type, typing.Callable | None] = {}
+        self.__calls: typing.Dict[str, int] = collections.defaultdict(int)
+        self.__times: typing.Dict[str, float] = collections.defaultdict(float)
+        self.__frame = 0
+        self.__frame_start = time.perf_counter()
+
+    def isEnabled(self):
+        return self.__enabled
+
+    def setEnabled(self, enabled: bool):
+        if enabled == self.__enabled:
+            return
+
+        self.__enabled = enabled
+        for owner, attr, function, name in self.__probes:
+            setattr(owner, attr, self.__wrap(function, name) if enabled else function)
+        for owner in self.__virtuals:
+            self.__hookInit(owner, enabled)
+        if self.__virtuals:
+            for instance in Shiboken.getAllValidWrappers():
+                self.__probeInstance(instance, enabled)
+        self.reset()
+        self.enabledChanged.emit(enabled)
+
+    def probe(
+        self,
+        owner: typing.Any,
+        attr: str,
+        name: str | None = None,
+        function: typing.Callable | None = None,
+    ):
+        """
+        Count and time calls to owner.attr, which can be a method of a class or a
+        function of a module. Pass function when registering it before it's been
+        assigned to owner. Returns what owner.attr should be set to.
+        """
+        function = function or getattr(owner, attr)
+        name = name or f"{getattr(owner, '__name__', owner)}.{attr}"
+        if is_qt_virtual(owner, attr):
+            self.__virtuals.setdefault(owner, {})[attr] = self.__wrap(function, name)
+            if self.__enabled:
+                self.__hookInit(owner, True)
+            return function
+
+        self.__probes.append((owner, attr, function, name))
+        if self.__enabled:
+            function = self.__wrap(function, name)
+            setattr(owner, attr, function)
+        return function
+
+    def __hookInit(self, owner: type, enabled: bool):
+        if not enabled:
+            if owner in self.__inits:
+                init = self.__inits.pop(owner)
+                if init is None:
+                    del owner.__init__
+                else:
+                    owner.__init__ = init
+            return
+
+        if owner in self.__inits:
+            return
+        init = vars(owner).get("__init__")
+        self.__inits[owner] = init
+        base_init = getattr(owner, "__init__")
+
+        @functools.wraps(base_init)
+        def hooked_init(instance, *args, **kwargs):
+            base_init(instance, *args, **kwargs)
+            self.__probeInstance(instance, True)
+
+        owner.__init__ = hooked_init
+
+    def __probeInstance(self, instance: typing.Any, enabled: bool):
+        cls = type(instance)
+        for owner, wrappers in self.__virtuals.items():
+            if not isinstance(instance, owner):
+                continue
+            for attr, wrapper in wrappers.items():
+                # only when the instance runs the probed method, not an override
+                if getattr(cls, attr) is not wrapper.__wrapped__:
+                    continue
+                if enabled:
+                    setattr(instance, attr, types.MethodType(wrapper, instance))
+                elif attr in vars(instance):
+                    delattr(instance, attr)
+
+    def __wrap(self, function: typing.Callable, name: str):
+        calls = self.__calls
+        times = self.__times
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                calls[name] += 1
+                times[name] += time.perf_counter() - start
+
+        return wrapper
+
+    def record(self, name: str, seconds: float = 0.0, calls: int = 1):
+        if self.__enabled:
+            self.__calls[name] += calls
+            self.__times[name] += seconds
+
+    def reset(self):
+        self.__calls.clear()
+        self.__times.clear()
+        self.__frame_start = time.perf_counter()
+
+    def endFrame(self) -> FrameStats:
+        now = time.perf_counter()
+        self.__frame += 1
+        stats = FrameStats(
+            self.__frame,
+            now - self.__frame_start,
+            dict(self.__calls),
+            dict(self.__times),
+        )
+        self.__calls.clear()
+        self.__times.clear()
+        self.__frame_start = now
+        self.frameFinished.emit(stats)
+        return stats
+
+
+def is_qt_virtual(owner: typing.Any, attr: str):
+    if not isinstance(owner, type):
+        return False
+    return any(
+        attr in vars(base)
+        for base in owner.__mro__
+        if base.__module__.startswith(("PySide6", "shiboken6"))
+    )
+
+
+instrumentation = Instrumentation()
+
+
+def probe(name: str | typing.Callable | None = None):
+    """
+    Decorate a method or module function to register it with the global
+    instrumentation, the name defaults to ClassName.method or module.function.
+    """
+    if callable(name):
+        return probe()(name)
+
+    def decorate(function: typing.Callable):
+        if "." in function.__qualname__:
+            return _MethodProbe(function, name)
+        module = sys.modules[function.__module__]
+        return instrumentation.probe(module, function.__name__, name, function)
+
+    return decorate
+
+
+class _MethodProbe:
+    """
+    Registers a method once its class exists.
+    """
+
+    def __init__(self, function: typing.Callable, name: str | None):
+        self.__function = function
+        self.__name = name
+
+    def __set_name__(self, owner, attr: str):
+        setattr(owner, attr, self.__function)
+        instrumentation.probe(owner, attr, self.__name)
@@ -1,24 +1,34 @@
+import enum
+
 from qtpy import QtWidgets, QtGui, QtCore
 
+# below these zoom levels items drop their text, then draw as simple shapes.
+# NodeGraphView can override them per view.
+TEXT_DETAIL_THRESHOLD = 0.5
+SHAPE_DETAIL_THRESHOLD = 0.3
 
-class StaticTextItem(QtWidgets.QGraphicsWidget):
-    def __init__(self, text: str, parent=None):
-        super().__init__(parent=parent)
-        self.__text = text
-        self.__font_metrics = QtGui.QFontMetricsF(self.font())
-        self.__alignment = (
-            QtCore.Qt.AlignmentFlag.AlignTop | QtCore.Qt.AlignmentFlag.AlignHCenter
-        )
 
-    def sizeHint(self, which, constraint=...):
-        return self.__font_metrics.boundingRect(self.__text).size()
+class DetailLevel(enum.IntEnum):
+    Shapes = 0
+    NoText = 1
+    Full = 2
+
 
-    def contains(self, point):
-        return False
+def detail_level(painter, option, widget=None):
+    """
+    Pick how much detail to paint based on the painter's zoom, the thresholds are
+    read from the view being painted if it sets them.
+    """
+    view = widget.parent() if isinstance(widget, QtWidgets.QWidget) else None
+    text_threshold = getattr(view, "text_detail_threshold", TEXT_DETAIL_THRESHOLD)
+    shape_threshold = getattr(view, "shape_detail_threshold", SHAPE_DETAIL_THRESHOLD)
 
-    def paint(self, painter, option, widget=...):
-        painter.setFont(self.font())
-        painter.drawText(self.rect(), self.__text, self.__alignment)
+    lod = option.levelOfDetailFromTransform(painter.worldTransform())
+    if lod < shape_threshold:
+        return DetailLevel.Shapes
+    elif lod < text_threshold:
+        return DetailLevel.NoText
+    return DetailLevel.Full
 
 
 from PySide6 import QtWidgets, QtCore
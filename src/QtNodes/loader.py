@@ -0,0 +1,111 @@
+__all__ = ["GraphLoader"]
+
+import typing
+
+from qtpy import QtCore
+
+from QtNodes import serialization
+
+if typing.TYPE_CHECKING:
+    from QtNodes.controller import NodeGraphController
+
+
+class GraphLoader(QtCore.QObject):
+    """
+    Populate a controller's graph from a file a chunk at a time.
+
+    Each chunk is applied from a zero interval timer, so the event loop keeps
+    running between chunks. Cancelling leaves whatever has been loaded so far in
+    place.
+    """
+
+    progress = QtCore.Signal(int, int)
+    finished = QtCore.Signal()
+    cancelled = QtCore.Signal()
+    failed = QtCore.Signal(str)
+
+    def __init__(
+        self,
+        controller: "NodeGraphController",
+        path: str,
+        chunk_size: int = 200,
+        parent=None,
+    ):
+        super().__init__(parent=parent)
+        self.__controller = controller
+        self.__path = path
+        self.__chunk_size = chunk_size
+        self.__entries: typing.Iterator | None = None
+        self.__total = 0
+        self.__done = 0
+        self.__timer = QtCore.QTimer(self)
+        self.__timer.setInterval(0)
+        self.__timer.timeout.connect(self.step)
+
+    def total(self):
+        return self.__total
+
+    def done(self):
+        return self.__done
+
+    def isRunning(self):
+        return self.__timer.isActive()
+
+    def start(self):
+        self.__entries = serialization.iter_load(self.__path)
+        self.__done = 0
+        self.__timer.start()
+
+    def cancel(self):
+        if not self.isRunning():
+            return
+        self.__stop()
+        self.cancelled.emit()
+
+    def step(self):
+        """
+        Apply the next chunk of entries, returns False once loading has stopped.
+        """
+        if self.__entries is None:
+            return False
+
+        model = self.__controller.model
+        virtualized = self.__controller.isVirtualized()
+        try:
+            for _ in range(self.__chunk_size):
+                entry = next(self.__entries, None)
+                if entry is None:
+                    self.__stop()
+                    self.progress.emit(self.__done, self.__total)
+                    self.finished.emit()
+                    return False
+
+                # a virtualized controller creates items for visible records itself
+                kind = entry[0]
+                if kind == "node":
+                    record = model.addNode(**entry[1])
+                    if not virtualized:
+                        self.__controller.materializeNode(record)
+                elif kind == "edge":
+                    record = model.addEdge(*entry[1])
+                    if not virtualized:
+                        self.__controller.materializeConnection(record)
+                else:
+                    self.__total = entry[1] + entry[2]
+                    continue
+
+                self.__done += 1
+
+        except (OSError, ValueError, KeyError) as e:
+            self.__stop()
+            self.failed.emit(str(e))
+            return False
+
+        self.progress.emit(self.__done, self.__total)
+        return True
+
+    def __stop(self):
+        self.__timer.stop()
+        if self.__entries is not None:
+            self.__entries.close()
+            self.__entries = None
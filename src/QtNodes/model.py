@@ -0,0 +1,387 @@
+"""
+A pure-python graph model.
+
+The model holds the node, port and edge tables of a graph together with the
+adjacency indexes needed to walk it. It has no Qt dependency, so graphs can be
+built, validated and processed without a QApplication. The scene mirrors the
+model, each record optionally carries the scene item which represents it.
+"""
+
+__all__ = ["NodeRecord", "EdgeRecord", "PortKey", "GraphEvent", "GraphModel"]
+
+import dataclasses
+import enum
+import typing
+
+
+class PortKey(typing.NamedTuple):
+    node_id: int
+    name: str
+    is_input: bool
+
+
+@dataclasses.dataclass(slots=True, eq=False)
+class NodeRecord:
+    id: int
+    type_name: str
+    inputs: typing.Dict[str, str]
+    outputs: typing.Dict[str, str]
+    x: float = 0.0
+    y: float = 0.0
+    category: str | None = None
+    item: typing.Any = None
+
+    def inputKey(self, name: str):
+        return PortKey(self.id, name, True)
+
+    def outputKey(self, name: str):
+        return PortKey(self.id, name, False)
+
+
+@dataclasses.dataclass(slots=True, eq=False)
+class EdgeRecord:
+    id: int
+    output_node: int
+    output_port: str
+    input_node: int
+    input_port: str
+    item: typing.Any = None
+
+    def outputKey(self):
+        return PortKey(self.output_node, self.output_port, False)
+
+    def inputKey(self):
+        return PortKey(self.input_node, self.input_port, True)
+
+
+class GraphEvent(enum.Enum):
+    NodeAdded = enum.auto()
+    NodeRemoved = enum.auto()
+    NodeMoved = enum.auto()
+    EdgeAdded = enum.auto()
+    EdgeRemoved = enum.auto()
+    Cleared = enum.auto()
+
+
+class GraphModel:
+    def __init__(self):
+        self.__nodes: typing.Dict[int, NodeRecord] = {}
+        self.__edges: typing.Dict[int, EdgeRecord] = {}
+        self.__node_edges: typing.Dict[int, typing.Set[int]] = {}
+        self.__port_edges: typing.Dict[PortKey, typing.Set[int]] = {}
+        self.__by_type: typing.Dict[str, typing.Dict[int, NodeRecord]] = {}
+        self.__by_category: typing.Dict[str, typing.Dict[int, NodeRecord]] = {}
+        self.__next_id = 1
+        self.__revision = 0
+        self.__observers: typing.List[typing.Callable] = []
+        self.__item_loader: typing.Callable[[typing.Any], typing.Any] | None = None
+
+    def subscribe(self, callback: typing.Callable[[GraphEvent, typing.Any], None]):
+        """
+        Call callback(event, record) whenever the graph changes, the record is the
+        node or edge record affected, or None when the model is cleared.
+        """
+        self.__observers.append(callback)
+
+    def unsubscribe(self, callback: typing.Callable):
+        self.__observers.remove(callback)
+
+    def setItemLoader(self, loader: typing.Callable[[typing.Any], typing.Any] | None):
+        """
+        Create items on demand for records which don't have one, loader(record) is
+        called with a node or edge record and returns the item it created.
+        """
+        self.__item_loader = loader
+
+    def revision(self):
+        """
+        A counter which changes whenever nodes or edges are added or removed, but
+        not when nodes move.
+        """
+        return self.__revision
+
+    def __notify(self, event: GraphEvent, record):
+        if event != GraphEvent.NodeMoved:
+            self.__revision += 1
+        for callback in self.__observers:
+            callback(event, record)
+
+    def newId(self):
+        value = self.__next_id
+        self.__next_id += 1
+        return value
+
+    def __claimId(self, value: int | None):
+        if value is None:
+            return self.newId()
+        if value >= self.__next_id:
+            self.__next_id = value + 1
+        return value
+
+    def clear(self):
+        self.__nodes.clear()
+        self.__edges.clear()
+        self.__node_edges.clear()
+        self.__port_edges.clear()
+        self.__by_type.clear()
+        self.__by_category.clear()
+        self.__notify(GraphEvent.Cleared, None)
+
+    # nodes
+
+    def addNode(
+        self,
+        type_name: str,
+        inputs: typing.Dict[str, str],
+        outputs: typing.Dict[str, str],
+        x: float = 0.0,
+        y: float = 0.0,
+        category: str | None = None,
+        node_id: int | None = None,
+        item: typing.Any = None,
+    ) -> NodeRecord:
+        if node_id is not None and node_id in self.__nodes:
+            raise KeyError(f"node id already in use: {node_id}")
+
+        record = NodeRecord(
+            self.__claimId(node_id),
+            type_name,
+            dict(inputs),
+            dict(outputs),
+            float(x),
+            float(y),
+            category,
+            item,
+        )
+        self.__nodes[record.id] = record
+        self.__node_edges[record.id] = set()
+        self.__by_type.setdefault(type_name, {})[record.id] = record
+        if category is not None:
+            self.__by_category.setdefault(category, {})[record.id] = record
+        self.__notify(GraphEvent.NodeAdded, record)
+        return record
+
+    def removeNode(self, node_id: int) -> typing.List[EdgeRecord]:
+        """
+        Remove a node and any edges attached to it, the removed edges are returned.
+        """
+        removed = [self.removeEdge(e) for e in tuple(self.__node_edges[node_id])]
+        del self.__node_edges[node_id]
+        record = self.__nodes.pop(node_id)
+        self.__unindex(self.__by_type, record.type_name, node_id)
+        if record.category is not None:
+            self.__unindex(self.__by_category, record.category, node_id)
+        self.__notify(GraphEvent.NodeRemoved, record)
+        return removed
+
+    @staticmethod
+    def __unindex(index: dict, key: str, node_id: int):
+        bucket = index[key]
+        del bucket[node_id]
+        if not bucket:
+            del index[key]
+
+    def node(self, node_id: int) -> NodeRecord:
+        return self.__nodes[node_id]
+
+    def nodeItem(self, node_id: int):
+        """
+        The node's item, created through the item loader if it has none yet.
+        """
+        record = self.__nodes[node_id]
+        if record.item is None and self.__item_loader is not None:
+            return self.__item_loader(record)
+        return record.item
+
+    def hasNode(self, node_id: int):
+        return node_id in self.__nodes
+
+    def nodes(self):
+        return self.__nodes.values()
+
+    def numNodes(self):
+        return len(self.__nodes)
+
+    def nodesOfType(self, type_name: str):
+        return self.__by_type.get(type_name, {}).values()
+
+    def nodesInCategory(self, category: str):
+        return self.__by_category.get(category, {}).values()
+
+    def typeNames(self):
+        return self.__by_type.keys()
+
+    def categories(self):
+        return self.__by_category.keys()
+
+    def setNodePos(self, node_id: int, x: float, y: float):
+        record = self.__nodes[node_id]
+        record.x = float(x)
+        record.y = float(y)
+        self.__notify(GraphEvent.NodeMoved, record)
+
+    # edges
+
+    def canConnect(
+        self,
+        output_node: int,
+        output_port: str,
+        input_node: int,
+        input_port: str,
+    ):
+        if output_node == input_node:
+            return False
+
+        source = self.__nodes.get(output_node)
+        target = self.__nodes.get(input_node)
+        if source is None or target is None:
+            return False
+
+        datatype = source.outputs.get(output_port)
+        if datatype is None:
+            return False
+
+        return target.inputs.get(input_port) == datatype
+
+    def addEdge(
+        self,
+        output_node: int,
+        output_port: str,
+        input_node: int,
+        input_port: str,
+        edge_id: int | None = None,
+        item: typing.Any = None,
+    ) -> EdgeRecord:
+        if not self.canConnect(output_node, output_port, input_node, input_port):
+            raise ValueError(
+                f"cannot connect {output_node}.{output_port} "
+                f"to {input_node}.{input_port}"
+            )
+        if edge_id is not None and edge_id in self.__edges:
+            raise KeyError(f"edge id already in use: {edge_id}")
+
+        record = EdgeRecord(
+            self.__claimId(edge_id),
+            output_node,
+            output_port,
+            input_node,
+            input_port,
+            item,
+        )
+        self.__edges[record.id] = record
+        self.__node_edges[output_node].add(record.id)
+        self.__node_edges[input_node].add(record.id)
+        self.__port_edges.setdefault(record.outputKey(), set()).add(record.id)
+        self.__port_edges.setdefault(record.inputKey(), set()).add(record.id)
+        self.__notify(GraphEvent.EdgeAdded, record)
+        return record
+
+    def removeEdge(self, edge_id: int) -> EdgeRecord:
+        record = self.__edges.pop(edge_id)
+        self.__node_edges[record.output_node].discard(edge_id)
+        self.__node_edges[record.input_node].discard(edge_id)
+
+        for key in (record.outputKey(), record.inputKey()):
+            port_edges = self.__port_edges[key]
+            port_edges.discard(edge_id)
+            if not port_edges:
+                del self.__port_edges[key]
+
+        self.__notify(GraphEvent.EdgeRemoved, record)
+        return record
+
+    def edge(self, edge_id: int) -> EdgeRecord:
+        return self.__edges[edge_id]
+
+    def edgeItem(self, edge_id: int):
+        """
+        The edge's item, created through the item loader if it has none yet.
+        """
+        record = self.__edges[edge_id]
+        if record.item is None and self.__item_loader is not None:
+            return self.__item_loader(record)
+        return record.item
+
+    def hasEdge(self, edge_id: int):
+        return edge_id in self.__edges
+
+    def edges(self):
+        return self.__edges.values()
+
+    def numEdges(self):
+        return len(self.__edges)
+
+    # adjacency
+
+    def nodeEdges(self, node_id: int):
+        return [self.__edges[e] for e in self.__node_edges[node_id]]
+
+    def portEdges(self, key: PortKey):
+        return [self.__edges[e] for e in self.__port_edges.get(key, ())]
+
+    def inputEdges(self, node_id: int):
+        return [e for e in self.nodeEdges(node_id) if e.input_node == node_id]
+
+    def outputEdges(self, node_id: int):
+        return [e for e in self.nodeEdges(node_id) if e.output_node == node_id]
+
+    def upstream(self, node_id: int):
+        return {e.output_node for e in self.inputEdges(node_id)}
+
+    def downstream(self, node_id: int):
+        return {e.input_node for e in self.outputEdges(node_id)}
+
+    # validation
+
+    def topologicalOrder(self, node_ids: typing.Iterable[int] | None = None):
+        """
+        Return node ids ordered so every node comes after its upstream nodes.
+
+        If node_ids is given only those nodes are ordered, edges leaving the set
+        are ignored. A ValueError is raised if the graph contains a cycle.
+        """
+        if node_ids is None:
+            node_ids = self.__nodes.keys()
+        subset = set(node_ids)
+
+        pending = {n: 0 for n in subset}
+        for edge in self.__edges.values():
+            if edge.output_node in subset and edge.input_node in subset:
+                pending[edge.input_node] += 1
+
+        ready = [n for n, count in pending.items() if count == 0]
+        order = []
+        while ready:
+            node_id = ready.pop()
+            order.append(node_id)
+            for edge_id in self.__node_edges[node_id]:
+                edge = self.__edges[edge_id]
+                if edge.output_node != node_id or edge.input_node not in subset:
+                    continue
+                pending[edge.input_node] -= 1
+                if pending[edge.input_node] == 0:
+                    ready.append(edge.input_node)
+
+        if len(order) != len(subset):
+            raise ValueError("graph contains a cycle")
+
+        return order
+
+    def validate(self) -> typing.List[str]:
+        """
+        Check the graph for problems, returns a list of human readable errors.
+        """
+        errors = []
+        for key, edge_ids in self.__port_edges.items():
+            if key.is_input and len(edge_ids) > 1:
+                errors.append(
+                    f"node {key.node_id}: input {key.name!r} has "
+                    f"{len(edge_ids)} connections"
+                )
+
+        try:
+            self.topologicalOrder()
+        except ValueError as e:
+            errors.append(str(e))
+
+        return errors
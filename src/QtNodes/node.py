@@ -1,82 +1,230 @@
+import dataclasses
+import functools
+import math
 import typing
 from qtpy import QtWidgets, QtGui, QtCore
 
 from QtNodes.base import SceneItemBase
-from QtNodes.items import StaticTextItem, SceneSpaceShadowEffect
+from QtNodes.connection import layout_queue
+from QtNodes.instrumentation import probe
+from QtNodes.items import DetailLevel, detail_level
 from QtNodes.port import InputPort, OutputPort, PortItem
+from QtNodes.render_cache import (
+    MAX_ZOOM_BUCKET,
+    RenderCache,
+    node_render_cache,
+    zoom_bucket,
+)
+from QtNodes.spatial import scene_index
 
-Orientation = QtCore.Qt.Orientation
+if typing.TYPE_CHECKING:
+    from QtNodes.model import GraphModel
 
+Alignment = QtCore.Qt.AlignmentFlag
 
-class TitleItem(StaticTextItem):
-    def sizeHint(self, which, constraint=...):
-        base = super().sizeHint(which, constraint=constraint)
-        return QtCore.QSizeF(base.width() + 50, base.height() + 5)
+NODE_MARGIN = 9
+NODE_SPACING = 6
+PORT_SIZE = 16
+
+_flags = QtWidgets.QGraphicsItem.GraphicsItemFlag
+NODE_FLAGS = (
+    _flags.ItemIsMovable
+    | _flags.ItemIsSelectable
+    | _flags.ItemNegativeZStacksBehindParent
+    | _flags.ItemSendsScenePositionChanges
+)
+
+
+@dataclasses.dataclass(frozen=True, slots=True, eq=False)
+class PortLayout:
+    rect: QtCore.QRectF
+    label_rect: QtCore.QRectF
+    anchor: QtCore.QPointF
+
+
+@dataclasses.dataclass(frozen=True, slots=True, eq=False)
+class NodeLayout:
+    """
+    The geometry of a node, shared by every node with the same title and ports.
+    """
+
+    size: QtCore.QSizeF
+    title_rect: QtCore.QRectF
+    body_path: QtGui.QPainterPath
+    title_path: QtGui.QPainterPath
+    inputs: typing.Tuple[PortLayout, ...]
+    outputs: typing.Tuple[PortLayout, ...]
+
+
+@functools.lru_cache(maxsize=1024)
+def node_layout(
+    title: str,
+    inputs: typing.Tuple[str, ...],
+    outputs: typing.Tuple[str, ...],
+    font_key: str,
+) -> NodeLayout:
+    """
+    Lay a node out as a title row above a row per port. Columns are input ports,
+    input labels, the title, output labels and output ports, empty columns take
+    no space.
+    """
+    font = QtGui.QFont()
+    font.fromString(font_key)
+    metrics = QtGui.QFontMetricsF(font)
+
+    def label_width(names):
+        return max((math.ceil(metrics.horizontalAdvance(n)) for n in names), default=0)
+
+    title_size = QtCore.QSizeF(
+        math.ceil(metrics.horizontalAdvance(title)) + 50, metrics.height() + 5
+    )
+    columns = [
+        PORT_SIZE if inputs else 0,
+        label_width(inputs),
+        title_size.width(),
+        label_width(outputs),
+        PORT_SIZE if outputs else 0,
+    ]
+
+    x = NODE_MARGIN
+    lefts = []
+    for width in columns:
+        lefts.append(x)
+        if width:
+            x += width + NODE_SPACING
+    width = x - NODE_SPACING + NODE_MARGIN
+
+    title_rect = QtCore.QRectF(QtCore.QPointF(lefts[2], NODE_MARGIN), title_size)
+    row_height = max(PORT_SIZE, metrics.height())
+    top = title_rect.bottom() + NODE_SPACING
+
+    def port_rows(names, port_column, label_column):
+        rows = []
+        for i, name in enumerate(names):
+            y = top + i * (row_height + NODE_SPACING)
+            rect = QtCore.QRectF(lefts[port_column], y, PORT_SIZE, PORT_SIZE)
+            label = QtCore.QRectF(
+                lefts[label_column], y, columns[label_column], metrics.height()
+            )
+            rows.append(PortLayout(rect, label, rect.center()))
+        return tuple(rows)
+
+    rows = max(len(inputs), len(outputs))
+    if rows:
+        height = top + rows * (row_height + NODE_SPACING) - NODE_SPACING + NODE_MARGIN
+    else:
+        height = title_rect.bottom() + NODE_MARGIN
+    size = QtCore.QSizeF(width, height)
+
+    body_path = QtGui.QPainterPath()
+    body_path.addRoundedRect(QtCore.QRectF(QtCore.QPointF(), size), 10, 10)
+    clip = QtGui.QPainterPath()
+    clip.addRect(QtCore.QRectF(0, 0, width, title_rect.bottom()))
+
+    return NodeLayout(
+        size,
+        title_rect,
+        body_path,
+        body_path.intersected(clip),
+        port_rows(inputs, 0, 1),
+        port_rows(outputs, 4, 3),
+    )
 
 
 class NodeItem(SceneItemBase):
-    def __init__(self, name, parent=None):
+    # nodes paint their title, labels and ports themselves so the result can be
+    # shared between nodes through this cache, set to None to paint directly.
+    render_cache: RenderCache | None = node_render_cache
+
+    def __init__(self, name, category: str | None = None, parent=None):
         super().__init__(parent=parent)
         self.__name = name
-        self.setFlag(self.GraphicsItemFlag.ItemIsMovable)
-        self.setFlag(self.GraphicsItemFlag.ItemIsSelectable)
-        self.setFlag(self.GraphicsItemFlag.ItemNegativeZStacksBehindParent)
-        self.setFlag(self.GraphicsItemFlag.ItemSendsScenePositionChanges)
+        self.__category = category
+        self.__node_id: int | None = None
+        self.__model: "GraphModel | None" = None
+        self.setFlags(self.flags() | NODE_FLAGS)
 
-        self.__inputs = {}
-        self.__outputs = {}
-        self.__title_item = TitleItem(name)
-        self.__outer_layout = QtWidgets.QGraphicsLinearLayout(Orientation.Vertical)
+        self.__inputs: typing.Dict[str, InputPort] = {}
+        self.__outputs: typing.Dict[str, OutputPort] = {}
+        self.__layout: NodeLayout | None = None
+        self.__render_key = None
 
-        self.__grid_size = 16
+    def name(self):
+        return self.__name
 
-        self.__grid_layout = QtWidgets.QGraphicsGridLayout()
-        self.__grid_layout.addItem(self.__title_item, 0, 2)
+    def category(self):
+        return self.__category
 
-        self.__outer_layout.addItem(self.__grid_layout)
-        self.setLayout(self.__outer_layout)
+    def nodeId(self):
+        return self.__node_id
 
-    def name(self):
-        return self.__name
+    def setNodeId(self, node_id: int | None):
+        self.__node_id = node_id
+
+    def model(self) -> "GraphModel | None":
+        return self.__model
+
+    def setModel(self, model: "GraphModel | None"):
+        """
+        The model whose record this item represents, the record's position follows
+        the item's however it is moved.
+        """
+        self.__model = model
 
     def toDict(self):
         return {
             "name": self.__name,
-            "inputs": [p[1].toDict() for p in self.__inputs.values()],
-            "outputs": [p[1].toDict() for p in self.__outputs.values()],
+            "category": self.__category,
+            "inputs": [p.toDict() for p in self.__inputs.values()],
+            "outputs": [p.toDict() for p in self.__outputs.values()],
         }
 
     @classmethod
     def fromDict(cls, data: dict):
-        node = cls(data["name"])
+        node = cls(data["name"], data.get("category"))
         for input_data in data["inputs"]:
             item = node.addInput(input_data["name"], input_data["datatype"])
-            item.setColor(input_data["color"])
+            item.setColor(QtGui.QColor(input_data["color"]))
 
         for input_data in data["outputs"]:
             item = node.addOutput(input_data["name"], input_data["datatype"])
-            item.setColor(input_data["color"])
+            item.setColor(QtGui.QColor(input_data["color"]))
 
+        node.resolveLayout()
         return node
 
     def clone(self):
         return self.fromDict(self.toDict())
 
+    def resolveLayout(self):
+        """
+        Look up the node's shared layout and resize to it, so the node's size and
+        port positions are valid immediately.
+        """
+        self.__layout = node_layout(
+            self.__name,
+            tuple(self.__inputs),
+            tuple(self.__outputs),
+            self.font().toString(),
+        )
+        self.resize(self.__layout.size)
+        return self.__layout
+
+    def nodeLayout(self) -> NodeLayout:
+        if self.__layout is None:
+            return self.resolveLayout()
+        return self.__layout
+
     def addPort(self, port: PortItem):
-        text_item = StaticTextItem(port.name())
         if isinstance(port, InputPort):
             collection = self.__inputs
-            text_col = 1
-            port_col = 0
         else:
             collection = self.__outputs
-            text_col = 3
-            port_col = 4
 
-        row = len(collection) + 1
-        collection[port.name()] = (text_item, port, row)
-        self.__grid_layout.addItem(port, row, port_col)
-        self.__grid_layout.addItem(text_item, row, text_col)
+        port.setIndex(len(collection))
+        collection[port.name()] = port
+        self.__layout = None
+        self.__render_key = None
 
     def addInput(self, name: str, datatype: str):
         port_item = InputPort(name, datatype, self)
@@ -88,46 +236,202 @@ class NodeItem(SceneItemBase):
         self.addPort(port_item)
         return port_item
 
+    def portLayout(self, port: PortItem) -> PortLayout:
+        layout = self.nodeLayout()
+        if isinstance(port, InputPort):
+            return layout.inputs[port.index()]
+        return layout.outputs[port.index()]
+
+    def portAnchor(self, port: PortItem) -> QtCore.QPointF:
+        return self.scenePos() + self.portLayout(port).anchor
+
+    @probe
+    def itemChange(self, change, value):
+        if change == self.GraphicsItemChange.ItemPositionHasChanged:
+            model = self.__model
+            if model is not None and model.hasNode(self.__node_id):
+                if model.node(self.__node_id).item is self:
+                    model.setNodePos(self.__node_id, self.x(), self.y())
+        elif change == self.GraphicsItemChange.ItemScenePositionHasChanged:
+            index = scene_index(self.scene()) if self.scene() is not None else None
+            for port in self.iterPorts():
+                if index is not None:
+                    index.updatePort(port)
+                for connection in port.iterConnections():
+                    layout_queue.schedule(connection)
+        elif change == self.GraphicsItemChange.ItemSceneChange:
+            if self.scene() is not None:
+                index = scene_index(self.scene())
+                for port in self.iterPorts():
+                    index.removePort(port)
+        elif change == self.GraphicsItemChange.ItemSceneHasChanged:
+            if value is not None:
+                index = scene_index(value)
+                for port in self.iterPorts():
+                    index.updatePort(port)
+        return super().itemChange(change, value)
+
+    def renderKey(self):
+        """
+        Identifies what this node looks like, nodes with equal keys paint the same.
+        """
+        if self.__render_key is None:
+            ports = tuple((p.name(), p.color().rgba()) for p in self.iterPorts())
+            self.__render_key = (self.__name, self.font().toString(), ports)
+        return self.__render_key
+
+    def changeEvent(self, event: QtCore.QEvent):
+        if event.type() == QtCore.QEvent.Type.FontChange:
+            # the layout and the rendered image both depend on the font
+            self.__render_key = None
+            self.resolveLayout()
+            index = scene_index(self.scene()) if self.scene() is not None else None
+            for port in self.iterPorts():
+                if index is not None:
+                    index.updatePort(port)
+                for connection in port.iterConnections():
+                    layout_queue.schedule(connection)
+        super().changeEvent(event)
+
+    @probe
     def paint(self, painter, option, widget=...):
-        painter.setPen(QtCore.Qt.PenStyle.NoPen)
+        palette = self.palette()
+        level = detail_level(painter, option, widget)
+
+        if level == DetailLevel.Shapes:
+            painter.setPen(QtCore.Qt.PenStyle.NoPen)
+            painter.setBrush(palette.brush(palette.ColorRole.Midlight))
+            painter.drawRect(self.rect())
+            if self.isSelected():
+                color = palette.color(palette.ColorRole.BrightText)
+                painter.setPen(QtGui.QPen(color, 0))
+                painter.setBrush(QtCore.Qt.BrushStyle.NoBrush)
+                painter.drawRect(self.rect())
+            self.paintPorts(painter, level)
+            return
+
+        scale = option.levelOfDetailFromTransform(painter.worldTransform())
+        if isinstance(widget, QtWidgets.QWidget):
+            scale *= widget.devicePixelRatioF()
+        if self.render_cache is None or scale > MAX_ZOOM_BUCKET:
+            # past the largest bucket a cached image would be scaled up
+            self.paintContents(painter, option, widget)
+            return
+
+        pixmap = self.cachedPixmap(zoom_bucket(scale), widget)
 
-        path = QtGui.QPainterPath()
-        path.addRoundedRect(self.rect(), 10, 10)
-        painter.setClipPath(path)
+        painter.setRenderHint(painter.RenderHint.SmoothPixmapTransform, True)
+        painter.drawPixmap(self.rect(), pixmap, QtCore.QRectF(pixmap.rect()))
 
-        painter.setBrush(self.palette().brush(self.palette().ColorRole.Midlight))
-        painter.drawRoundedRect(self.rect(), 10, 10)
-        painter.setBrush(self.palette().brush(self.palette().ColorRole.Accent))
+    def cachedPixmap(self, scale: float, widget=None):
+        """
+        The node rendered at scale, shared through render_cache when there is one.
+        """
+        if self.render_cache is None:
+            return self.renderPixmap(scale, widget)
 
-        title_bottom = self.mapRectFromScene(
-            self.__title_item.sceneBoundingRect()
-        ).bottom()
-        title_rect = QtCore.QRectF(self.rect())
-        title_rect.setHeight(title_bottom)
+        key = (
+            self.renderKey(),
+            self.rect().size().toTuple(),
+            self.isSelected(),
+            self.palette().cacheKey(),
+            scale,
+        )
+        pixmap = self.render_cache.get(key)
+        if pixmap is None:
+            pixmap = self.renderPixmap(scale, widget)
+            self.render_cache.insert(key, pixmap)
+        return pixmap
+
+    def renderPixmap(self, scale: float, widget=None):
+        rect = self.rect()
+        pixmap = QtGui.QPixmap(
+            math.ceil(rect.width() * scale), math.ceil(rect.height() * scale)
+        )
+        pixmap.fill(QtCore.Qt.GlobalColor.transparent)
+
+        painter = QtGui.QPainter(pixmap)
+        painter.setRenderHint(painter.RenderHint.Antialiasing, True)
+        painter.setRenderHint(painter.RenderHint.TextAntialiasing, True)
+        painter.scale(scale, scale)
+        painter.translate(-rect.topLeft())
+
+        option = QtWidgets.QStyleOptionGraphicsItem()
+        option.exposedRect = rect
+        self.paintContents(painter, option, widget)
+        painter.end()
+        return pixmap
+
+    def paintContents(self, painter, option, widget=...):
+        """
+        Paint the node body followed by its title, port labels and ports.
+        """
+        palette = self.palette()
+        layout = self.nodeLayout()
+        level = detail_level(painter, option, widget)
+
+        painter.save()
         painter.setPen(QtCore.Qt.PenStyle.NoPen)
-        painter.drawRect(title_rect)
+        painter.setBrush(palette.brush(palette.ColorRole.Midlight))
+        painter.drawPath(layout.body_path)
+        painter.setBrush(palette.brush(palette.ColorRole.Accent))
+        painter.drawPath(layout.title_path)
 
         if self.isSelected():
             painter.setOpacity(0.5)
             painter.setPen(
                 QtGui.QPen(
-                    self.palette().color(self.palette().ColorRole.BrightText),
+                    palette.color(palette.ColorRole.BrightText),
                     2,
                     QtCore.Qt.PenStyle.DotLine,
                 )
             )
             painter.setBrush(QtCore.Qt.BrushStyle.NoBrush)
-            painter.drawRoundedRect(self.rect(), 10, 10)
+            painter.drawPath(layout.body_path)
         else:
             pen = QtGui.QColor(0, 0, 0, 64)
             painter.setPen(pen)
             painter.setBrush(QtCore.Qt.BrushStyle.NoBrush)
-            painter.drawRoundedRect(self.rect(), 10, 10)
+            painter.drawPath(layout.body_path)
+        painter.restore()
+
+        if level == DetailLevel.Full:
+            self.paintLabels(painter)
+        self.paintPorts(painter, level)
+
+    def paintLabels(self, painter):
+        layout = self.nodeLayout()
+        alignment = Alignment.AlignTop | Alignment.AlignHCenter
+        painter.setPen(self.palette().color(QtGui.QPalette.ColorRole.Text))
+        painter.setFont(self.font())
+        painter.drawText(layout.title_rect, self.__name, alignment)
+        for port in self.iterPorts():
+            painter.drawText(self.portLayout(port).label_rect, port.name(), alignment)
+
+    def paintPorts(self, painter, level: DetailLevel):
+        for port in self.iterPorts():
+            rect = self.portLayout(port).rect
+            color = port.color()
+            if level == DetailLevel.Shapes:
+                painter.setPen(QtGui.QPen(color, 0))
+                painter.drawPoint(rect.center())
+            else:
+                painter.setPen(color.lighter(150))
+                painter.setBrush(color)
+                painter.drawEllipse(rect)
+
+    def inputPort(self, name: str) -> InputPort:
+        return self.__inputs[name]
+
+    def outputPort(self, name: str) -> OutputPort:
+        return self.__outputs[name]
 
     def iterInputs(self):
-        for _, port, _ in self.__inputs.values():
-            yield port
+        yield from self.__inputs.values()
 
     def iterOutputs(self):
-        for _, port, _ in self.__outputs.values():
-            yield port
+        yield from self.__outputs.values()
+
+    def iterPorts(self):
+        yield from self.__inputs.values()
+        yield from self.__outputs.values()
@@ -0,0 +1,138 @@
+"""
+Compiled execution plans.
+
+An ExecutionPlan flattens the part of a graph needed for some set of nodes into
+straight line python source, one call per node with every port binding resolved
+to a local variable, which is compiled once and reused until the structure of
+the model changes.
+"""
+
+__all__ = ["ExecutionPlan", "CompiledEvaluator"]
+
+import keyword
+import typing
+
+from QtNodes.evaluation import ComputeError, Evaluator
+from QtNodes.model import GraphModel, PortKey
+
+if typing.TYPE_CHECKING:
+    from QtNodes.factory import NodeFactory
+
+
+def _call_arguments(names: typing.Dict[str, str]):
+    simple = []
+    other = []
+    for name, variable in names.items():
+        if name.isidentifier() and not keyword.iskeyword(name):
+            simple.append(f"{name}={variable}")
+        else:
+            other.append(f"{name!r}: {variable}")
+    if other:
+        simple.append("**{" + ", ".join(other) + "}")
+    return ", ".join(simple)
+
+
+class ExecutionPlan:
+    def __init__(self, evaluator: Evaluator, node_ids: typing.Iterable[int]):
+        model = evaluator.model
+        self.revision = model.revision()
+        self.order = evaluator.schedule(node_ids)
+        self.functions: typing.List[typing.Callable] = []
+        self.constants: typing.List[PortKey] = []
+        # (node id, output port) for every value the plan returns, in order.
+        self.outputs: typing.List[tuple[int, str]] = []
+
+        slots: typing.Dict[tuple[int, str], str] = {}
+        lines = ["def run(functions, constants):"]
+        if self.order:
+            names = "".join(f"f{i}, " for i in range(len(self.order)))
+            lines.append(f"    {names}= functions")
+
+        for index, node_id in enumerate(self.order):
+            record = model.node(node_id)
+            self.functions.append(evaluator.computeFunction(record))
+
+            arguments = {}
+            for name in record.inputs:
+                key = record.inputKey(name)
+                edges = model.portEdges(key)
+                if edges:
+                    edge = edges[0]
+                    arguments[name] = slots[(edge.output_node, edge.output_port)]
+                else:
+                    arguments[name] = f"constants[{len(self.constants)}]"
+                    self.constants.append(key)
+
+            call = f"f{index}({_call_arguments(arguments)})"
+            if len(record.outputs) == 1:
+                (port,) = record.outputs
+                variable = slots[(node_id, port)] = f"s{len(self.outputs)}"
+                self.outputs.append((node_id, port))
+                lines.append(f"    {variable} = {call}")
+            else:
+                lines.append(f"    r = {call}")
+                lines.append("    if not isinstance(r, dict):")
+                lines.append(f"        fail(order[{index}])")
+                for port in record.outputs:
+                    variable = slots[(node_id, port)] = f"s{len(self.outputs)}"
+                    self.outputs.append((node_id, port))
+                    lines.append(f"    {variable} = r.get({port!r})")
+
+        returned = "".join(f"s{i}, " for i in range(len(self.outputs)))
+        lines.append(f"    return ({returned})")
+        self.source = "\n".join(lines)
+
+        namespace = {"order": self.order, "fail": self.__fail}
+        exec(compile(self.source, "<qtnodes execution plan>", "exec"), namespace)
+        self.__run = namespace["run"]
+
+    def __fail(self, node_id: int):
+        raise ComputeError(
+            node_id, "node types with several outputs must return a dict"
+        )
+
+    def isValid(self, model: GraphModel):
+        return self.revision == model.revision()
+
+    def run(self, evaluator: Evaluator):
+        constants = [
+            evaluator.inputValue(key.node_id, key.name) for key in self.constants
+        ]
+        values = self.__run(self.functions, constants)
+
+        results: typing.Dict[int, typing.Dict[str, typing.Any]] = {}
+        for (node_id, port), value in zip(self.outputs, values):
+            results.setdefault(node_id, {})[port] = value
+        return results
+
+
+class CompiledEvaluator(Evaluator):
+    """
+    An Evaluator which compiles an ExecutionPlan per set of requested nodes and
+    reuses it until nodes or connections are added or removed. Call invalidate()
+    after changing a node type's compute callable.
+    """
+
+    def __init__(self, model: GraphModel, factory: "NodeFactory"):
+        super().__init__(model, factory)
+        self.__plans: typing.Dict[frozenset, ExecutionPlan] = {}
+
+    def invalidate(self):
+        self.__plans.clear()
+
+    def plan(self, node_ids: typing.Iterable[int]) -> ExecutionPlan:
+        key = frozenset(node_ids)
+        plan = self.__plans.get(key)
+        if plan is None or not plan.isValid(self.model):
+            if plan is not None:
+                self.__plans.clear()
+            plan = self.__plans[key] = ExecutionPlan(self, key)
+        return plan
+
+    def evaluate(
+        self,
+        node_ids: typing.Iterable[int] | None = None,
+    ) -> typing.Dict[int, typing.Dict[str, typing.Any]]:
+        if node_ids is None:
+            node_ids = [r.id for r in self.model.nodes()]
+        return self.plan(node_ids).run(self)
@@ -1,34 +1,47 @@
 __all__ = ["PortItem", "InputPort", "OutputPort"]
 
 import typing
-import weakref
 
-from qtpy import QtGui, QtCore
+from qtpy import QtGui, QtCore, QtWidgets
 
-from QtNodes.base import SceneItemBase
 from QtNodes.connection import ConnectionItem
 
 if typing.TYPE_CHECKING:
     from QtNodes.node import NodeItem
 
 
-class PortItem(SceneItemBase):
-    def __init__(self, name: str, datatype: str, node: "NodeItem", parent=None):
-        super().__init__(parent=parent)
-        self.setFlag(self.GraphicsItemFlag.ItemSendsScenePositionChanges)
+class PortItem:
+    """
+    A handle to one of a node's ports.
+
+    Ports are not scene items, the node positions and paints them from its shared
+    NodeLayout, so a port only holds its own identity, colour and connections.
+    """
+
+    __slots__ = (
+        "__name",
+        "__datatype",
+        "__node",
+        "__index",
+        "__color",
+        "__connections",
+    )
+
+    def __init__(self, name: str, datatype: str, node: "NodeItem"):
         self.__name = name
         self.__node = node
-        self.__radius = 8.0
         self.__datatype = datatype
-        self.__connections: weakref.WeakSet[ConnectionItem] = weakref.WeakSet()
-        self.__size = QtCore.QSizeF(self.__radius * 2, self.__radius * 2)
-        self.__pen = self.palette().color(self.palette().ColorRole.Dark)
-        self.__color = self.palette().color(self.palette().ColorRole.Midlight)
+        self.__index = -1
+        self.__color: QtGui.QColor | None = None
+        self.__connections: typing.Dict[ConnectionItem, None] = {}
 
     def setColor(self, color: QtGui.QColor):
         self.__color = color
 
     def color(self):
+        if self.__color is None:
+            palette = QtWidgets.QApplication.palette()
+            return palette.color(palette.ColorRole.Midlight)
         return self.__color
 
     def name(self):
@@ -37,41 +50,39 @@ class PortItem(SceneItemBase):
     def datatype(self):
         return self.__datatype
 
-    def default(self):
-        return self.__default
+    def index(self):
+        """
+        The port's row among the node's inputs or outputs.
+        """
+        return self.__index
+
+    def setIndex(self, index: int):
+        self.__index = index
 
     def addConnection(self, connection: "ConnectionItem"):
-        self.__connections.add(connection)
+        self.__connections[connection] = None
 
     def removeConnection(self, connection: "ConnectionItem"):
-        self.__connections.remove(connection)
+        del self.__connections[connection]
 
     def connections(self):
         return tuple(self.__connections)
 
     def iterConnections(self):
-        yield from self.__connections
+        yield from tuple(self.__connections)
 
     def numConnections(self):
         return len(self.__connections)
 
-    def itemChange(self, change, value):
-        if change == self.GraphicsItemChange.ItemScenePositionHasChanged:
-            for connection in self.__connections:
-                connection.layout()
-        return super().itemChange(change, value)
-
-    def sizeHint(self, which, constraint=...):
-        return self.__size
+    def anchor(self) -> QtCore.QPointF:
+        """
+        The scene space point connections attach to.
+        """
+        return self.__node.portAnchor(self)
 
     def node(self):
         return self.__node
 
-    def paint(self, painter, option, widget=...):
-        painter.setPen(self.__color.lighter(150))
-        painter.setBrush(self.__color)
-        painter.drawEllipse(self.rect())
-
     def canConnectTo(self, port: "PortItem"):
         if port is self:
             return False
@@ -88,11 +99,13 @@ class PortItem(SceneItemBase):
         return {
             "name": self.__name,
             "datatype": self.__datatype,
-            "color": self.__color,
+            "color": self.color().name(QtGui.QColor.NameFormat.HexArgb),
         }
 
 
 class InputPort(PortItem):
+    __slots__ = ()
+
     def canConnectTo(self, port: "PortItem"):
         if not super().canConnectTo(port):
             return False
@@ -104,6 +117,8 @@ class InputPort(PortItem):
 
 
 class OutputPort(PortItem):
+    __slots__ = ()
+
     def canConnectTo(self, port: "PortItem"):
         if not super().canConnectTo(port):
             return False
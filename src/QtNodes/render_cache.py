@@ -0,0 +1,78 @@
+__all__ = ["MAX_ZOOM_BUCKET", "RenderCache", "node_render_cache", "zoom_bucket"]
+
+import collections
+import math
+import typing
+
+from qtpy import QtGui
+
+# the largest zoom level images are cached at, past it they'd be scaled up.
+MAX_ZOOM_BUCKET = 4.0
+
+
+def zoom_bucket(scale: float, minimum: float = 0.125, maximum: float = MAX_ZOOM_BUCKET):
+    """
+    Snap a zoom level to a half power of two, so nearby zoom levels share images.
+    """
+    scale = min(max(scale, minimum), maximum)
+    return 2 ** (round(math.log2(scale) * 2) / 2)
+
+
+class RenderCache:
+    """
+    A least recently used cache of pixmaps with a memory budget.
+
+    Unlike QGraphicsItem.DeviceCoordinateCache entries are keyed by what is drawn
+    rather than by item, so every node of a given type shares one image.
+    """
+
+    def __init__(self, budget: int = 64 * 1024 * 1024):
+        self.__budget = budget
+        self.__size = 0
+        self.__entries: collections.OrderedDict[typing.Hashable, QtGui.QPixmap] = (
+            collections.OrderedDict()
+        )
+
+    @staticmethod
+    def cost(pixmap: QtGui.QPixmap):
+        return pixmap.width() * pixmap.height() * max(pixmap.depth(), 8) // 8
+
+    def budget(self):
+        return self.__budget
+
+    def setBudget(self, budget: int):
+        self.__budget = budget
+        self.evict()
+
+    def size(self):
+        return self.__size
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def get(self, key: typing.Hashable) -> QtGui.QPixmap | None:
+        pixmap = self.__entries.get(key)
+        if pixmap is not None:
+            self.__entries.move_to_end(key)
+        return pixmap
+
+    def insert(self, key: typing.Hashable, pixmap: QtGui.QPixmap):
+        previous = self.__entries.pop(key, None)
+        if previous is not None:
+            self.__size -= self.cost(previous)
+
+        self.__entries[key] = pixmap
+        self.__size += self.cost(pixmap)
+        self.evict()
+
+    def evict(self):
+        while self.__size > self.__budget and self.__entries:
+            _, pixmap = self.__entries.popitem(last=False)
+            self.__size -= self.cost(pixmap)
+
+    def clear(self):
+        self.__entries.clear()
+        self.__size = 0
+
+
+node_render_cache = RenderCache()
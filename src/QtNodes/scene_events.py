@@ -1,59 +1,235 @@
+import dataclasses
 import enum
 import typing
 import uuid
 
 from qtpy import QtCore, QtWidgets, QtGui
 
-from QtNodes.connection import ConnectionItem, LineItem
+from QtNodes.connection import ConnectionItem, LineItem, layout_queue
 from QtNodes.port import PortItem
-from QtNodes.node import NodeItem, TitleItem
+from QtNodes.instrumentation import probe
+from QtNodes.node import NodeItem
+from QtNodes.render_cache import zoom_bucket
+from QtNodes.spatial import scene_index
 
 
-class SceneEventFilter(QtCore.QObject):
-    def eventFilter(
-        self,
-        watched: QtWidgets.QGraphicsScene,
-        event: QtWidgets.QGraphicsSceneEvent,
-    ):
-        EventTypes = QtWidgets.QGraphicsSceneMouseEvent.Type
-        if not isinstance(event, QtWidgets.QGraphicsSceneMouseEvent):
-            return False
+class HitKind(enum.Enum):
+    Empty = enum.auto()
+    Port = enum.auto()
+    Connection = enum.auto()
+    Node = enum.auto()
 
-        if event.type() == EventTypes.GraphicsSceneMousePress:
-            return self.mousePress(watched, event)
-        elif event.type() == EventTypes.GraphicsSceneMouseMove:
-            return self.mouseMove(watched, event)
-        elif event.type() == EventTypes.GraphicsSceneMouseRelease:
-            return self.mouseRelease(watched, event)
 
-        return False
+@dataclasses.dataclass(frozen=True)
+class SceneHit:
+    kind: HitKind
+    item: QtWidgets.QGraphicsItem | None = None
 
-    def mousePress(
+
+class Interaction(QtCore.QObject):
+    """
+    A mouse interaction started by a press on something in the scene.
+
+    press returns True to take the interaction, the router then sends it every
+    move and the release until the interaction finishes.
+    """
+
+    def press(
         self,
         scene: QtWidgets.QGraphicsScene,
         event: QtWidgets.QGraphicsSceneMouseEvent,
+        hit: SceneHit,
     ):
+        return False
 
+    def move(
+        self,
+        scene: QtWidgets.QGraphicsScene,
+        event: QtWidgets.QGraphicsSceneMouseEvent,
+    ):
         return False
 
-    def mouseMove(
+    def release(
         self,
         scene: QtWidgets.QGraphicsScene,
         event: QtWidgets.QGraphicsSceneMouseEvent,
     ):
+        return False
+
+    def reset(self):
+        pass
+
+
+class SceneEventRouter(QtCore.QObject):
+    """
+    The single event filter on a scene.
+
+    A press is hit-tested once and offered to the interactions registered for
+    what was hit, in order. Presses on empty space are left to the view, which
+    starts its rubber band or hand scroll. While no interaction is active every
+    other event is passed straight through.
+    """
+
+    # scene distance from a port anchor which counts as clicking the port.
+    port_radius = 8.0
+
+    def __init__(self, parent=None):
+        super().__init__(parent=parent)
+        self.__routes: typing.Dict[HitKind, typing.List[Interaction]] = {}
+        self.__active: Interaction | None = None
+
+    def register(self, kind: HitKind, interaction: Interaction):
+        self.__routes.setdefault(kind, []).append(interaction)
+
+    def activeInteraction(self):
+        return self.__active
+
+    def hitTest(self, scene: QtWidgets.QGraphicsScene, pos: QtCore.QPointF):
+        """
+        What a press at pos hits, following the scene's stacking order. A port
+        counts as part of its node but wins over the node's body and its own
+        connections, so only another node or connection stacked above hides it.
+        """
+        # connections moved since the last frame aren't in the index yet
+        layout_queue.flush()
+        index = scene_index(scene)
+        # candidates by the top level item they belong to, in priority order
+        hits: typing.Dict[QtWidgets.QGraphicsItem, SceneHit] = {}
+
+        port = index.portAt(pos, self.port_radius)
+        if port is not None:
+            hits[port.node()] = SceneHit(HitKind.Port, port)
+
+        item = scene.itemAt(pos, QtGui.QTransform())
+        if item is not None and isinstance(item.topLevelItem(), NodeItem):
+            node = item.topLevelItem()
+            hits.setdefault(node, SceneHit(HitKind.Node, node))
+
+        connection = index.connectionAt(pos)
+        if connection is not None and (
+            port is None or connection not in port.iterConnections()
+        ):
+            hits[connection] = SceneHit(HitKind.Connection, connection)
+
+        if len(hits) == 1:
+            return next(iter(hits.values()))
+        if hits:
+            return self.__topmostHit(scene, pos, hits)
+
+        return SceneHit(HitKind.Empty)
+
+    def __topmostHit(
+        self,
+        scene: QtWidgets.QGraphicsScene,
+        pos: QtCore.QPointF,
+        hits: typing.Dict[QtWidgets.QGraphicsItem, SceneHit],
+    ):
+        r = self.port_radius
+        area = QtCore.QRectF(pos.x() - r, pos.y() - r, 2 * r, 2 * r)
+        for item in scene.items(
+            area,
+            QtCore.Qt.ItemSelectionMode.IntersectsItemBoundingRect,
+            QtCore.Qt.SortOrder.DescendingOrder,
+        ):
+            hit = hits.get(item.topLevelItem())
+            if hit is not None:
+                return hit
+        # only reached if the scene's index is out of date, fall back on priority
+        return next(iter(hits.values()))
+
+    @probe
+    def eventFilter(
+        self,
+        watched: QtWidgets.QGraphicsScene,
+        event: QtCore.QEvent,
+    ):
+        event_type = event.type()
+        if event_type == QtCore.QEvent.Type.GraphicsSceneMousePress:
+            return self.mousePress(watched, event)
+
+        active = self.__active
+        if active is None:
+            return False
+
+        if event_type == QtCore.QEvent.Type.GraphicsSceneMouseMove:
+            return active.move(watched, event)
+        elif event_type == QtCore.QEvent.Type.GraphicsSceneMouseRelease:
+            self.__active = None
+            return active.release(watched, event)
 
         return False
 
-    def mouseRelease(
+    def mousePress(
         self,
         scene: QtWidgets.QGraphicsScene,
         event: QtWidgets.QGraphicsSceneMouseEvent,
     ):
+        if self.__active is not None:
+            self.__active.reset()
+            self.__active = None
+
+        hit = self.hitTest(scene, event.scenePos())
+        for interaction in self.__routes.get(hit.kind, ()):
+            if interaction.press(scene, event, hit):
+                self.__active = interaction
+                event.accept()
+                return True
 
         return False
 
 
-class NodeEventFilter(SceneEventFilter):
+class ClonePreviewItem(QtWidgets.QGraphicsItem):
+    """
+    One item standing in for every node being cloned while the drag is in progress.
+
+    The first max_image_nodes nodes are drawn from the node render cache, the
+    rest as a single outline path. Past max_outline_nodes only the bounds of the
+    selection are drawn, so the preview costs the same for any selection size.
+    """
+
+    max_image_nodes = 64
+    max_outline_nodes = 4096
+
+    def __init__(self, nodes: typing.Sequence[NodeItem], parent=None):
+        super().__init__(parent)
+        self.setOpacity(0.6)
+        self.setZValue(1)
+
+        self.__images = []
+        self.__outline = QtGui.QPainterPath()
+        self.__bounds = QtCore.QRectF()
+        for i, node in enumerate(nodes):
+            rect = node.mapRectToScene(node.rect())
+            self.__bounds = self.__bounds.united(rect)
+            if i < self.max_image_nodes:
+                self.__images.append((node, rect))
+            elif i < self.max_outline_nodes:
+                self.__outline.addRoundedRect(rect, 10, 10)
+
+        if len(nodes) > self.max_outline_nodes:
+            self.__outline.addRect(self.__bounds)
+
+    def boundingRect(self):
+        return self.__bounds.adjusted(-1, -1, 1, 1)
+
+    def paint(self, painter, option, widget=...):
+        scale = option.levelOfDetailFromTransform(painter.worldTransform())
+        if isinstance(widget, QtWidgets.QWidget):
+            scale *= widget.devicePixelRatioF()
+        scale = zoom_bucket(scale)
+
+        painter.setRenderHint(painter.RenderHint.SmoothPixmapTransform, True)
+        for node, rect in self.__images:
+            pixmap = node.cachedPixmap(scale, widget)
+            painter.drawPixmap(rect, pixmap, QtCore.QRectF(pixmap.rect()))
+
+        palette = QtWidgets.QApplication.palette()
+        painter.setPen(QtGui.QPen(palette.color(palette.ColorRole.BrightText), 0))
+        painter.setBrush(palette.brush(palette.ColorRole.Midlight))
+        painter.drawPath(self.__outline)
+
+
+class NodeInteraction(Interaction):
     requestMoveNodes = QtCore.Signal(list, QtCore.QPointF, str)
     requestCloneNodes = QtCore.Signal(list, list)
 
@@ -69,45 +245,26 @@ class NodeEventFilter(SceneEventFilter):
         self.operation_id: str | None = None
         self.clicked_item: NodeItem | None = None
         self.nodes: set[NodeItem] = set()
-        self.preview_items: list[QtWidgets.QGraphicsPixmapItem] = []
-
-    def snapshotNode(self, node: NodeItem, oversample: float = 1.0):
-        bounds = node.mapRectToScene(
-            node.boundingRect().united(node.childrenBoundingRect())
-        )
-        pixmap = QtGui.QPixmap(bounds.size().toSize() * oversample)
-        pixmap.fill(QtCore.Qt.GlobalColor.transparent)
-        painter = QtGui.QPainter(pixmap)
-        painter.setRenderHint(painter.RenderHint.Antialiasing, True)
-        painter.setRenderHint(painter.RenderHint.TextAntialiasing, True)
-        painter.setRenderHint(painter.RenderHint.SmoothPixmapTransform, True)
-
-        node.scene().render(painter, QtCore.QRectF(pixmap.rect()), bounds)
-        painter.end()
-        return pixmap
+        self.preview: ClonePreviewItem | None = None
 
     def reset(self):
-        for item in self.preview_items:
-            if not item.scene():
-                continue
-            item.scene().removeItem(item)
+        if self.preview is not None and self.preview.scene() is not None:
+            self.preview.scene().removeItem(self.preview)
 
-        self.preview_items.clear()
+        self.preview = None
 
         self.mode = self.Mode.Idle
         self.nodes.clear()
 
-    def mousePress(
+    def press(
         self,
         scene: QtWidgets.QGraphicsScene,
         event: QtWidgets.QGraphicsSceneMouseEvent,
+        hit: SceneHit,
     ):
         self.reset()
 
-        item = scene.itemAt(event.scenePos(), QtGui.QTransform())
-        if not isinstance(item, NodeItem):
-            return False
-
+        item = hit.item
         self.clicked_item = item
         self.mode = self.Mode.AwaitingDrag
         self.operation_id = uuid.uuid4().hex
@@ -126,7 +283,7 @@ class NodeEventFilter(SceneEventFilter):
 
         return True
 
-    def mouseMove(
+    def move(
         self,
         scene: QtWidgets.QGraphicsScene,
         event: QtWidgets.QGraphicsSceneMouseEvent,
@@ -137,11 +294,8 @@ class NodeEventFilter(SceneEventFilter):
         elif self.mode == self.Mode.AwaitingDrag:
             if event.modifiers() & QtCore.Qt.KeyboardModifier.ControlModifier:
                 self.mode = self.Mode.Cloning
-                for node in self.nodes:
-                    item = QtWidgets.QGraphicsPixmapItem(self.snapshotNode(node))
-                    item.setPos(node.scenePos())
-                    self.preview_items.append(item)
-                    scene.addItem(item)
+                self.preview = ClonePreviewItem(self.nodes)
+                scene.addItem(self.preview)
             else:
                 self.mode = self.Mode.Moving
 
@@ -151,12 +305,11 @@ class NodeEventFilter(SceneEventFilter):
             self.requestMoveNodes.emit(self.nodes, delta, self.operation_id)
             return True
         elif self.mode == self.Mode.Cloning:
-            for item in self.preview_items:
-                item.moveBy(*delta.toTuple())
+            self.preview.moveBy(*delta.toTuple())
 
         return False
 
-    def mouseRelease(
+    def release(
         self,
         scene: QtWidgets.QGraphicsScene,
         event: QtWidgets.QGraphicsSceneMouseEvent,
@@ -171,8 +324,9 @@ class NodeEventFilter(SceneEventFilter):
 
             result = True
         elif self.mode == self.Mode.Cloning:
+            offset = self.preview.pos()
             self.requestCloneNodes.emit(
-                self.nodes.copy(), [i.scenePos() for i in self.preview_items]
+                self.nodes.copy(), [n.scenePos() + offset for n in self.nodes]
             )
             result = True
 
@@ -184,38 +338,53 @@ class NodeEventFilter(SceneEventFilter):
         return result
 
 
-class ConnectionEventFilter(SceneEventFilter):
+class ConnectionInteraction(Interaction):
     requestCreateConnection = QtCore.Signal(PortItem, PortItem)
     requestRemoveConnection = QtCore.Signal(ConnectionItem)
 
+    # scene distance from a port anchor within which a dragged connection snaps
+    # to a compatible port.
+    snap_radius = 24.0
+
     def __init__(self, parent=None):
         super().__init__(parent=parent)
         self.__preview_line = LineItem()
         self.__active_port: typing.Optional[PortItem] = None
         self.__active_connection: typing.Optional[ConnectionItem] = None
 
-    def mousePress(
+    def snapTarget(self, scene: QtWidgets.QGraphicsScene, pos: QtCore.QPointF):
+        """
+        The nearest port the active port can connect to, within snap_radius of pos.
+        """
+        return scene_index(scene).portAt(
+            pos, self.snap_radius, self.__active_port.canConnectTo
+        )
+
+    def reset(self):
+        if self.__preview_line.scene() is not None:
+            self.__preview_line.scene().removeItem(self.__preview_line)
+        self.__active_port = None
+        self.__active_connection = None
+
+    def press(
         self,
         scene: QtWidgets.QGraphicsScene,
         event: QtWidgets.QGraphicsSceneMouseEvent,
+        hit: SceneHit,
     ):
-        item = scene.itemAt(event.scenePos(), QtGui.QTransform())
-        if isinstance(item, PortItem):
-            self.__active_port = item
-
-        elif isinstance(item, ConnectionItem):
-            self.__active_connection = item
-            d1 = (
-                event.scenePos() - item.outputPort().sceneBoundingRect().center()
-            ).manhattanLength()
-            d2 = (
-                event.scenePos() - item.inputPort().sceneBoundingRect().center()
-            ).manhattanLength()
+        if hit.kind == HitKind.Port:
+            self.__active_port = hit.item
+
+        elif hit.kind == HitKind.Connection:
+            connection = hit.item
+            self.__active_connection = connection
+            d1 = (event.scenePos() - connection.outputPort().anchor()).manhattanLength()
+            d2 = (event.scenePos() - connection.inputPort().anchor()).manhattanLength()
 
             if d1 > d2:
-                self.__active_port = item.outputPort()
+                self.__active_port = connection.outputPort()
             else:
-                self.__active_port = item.inputPort()
+                self.__active_port = connection.inputPort()
 
         else:
             return False
@@ -223,13 +392,13 @@ class ConnectionEventFilter(SceneEventFilter):
         scene.addItem(self.__preview_line)
 
         self.__preview_line.setLine(
-            *self.__active_port.sceneBoundingRect().center().toTuple(),
+            *self.__active_port.anchor().toTuple(),
             *event.scenePos().toTuple()
         )
 
         return True
 
-    def mouseMove(
+    def move(
         self,
         scene: QtWidgets.QGraphicsScene,
         event: QtWidgets.QGraphicsSceneMouseEvent,
@@ -241,30 +410,29 @@ class ConnectionEventFilter(SceneEventFilter):
             self.requestRemoveConnection.emit(self.__active_connection)
             self.__active_connection = None
 
+        target = self.snapTarget(scene, event.scenePos())
+        end = target.anchor() if target is not None else event.scenePos()
         self.__preview_line.setLine(
-            *self.__active_port.sceneBoundingRect().center().toTuple(),
-            *event.scenePos().toTuple()
+            *self.__active_port.anchor().toTuple(),
+            *end.toTuple()
         )
 
         return False
 
-    def mouseRelease(
+    def release(
         self,
         scene: QtWidgets.QGraphicsScene,
         event: QtWidgets.QGraphicsSceneMouseEvent,
     ):
-
-        if self.__preview_line.scene() is scene:
-            scene.removeItem(self.__preview_line)
-
         if not self.__active_port:
+            self.reset()
             return False
 
-        port_b = scene.itemAt(event.scenePos(), QtGui.QTransform())
+        port_b = self.snapTarget(scene, event.scenePos())
 
-        if isinstance(port_b, PortItem):
+        if port_b is not None:
             self.requestCreateConnection.emit(self.__active_port, port_b)
 
-        self.__active_port = None
+        self.reset()
 
         return True
@@ -0,0 +1,410 @@
+"""
+Versioned save/load of a GraphModel.
+
+Two flavours share the same schema. The JSON flavour is one node per line so it
+diffs well, the binary flavour interns every string into a table and stores node
+positions and edge lists as packed arrays so large graphs load quickly.
+
+A third, streaming, flavour writes a header line followed by one JSON document
+per node and edge, so it can be read and applied a line at a time.
+
+Node port signatures are stored once per node type, so a file can be loaded and
+processed headless without a NodeFactory.
+"""
+
+__all__ = [
+    "SCHEMA_VERSION",
+    "graph_to_dict",
+    "graph_from_dict",
+    "to_json",
+    "from_json",
+    "to_binary",
+    "from_binary",
+    "save",
+    "save_stream",
+    "load",
+    "iter_load",
+]
+
+import array
+import json
+import struct
+import sys
+import typing
+
+from QtNodes.model import GraphModel
+
+SCHEMA_VERSION = 1
+BINARY_MAGIC = b"QTNG"
+NO_STRING = 0xFFFFFFFF
+
+
+def _check_version(version: int):
+    if version > SCHEMA_VERSION:
+        raise ValueError(
+            f"graph schema version {version} is newer than supported "
+            f"version {SCHEMA_VERSION}"
+        )
+
+
+def _node_types(model: GraphModel):
+    types = {}
+    for record in model.nodes():
+        signature = {
+            "category": record.category,
+            "inputs": record.inputs,
+            "outputs": record.outputs,
+        }
+        existing = types.setdefault(record.type_name, signature)
+        if existing != signature:
+            raise ValueError(f"conflicting port signatures for {record.type_name!r}")
+    return types
+
+
+def graph_to_dict(model: GraphModel) -> dict:
+    return {
+        "version": SCHEMA_VERSION,
+        "types": _node_types(model),
+        "nodes": [
+            {"id": n.id, "type": n.type_name, "x": n.x, "y": n.y}
+            for n in model.nodes()
+        ],
+        "edges": [
+            [e.id, e.output_node, e.output_port, e.input_node, e.input_port]
+            for e in model.edges()
+        ],
+    }
+
+
+def graph_from_dict(data: dict, model: GraphModel = None) -> GraphModel:
+    _check_version(data["version"])
+    model = model if model is not None else GraphModel()
+
+    types = data["types"]
+    for node in data["nodes"]:
+        signature = types[node["type"]]
+        model.addNode(
+            node["type"],
+            signature["inputs"],
+            signature["outputs"],
+            node["x"],
+            node["y"],
+            category=signature["category"],
+            node_id=node["id"],
+        )
+
+    for edge_id, output_node, output_port, input_node, input_port in data["edges"]:
+        model.addEdge(output_node, output_port, input_node, input_port, edge_id)
+
+    return model
+
+
+def to_json(model: GraphModel) -> str:
+    data = graph_to_dict(model)
+    lines = [
+        "{",
+        f'"version": {data["version"]},',
+        f'"types": {json.dumps(data["types"], sort_keys=True)},',
+        '"nodes": [',
+        ",\n".join(json.dumps(n) for n in data["nodes"]),
+        "],",
+        '"edges": [',
+        ",\n".join(json.dumps(e) for e in data["edges"]),
+        "]",
+        "}",
+    ]
+    return "\n".join(lines)
+
+
+def from_json(text: str, model: GraphModel = None) -> GraphModel:
+    return graph_from_dict(json.loads(text), model)
+
+
+class _StringTable:
+    def __init__(self):
+        self.strings: typing.List[str] = []
+        self.indexes: typing.Dict[str, int] = {}
+
+    def intern(self, value: str | None):
+        if value is None:
+            return NO_STRING
+        index = self.indexes.get(value)
+        if index is None:
+            index = self.indexes[value] = len(self.strings)
+            self.strings.append(value)
+        return index
+
+
+def _pack_array(typecode: str, values) -> bytes:
+    packed = array.array(typecode, values)
+    if sys.byteorder != "little":
+        packed.byteswap()
+    return struct.pack("<I", len(packed)) + packed.tobytes()
+
+
+class _Reader:
+    def __init__(self, data: bytes):
+        self.data = memoryview(data)
+        self.offset = 0
+
+    def unpack(self, fmt: str):
+        values = struct.unpack_from(fmt, self.data, self.offset)
+        self.offset += struct.calcsize(fmt)
+        return values
+
+    def array(self, typecode: str):
+        (count,) = self.unpack("<I")
+        values = array.array(typecode)
+        end = self.offset + count * values.itemsize
+        values.frombytes(self.data[self.offset : end])
+        if sys.byteorder != "little":
+            values.byteswap()
+        self.offset = end
+        return values
+
+
+def to_binary(model: GraphModel) -> bytes:
+    strings = _StringTable()
+    types = _node_types(model)
+
+    type_indexes = {}
+    type_table = []
+    for type_name, signature in types.items():
+        type_indexes[type_name] = len(type_indexes)
+        type_table.append(strings.intern(type_name))
+        type_table.append(strings.intern(signature["category"]))
+        for ports in (signature["inputs"], signature["outputs"]):
+            type_table.append(len(ports))
+            for name, datatype in ports.items():
+                type_table.append(strings.intern(name))
+                type_table.append(strings.intern(datatype))
+
+    nodes = list(model.nodes())
+    edges = list(model.edges())
+
+    positions = []
+    for node in nodes:
+        positions.append(node.x)
+        positions.append(node.y)
+
+    body = [
+        _pack_array("I", type_table),
+        _pack_array("q", [n.id for n in nodes]),
+        _pack_array("I", [type_indexes[n.type_name] for n in nodes]),
+        _pack_array("d", positions),
+        _pack_array("q", [e.id for e in edges]),
+        _pack_array("q", [e.output_node for e in edges]),
+        _pack_array("I", [strings.intern(e.output_port) for e in edges]),
+        _pack_array("q", [e.input_node for e in edges]),
+        _pack_array("I", [strings.intern(e.input_port) for e in edges]),
+    ]
+
+    encoded = [s.encode("utf-8") for s in strings.strings]
+    header = [
+        BINARY_MAGIC,
+        struct.pack("<HI", SCHEMA_VERSION, len(encoded)),
+        _pack_array("I", [len(s) for s in encoded]),
+        b"".join(encoded),
+    ]
+    return b"".join(header + body)
+
+
+def from_binary(data: bytes, model: GraphModel = None) -> GraphModel:
+    if data[:4] != BINARY_MAGIC:
+        raise ValueError("not a binary graph file")
+
+    model = model if model is not None else GraphModel()
+    reader = _Reader(data)
+    reader.offset = len(BINARY_MAGIC)
+
+    version, _ = reader.unpack("<HI")
+    _check_version(version)
+
+    strings = []
+    for length in reader.array("I"):
+        end = reader.offset + length
+        strings.append(str(reader.data[reader.offset : end], "utf-8"))
+        reader.offset = end
+
+    def string(index):
+        return None if index == NO_STRING else strings[index]
+
+    type_table = iter(reader.array("I"))
+    types = []
+    for type_index in type_table:
+        category = string(next(type_table))
+        ports = []
+        for _ in range(2):
+            count = next(type_table)
+            ports.append(
+                {
+                    strings[next(type_table)]: strings[next(type_table)]
+                    for _ in range(count)
+                }
+            )
+        types.append((strings[type_index], category, ports[0], ports[1]))
+
+    node_ids = reader.array("q")
+    node_types = reader.array("I")
+    positions = reader.array("d")
+    for i, (node_id, type_index) in enumerate(zip(node_ids, node_types)):
+        type_name, category, inputs, outputs = types[type_index]
+        model.addNode(
+            type_name,
+            inputs,
+            outputs,
+            positions[i * 2],
+            positions[i * 2 + 1],
+            category=category,
+            node_id=node_id,
+        )
+
+    edges = zip(
+        reader.array("q"),
+        reader.array("q"),
+        reader.array("I"),
+        reader.array("q"),
+        reader.array("I"),
+    )
+    for edge_id, output_node, output_port, input_node, input_port in edges:
+        model.addEdge(
+            output_node,
+            strings[output_port],
+            input_node,
+            strings[input_port],
+            edge_id,
+        )
+
+    return model
+
+
+def save(model: GraphModel, path: str, binary: bool = False):
+    if binary:
+        with open(path, "wb") as f:
+            f.write(to_binary(model))
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(to_json(model))
+
+
+def save_stream(model: GraphModel, path: str):
+    types = _node_types(model)
+    header = {
+        "version": SCHEMA_VERSION,
+        "stream": True,
+        "nodes": model.numNodes(),
+        "edges": model.numEdges(),
+        "types": types,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(json.dumps(header, sort_keys=True) + "\n")
+        for n in model.nodes():
+            f.write(json.dumps({"id": n.id, "type": n.type_name, "x": n.x, "y": n.y}))
+            f.write("\n")
+        for e in model.edges():
+            f.write(
+                json.dumps(
+                    [e.id, e.output_node, e.output_port, e.input_node, e.input_port]
+                )
+            )
+            f.write("\n")
+
+
+def _iter_model(model: GraphModel):
+    yield "header", model.numNodes(), model.numEdges()
+    for n in model.nodes():
+        yield "node", {
+            "type_name": n.type_name,
+            "inputs": n.inputs,
+            "outputs": n.outputs,
+            "x": n.x,
+            "y": n.y,
+            "category": n.category,
+            "node_id": n.id,
+        }
+    for e in model.edges():
+        yield "edge", (e.output_node, e.output_port, e.input_node, e.input_port, e.id)
+
+
+def _iter_stream(f: typing.TextIO, header: dict):
+    _check_version(header["version"])
+    types = header["types"]
+    yield "header", header["nodes"], header["edges"]
+
+    for line in f:
+        entry = json.loads(line)
+        if isinstance(entry, dict):
+            signature = types[entry["type"]]
+            yield "node", {
+                "type_name": entry["type"],
+                "inputs": signature["inputs"],
+                "outputs": signature["outputs"],
+                "x": entry["x"],
+                "y": entry["y"],
+                "category": signature["category"],
+                "node_id": entry["id"],
+            }
+        else:
+            edge_id, output_node, output_port, input_node, input_port = entry
+            yield "edge", (output_node, output_port, input_node, input_port, edge_id)
+
+
+def iter_load(path: str):
+    """
+    Read a graph file entry by entry.
+
+    The first item is ("header", node_count, edge_count), followed by
+    ("node", kwargs) and ("edge", args) entries which can be passed to
+    GraphModel.addNode and GraphModel.addEdge. Streaming files are read a line at
+    a time, the other flavours are parsed up front.
+    """
+    with open(path, "rb") as f:
+        magic = f.read(len(BINARY_MAGIC))
+
+    if magic == BINARY_MAGIC:
+        yield from _iter_model(load(path))
+        return
+
+    with open(path, "r", encoding="utf-8") as f:
+        first_line = f.readline()
+        try:
+            header = json.loads(first_line)
+        except json.JSONDecodeError:
+            header = None
+
+        if isinstance(header, dict) and header.get("stream"):
+            yield from _iter_stream(f, header)
+            return
+
+    yield from _iter_model(load(path))
+
+
+def load(path: str, model: GraphModel = None) -> GraphModel:
+    """
+    Load a graph saved in any flavour, the format is detected from the file.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+
+    if data[:4] == BINARY_MAGIC:
+        return from_binary(data, model)
+
+    text = data.decode("utf-8")
+    first_line, _, rest = text.partition("\n")
+    try:
+        header = json.loads(first_line)
+    except json.JSONDecodeError:
+        header = None
+
+    if isinstance(header, dict) and header.get("stream"):
+        model = model if model is not None else GraphModel()
+        entries = _iter_stream(rest.splitlines(), header)
+        next(entries)
+        for kind, args in entries:
+            if kind == "node":
+                model.addNode(**args)
+            else:
+                model.addEdge(*args)
+        return model
+
+    return from_json(text, model)
@@ -0,0 +1,227 @@
+"""
+A grid hash of port anchors and connection segments.
+
+Ports and connections mark themselves dirty when they move and the index catches
+up lazily on the next query, so dragging nodes costs a dict insert per port. A
+query only visits the grid cells around the point, independent of scene size.
+
+suspended_index turns off the scene's own BSP index around large batches of
+item changes.
+"""
+
+__all__ = ["SpatialIndex", "scene_index", "suspended_index"]
+
+import contextlib
+import math
+import typing
+import weakref
+
+from qtpy import QtCore, QtWidgets
+
+if typing.TYPE_CHECKING:
+    from QtNodes.connection import ConnectionItem
+    from QtNodes.port import PortItem
+
+Cell = typing.Tuple[int, int]
+
+
+class _Grid:
+    def __init__(self, cell_size: float):
+        self.cell_size = cell_size
+        self.cells: typing.Dict[Cell, typing.Dict[typing.Any, None]] = {}
+        self.item_cells: typing.Dict[typing.Any, typing.List[Cell]] = {}
+
+    def cell(self, x: float, y: float) -> Cell:
+        return math.floor(x / self.cell_size), math.floor(y / self.cell_size)
+
+    def insert(self, item, cells: typing.List[Cell]):
+        self.remove(item)
+        self.item_cells[item] = cells
+        for cell in cells:
+            self.cells.setdefault(cell, {})[item] = None
+
+    def remove(self, item):
+        for cell in self.item_cells.pop(item, ()):
+            bucket = self.cells[cell]
+            del bucket[item]
+            if not bucket:
+                del self.cells[cell]
+
+    def around(self, x: float, y: float, radius: float):
+        x0, y0 = self.cell(x - radius, y - radius)
+        x1, y1 = self.cell(x + radius, y + radius)
+        seen = set()
+        for cx in range(x0, x1 + 1):
+            for cy in range(y0, y1 + 1):
+                for item in self.cells.get((cx, cy), ()):
+                    if item not in seen:
+                        seen.add(item)
+                        yield item
+
+    def segmentCells(self, x1: float, y1: float, x2: float, y2: float):
+        """
+        The cells a segment passes through, found a row of cells at a time.
+        """
+        size = self.cell_size
+        row0, row1 = sorted((math.floor(y1 / size), math.floor(y2 / size)))
+        cells = []
+        for row in range(row0, row1 + 1):
+            top = max(row * size, min(y1, y2))
+            bottom = min((row + 1) * size, max(y1, y2))
+            if y1 == y2:
+                xa, xb = x1, x2
+            else:
+                xa = x1 + (x2 - x1) * (top - y1) / (y2 - y1)
+                xb = x1 + (x2 - x1) * (bottom - y1) / (y2 - y1)
+            col0, col1 = sorted((math.floor(xa / size), math.floor(xb / size)))
+            cells.extend((col, row) for col in range(col0, col1 + 1))
+        return cells
+
+
+def _segment_distance(px, py, x1, y1, x2, y2):
+    dx = x2 - x1
+    dy = y2 - y1
+    length = dx * dx + dy * dy
+    if length == 0:
+        return math.hypot(px - x1, py - y1)
+    t = min(max(((px - x1) * dx + (py - y1) * dy) / length, 0.0), 1.0)
+    return math.hypot(px - x1 - t * dx, py - y1 - t * dy)
+
+
+class SpatialIndex:
+    # how far from a point connectionAt looks for connections when no tolerance
+    # is given, should be at least half the widest connection pen.
+    connection_search_radius = 16.0
+
+    def __init__(self, cell_size: float = 64.0):
+        self.__ports = _Grid(cell_size)
+        self.__connections = _Grid(cell_size)
+        self.__points: typing.Dict["PortItem", typing.Tuple[float, float]] = {}
+        self.__lines: typing.Dict["ConnectionItem", typing.Tuple[float, ...]] = {}
+        self.__dirty_ports: typing.Dict["PortItem", None] = {}
+        self.__dirty_connections: typing.Dict["ConnectionItem", None] = {}
+
+    def updatePort(self, port: "PortItem"):
+        self.__dirty_ports[port] = None
+
+    def updateConnection(self, connection: "ConnectionItem"):
+        self.__dirty_connections[connection] = None
+
+    def removePort(self, port: "PortItem"):
+        self.__dirty_ports.pop(port, None)
+        self.__points.pop(port, None)
+        self.__ports.remove(port)
+
+    def removeConnection(self, connection: "ConnectionItem"):
+        self.__dirty_connections.pop(connection, None)
+        self.__lines.pop(connection, None)
+        self.__connections.remove(connection)
+
+    def __len__(self):
+        return len(self.__ports.item_cells) + len(self.__connections.item_cells)
+
+    def refresh(self):
+        dirty, self.__dirty_ports = self.__dirty_ports, {}
+        for port in dirty:
+            x, y = port.anchor().toTuple()
+            self.__points[port] = (x, y)
+            self.__ports.insert(port, [self.__ports.cell(x, y)])
+
+        dirty, self.__dirty_connections = self.__dirty_connections, {}
+        for connection in dirty:
+            line = connection.line()
+            segment = (line.x1(), line.y1(), line.x2(), line.y2())
+            self.__lines[connection] = segment
+            cells = self.__connections.segmentCells(*segment)
+            self.__connections.insert(connection, cells)
+
+    def portsNear(self, pos: QtCore.QPointF, radius: float):
+        """
+        Yield (distance, port) for every port whose anchor is within radius.
+        """
+        self.refresh()
+        x, y = pos.toTuple()
+        for port in self.__ports.around(x, y, radius):
+            px, py = self.__points[port]
+            distance = math.hypot(px - x, py - y)
+            if distance <= radius:
+                yield distance, port
+
+    def portAt(
+        self,
+        pos: QtCore.QPointF,
+        radius: float,
+        accept: typing.Callable[["PortItem"], bool] | None = None,
+    ) -> "PortItem | None":
+        """
+        The port nearest to pos within radius, optionally limited to ports accept
+        returns True for.
+        """
+        best = None
+        best_distance = radius
+        for distance, port in self.portsNear(pos, radius):
+            if distance <= best_distance and (accept is None or accept(port)):
+                best, best_distance = port, distance
+        return best
+
+    def connectionAt(
+        self,
+        pos: QtCore.QPointF,
+        tolerance: float | None = None,
+    ) -> "ConnectionItem | None":
+        """
+        The connection nearest to pos, within tolerance or half its pen width.
+        """
+        self.refresh()
+        x, y = pos.toTuple()
+        search = tolerance
+        if search is None:
+            search = self.connection_search_radius
+        best = None
+        best_distance = math.inf
+        for connection in self.__connections.around(x, y, search):
+            limit = tolerance
+            if limit is None:
+                limit = connection.pen().widthF() / 2
+            distance = _segment_distance(x, y, *self.__lines[connection])
+            if distance <= limit and distance < best_distance:
+                best, best_distance = connection, distance
+        return best
+
+
+_indexes: "weakref.WeakKeyDictionary[QtWidgets.QGraphicsScene, SpatialIndex]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def scene_index(scene: QtWidgets.QGraphicsScene) -> SpatialIndex:
+    """
+    The SpatialIndex shared by everything in a scene, created on first use.
+    """
+    index = _indexes.get(scene)
+    if index is None:
+        index = _indexes[scene] = SpatialIndex()
+    return index
+
+
+# batches smaller than this are applied with the scene index live, rebuilding the
+# index costs as much as the whole scene so it only pays off for large batches.
+BULK_INDEX_THRESHOLD = 256
+
+
+@contextlib.contextmanager
+def suspended_index(scene: QtWidgets.QGraphicsScene, count: int):
+    """
+    Disable the scene's BSP index while applying count changes, the index is
+    rebuilt once on exit.
+    """
+    method = scene.itemIndexMethod()
+    if count < BULK_INDEX_THRESHOLD or method == scene.ItemIndexMethod.NoIndex:
+        yield
+        return
+
+    scene.setItemIndexMethod(scene.ItemIndexMethod.NoIndex)
+    try:
+        yield
+    finally:
+        scene.setItemIndexMethod(method)
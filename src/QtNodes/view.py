@@ -1,9 +1,20 @@
 __all__ = ["NodeGraphView"]
 
+import functools
+
 from qtpy import QtWidgets, QtGui, QtCore, QtOpenGLWidgets
 
+from QtNodes.connection import layout_queue
+from QtNodes.instrumentation import FrameStats, instrumentation, probe
+from QtNodes.items import SHAPE_DETAIL_THRESHOLD, TEXT_DETAIL_THRESHOLD
+from QtNodes.virtual import scene_virtualizer
+
 
 class NodeGraphView(QtWidgets.QGraphicsView):
+    # below these zoom levels items drop their text, then draw as simple shapes.
+    text_detail_threshold = TEXT_DETAIL_THRESHOLD
+    shape_detail_threshold = SHAPE_DETAIL_THRESHOLD
+
     def __init__(self, parent=None):
         super().__init__(parent=parent)
         self.zoom_factor = 1.15
@@ -11,38 +22,102 @@ class NodeGraphView(QtWidgets.QGraphicsView):
         self.setDragMode(self.DragMode.NoDrag)
         self.setViewport(QtOpenGLWidgets.QOpenGLWidget())
         self.setMouseTracking(True)
-        self.__clicked_item = None
+        self.__hud_visible = False
+        self.__fps = 0.0
 
     def wheelEvent(self, event):
         zoom_scale = (
             self.zoom_factor if event.angleDelta().y() > 0 else 1 / self.zoom_factor
         )
         self.scale(zoom_scale, zoom_scale)
+        self.updateVisibleItems()
+
+    def scrollContentsBy(self, dx, dy):
+        super().scrollContentsBy(dx, dy)
+        self.updateVisibleItems()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.updateVisibleItems()
+
+    def paintEvent(self, event):
+        # connections are normally laid out before the frame, but don't draw them
+        # stale if the paint came first
+        if layout_queue.isPending():
+            layout_queue.flush()
+        super().paintEvent(event)
+
+    def updateVisibleItems(self):
+        """
+        Let a virtualized scene create items for what came into view, call this
+        after changing the transform directly.
+        """
+        virtualizer = scene_virtualizer(self.scene()) if self.scene() else None
+        if virtualizer is not None:
+            virtualizer.scheduleUpdate()
 
     def mousePressEvent(self, event):
-        scene_position = self.mapToScene(event.position().toPoint())
-        x, y = scene_position.toTuple()
-        self.__clicked_item = self.scene().itemAt(x, y, QtGui.QTransform())
-
+        # the drag mode only applies when the scene doesn't accept the press, so
+        # clicking empty space starts a rubber band, or a hand scroll with alt.
         alt_mod = event.modifiers() & QtCore.Qt.KeyboardModifier.AltModifier
 
-        if self.__clicked_item is None:
-
-            if alt_mod:
-                self.setDragMode(self.DragMode.ScrollHandDrag)
-            else:
-                self.setDragMode(self.DragMode.RubberBandDrag)
+        if alt_mod:
+            self.setDragMode(self.DragMode.ScrollHandDrag)
+        else:
+            self.setDragMode(self.DragMode.RubberBandDrag)
 
         super().mousePressEvent(event)
 
     def mouseReleaseEvent(self, event):
         self.setDragMode(self.DragMode.NoDrag)
-        self.__clicked_item = None
         super().mouseReleaseEvent(event)
 
-    def mouseMoveEvent(self, event):
-
-        super().mouseMoveEvent(event)
+    def isHudVisible(self):
+        return self.__hud_visible
+
+    def setHudVisible(self, visible: bool):
+        """
+        Show frame rate, paint and layout counts over the view, this enables the
+        global instrumentation while shown.
+        """
+        self.__hud_visible = visible
+        instrumentation.setEnabled(visible)
+        self.viewport().update()
+
+    def drawForeground(self, painter, rect):
+        super().drawForeground(painter, rect)
+        if self.__hud_visible:
+            self.drawHud(painter, instrumentation.endFrame())
+
+    def drawHud(self, painter, stats: FrameStats):
+        # smooth the frame rate so the readout is legible while interacting
+        self.__fps += (stats.fps - self.__fps) * 0.2
+        lines = [
+            f"fps: {self.__fps:.1f}",
+            f"items painted: {stats.count('NodeItem.paint', 'ConnectionItem.paint')}",
+            f"layouts: {stats.count('ConnectionItem.layout')}",
+            f"grid: {stats.times.get('draw_grid', 0.0) * 1000:.2f} ms",
+        ]
+
+        painter.save()
+        painter.resetTransform()
+        metrics = painter.fontMetrics()
+        box = QtCore.QRectF(
+            8,
+            8,
+            max(metrics.horizontalAdvance(line) for line in lines) + 16,
+            metrics.height() * len(lines) + 12,
+        )
+        painter.setPen(QtCore.Qt.PenStyle.NoPen)
+        painter.setBrush(QtGui.QColor(0, 0, 0, 160))
+        painter.drawRoundedRect(box, 4, 4)
+        painter.setPen(QtGui.QColor(255, 255, 255))
+        baseline = box.top() + 6 + metrics.ascent()
+        for i, line in enumerate(lines):
+            painter.drawText(
+                QtCore.QPointF(box.left() + 8, baseline + i * metrics.height()), line
+            )
+        painter.restore()
 
     def drawBackground(self, painter, rect):
         super().drawBackground(painter, rect)
@@ -52,30 +127,75 @@ class NodeGraphView(QtWidgets.QGraphicsView):
         draw_grid(painter, rect, 25)
 
 
-def draw_grid(painter, rect, grid_size):
+# grid lines closer together than this many device pixels are merged by doubling
+# the grid spacing, keeping the cost of the background bounded at any zoom.
+MIN_GRID_SPACING = 8
+# above this spacing in device pixels the few visible lines are drawn directly,
+# rather than rendering a pixmap tile the size of the spacing.
+MAX_GRID_TILE = 256
+
+
+@functools.lru_cache(maxsize=16)
+def grid_tile(size: int, rgba: int):
     """
-    Draw a grid in the given rect with the given grid size.
+    A size x size pixmap with a line along its top and left edges, tiled to draw
+    the grid. Tiles are cached per size so each zoom level renders one once.
     """
+    tile = QtGui.QPixmap(size, size)
+    tile.fill(QtCore.Qt.GlobalColor.transparent)
+    painter = QtGui.QPainter(tile)
+    painter.setPen(QtGui.QPen(QtGui.QColor.fromRgba(rgba), 0))
+    painter.drawLine(0, 0, size, 0)
+    painter.drawLine(0, 0, 0, size)
+    painter.end()
+    return tile
+
+
+def draw_grid_lines(painter, rect, spacing, color):
     grid_lines = []
 
-    left = int(rect.left()) - (int(rect.left()) % grid_size)
-    top = int(rect.top()) - (int(rect.top()) % grid_size)
+    left = int(rect.left()) - (int(rect.left()) % spacing)
+    top = int(rect.top()) - (int(rect.top()) % spacing)
 
     x = left
     while x < rect.right():
-        if x != 0:
-            grid_lines.append(QtCore.QLineF(x, rect.top(), x, rect.bottom()))
-        x += grid_size
+        grid_lines.append(QtCore.QLineF(x, rect.top(), x, rect.bottom()))
+        x += spacing
 
     y = top
     while y < rect.bottom():
-        if y != 0:
-            grid_lines.append(QtCore.QLineF(rect.left(), y, rect.right(), y))
-        y += grid_size
+        grid_lines.append(QtCore.QLineF(rect.left(), y, rect.right(), y))
+        y += spacing
 
-    painter.setPen(QtGui.QPen(QtGui.QColor(0, 0, 0, 25)))
+    painter.setPen(QtGui.QPen(color, 0))
     painter.drawLines(grid_lines)
 
+
+@probe("draw_grid")
+def draw_grid(painter, rect, grid_size):
+    """
+    Draw a grid in the given rect with the given grid size.
+    """
+    scale = max(abs(painter.worldTransform().m11()), 1e-6)
+    spacing = grid_size
+    while spacing * scale < MIN_GRID_SPACING:
+        spacing *= 2
+
+    color = QtGui.QColor(0, 0, 0, 25)
+    tile_size = round(spacing * scale)
+    if tile_size > MAX_GRID_TILE:
+        draw_grid_lines(painter, rect, spacing, color)
+    else:
+        brush = QtGui.QBrush(grid_tile(tile_size, color.rgba()))
+        tile_scale = spacing / tile_size
+        brush.setTransform(QtGui.QTransform.fromScale(tile_scale, tile_scale))
+
+        painter.save()
+        painter.setPen(QtCore.Qt.PenStyle.NoPen)
+        painter.setBrush(brush)
+        painter.drawRect(rect)
+        painter.restore()
+
     # draw x and y axis
     painter.setPen(QtGui.QPen(QtGui.QColor(0, 127, 0, 64), 2))
     painter.drawLine(0, rect.top(), 0, rect.bottom())
@@ -0,0 +1,276 @@
+"""
+Lazy materialization of node and connection items.
+
+While a SceneVirtualizer is enabled only the nodes near what the scene's views
+show have scene items, every other node is just its model record. Records are
+kept in a coarse grid by position, so scrolling a view costs a lookup of the
+cells it covers and the items entering or leaving it, independent of graph size.
+
+Items are also created on demand through GraphModel.nodeItem and edgeItem, which
+is how commands and the controller's node() and connection() reach off-screen
+nodes. Listing queries like NodeGraphController.nodes() only return the items
+which already exist. Items created on demand are released on the next update from
+the event loop unless they are in view or selected, so code outside the
+controller should hold on to ids rather than items.
+"""
+
+__all__ = ["SceneVirtualizer", "scene_virtualizer"]
+
+import typing
+import weakref
+
+from qtpy import QtCore, QtWidgets
+
+from QtNodes.model import EdgeRecord, GraphEvent, NodeRecord
+from QtNodes.spatial import _Grid, suspended_index
+
+if typing.TYPE_CHECKING:
+    from QtNodes.controller import NodeGraphController
+
+
+class SceneVirtualizer(QtCore.QObject):
+    """
+    Keeps scene items only for the nodes in or near the scene's views.
+
+    A connection has an item exactly when both of its nodes do, so a connection
+    crossing a view materializes the nodes at both of its ends. Selected nodes are
+    never released.
+    """
+
+    # scene units around the views within which items are kept, so panning a
+    # short distance reuses existing items.
+    margin = 512.0
+    cell_size = 512.0
+
+    def __init__(self, controller: "NodeGraphController", parent=None):
+        super().__init__(parent=parent)
+        self.__controller = controller
+        self.__enabled = False
+        self.__nodes = _Grid(self.cell_size)
+        self.__edges = _Grid(self.cell_size)
+        # ids of the nodes which currently have items
+        self.__materialized: typing.Dict[int, None] = {}
+
+        self.__timer = QtCore.QTimer(self)
+        self.__timer.setSingleShot(True)
+        self.__timer.setInterval(0)
+        self.__timer.timeout.connect(self.update)
+
+    def isEnabled(self):
+        return self.__enabled
+
+    def setEnabled(self, enabled: bool):
+        if enabled == self.__enabled:
+            return
+
+        controller = self.__controller
+        model = controller.model
+        self.__enabled = enabled
+        if enabled:
+            _virtualizers[controller.scene] = self
+            model.subscribe(self.__modelChanged)
+            model.setItemLoader(self.loadItem)
+            for record in model.nodes():
+                self.__indexNode(record)
+                if record.item is not None:
+                    self.__materialized[record.id] = None
+            for record in model.edges():
+                self.__indexEdge(record)
+            self.update()
+        else:
+            _virtualizers.pop(controller.scene, None)
+            model.unsubscribe(self.__modelChanged)
+            model.setItemLoader(None)
+            self.__reset()
+            controller.populateScene()
+
+    def numMaterialized(self):
+        """
+        The number of nodes which currently have scene items.
+        """
+        return len(self.__materialized)
+
+    def scheduleUpdate(self):
+        """
+        Update from the event loop, repeated requests are coalesced.
+        """
+        if self.__enabled and not self.__timer.isActive():
+            self.__timer.start()
+
+    def visibleRect(self) -> QtCore.QRectF:
+        """
+        The scene area shown by any of the scene's views, including the margin.
+        """
+        rect = QtCore.QRectF()
+        for view in self.__controller.scene.views():
+            rect = rect.united(view.mapToScene(view.viewport().rect()).boundingRect())
+        if rect.isNull():
+            return rect
+        return rect.adjusted(-self.margin, -self.margin, self.margin, self.margin)
+
+    def update(self):
+        """
+        Create the items for nodes which came into view and release those which
+        left it.
+        """
+        self.__timer.stop()
+        rect = self.visibleRect()
+        if not self.__enabled or rect.isNull():
+            return
+
+        controller = self.__controller
+        model = controller.model
+        x0, y0 = self.__nodes.cell(rect.left(), rect.top())
+        x1, y1 = self.__nodes.cell(rect.right(), rect.bottom())
+
+        wanted: typing.Dict[int, None] = {}
+        for bucket in _buckets(self.__nodes, x0, y0, x1, y1):
+            wanted.update(bucket)
+        for bucket in _buckets(self.__edges, x0, y0, x1, y1):
+            for edge_id in bucket:
+                edge = model.edge(edge_id)
+                wanted[edge.output_node] = None
+                wanted[edge.input_node] = None
+
+        release = [
+            i
+            for i in self.__materialized
+            if i not in wanted and not model.node(i).item.isSelected()
+        ]
+        load = [i for i in wanted if i not in self.__materialized]
+        if not release and not load:
+            return
+
+        with suspended_index(controller.scene, len(release) + len(load)):
+            for node_id in release:
+                self.__releaseNode(model.node(node_id))
+            for node_id in load:
+                self.__loadNode(model.node(node_id))
+
+    def loadItem(self, record: NodeRecord | EdgeRecord):
+        """
+        Create the item for a node or edge record, used as the model's item loader.
+        """
+        model = self.__controller.model
+        # released again on the next update if it's still out of view
+        self.scheduleUpdate()
+
+        if isinstance(record, NodeRecord):
+            self.__loadNode(record)
+            # load the neighbours too, so the node's ports list all its connections
+            for edge in model.nodeEdges(record.id):
+                model.edgeItem(edge.id)
+            return record.item
+
+        if record.output_node not in self.__materialized:
+            self.__loadNode(model.node(record.output_node))
+        if record.input_node not in self.__materialized:
+            self.__loadNode(model.node(record.input_node))
+        # loading a node connects it to the nodes which already have items
+        if record.item is None:
+            self.__controller.materializeConnection(record)
+        return record.item
+
+    def __loadNode(self, record: NodeRecord):
+        controller = self.__controller
+        model = controller.model
+        controller.materializeNode(record)
+        self.__materialized[record.id] = None
+
+        for edge in model.nodeEdges(record.id):
+            if edge.item is not None:
+                continue
+            other = edge.output_node
+            if other == record.id:
+                other = edge.input_node
+            if other in self.__materialized:
+                controller.materializeConnection(edge)
+
+    def __releaseNode(self, record: NodeRecord):
+        controller = self.__controller
+        model = controller.model
+        scene = controller.scene
+
+        for edge in model.nodeEdges(record.id):
+            if edge.item is not None:
+                edge.item.detache()
+                scene.removeItem(edge.item)
+                edge.item = None
+
+        node = record.item
+        del self.__materialized[record.id]
+        record.item = None
+        node.setModel(None)
+        scene.removeItem(node)
+
+    def __indexNode(self, record: NodeRecord):
+        self.__nodes.insert(record.id, [self.__nodes.cell(record.x, record.y)])
+
+    def __indexEdge(self, record: EdgeRecord):
+        model = self.__controller.model
+        a = model.node(record.output_node)
+        b = model.node(record.input_node)
+        self.__edges.insert(record.id, self.__edges.segmentCells(a.x, a.y, b.x, b.y))
+
+    def __reset(self):
+        self.__timer.stop()
+        self.__nodes = _Grid(self.cell_size)
+        self.__edges = _Grid(self.cell_size)
+        self.__materialized.clear()
+
+    def __modelChanged(self, event: GraphEvent, record):
+        if event == GraphEvent.NodeAdded:
+            self.__indexNode(record)
+            if record.item is not None:
+                self.__materialized[record.id] = None
+            self.scheduleUpdate()
+
+        elif event == GraphEvent.NodeRemoved:
+            self.__nodes.remove(record.id)
+            self.__materialized.pop(record.id, None)
+
+        elif event == GraphEvent.NodeMoved:
+            self.__indexNode(record)
+            for edge in self.__controller.model.nodeEdges(record.id):
+                self.__indexEdge(edge)
+            self.scheduleUpdate()
+
+        elif event == GraphEvent.EdgeAdded:
+            self.__indexEdge(record)
+            self.scheduleUpdate()
+
+        elif event == GraphEvent.EdgeRemoved:
+            self.__edges.remove(record.id)
+
+        elif event == GraphEvent.Cleared:
+            self.__nodes = _Grid(self.cell_size)
+            self.__edges = _Grid(self.cell_size)
+            self.__materialized.clear()
+
+
+def _buckets(grid: _Grid, x0: int, y0: int, x1: int, y1: int):
+    """
+    The non empty cells of grid within the given range of cells.
+    """
+    if (x1 - x0 + 1) * (y1 - y0 + 1) > len(grid.cells):
+        for (x, y), bucket in grid.cells.items():
+            if x0 <= x <= x1 and y0 <= y <= y1:
+                yield bucket
+        return
+
+    for x in range(x0, x1 + 1):
+        for y in range(y0, y1 + 1):
+            bucket = grid.cells.get((x, y))
+            if bucket is not None:
+                yield bucket
+
+
+_virtualizers: "weakref.WeakKeyDictionary[QtWidgets.QGraphicsScene, SceneVirtualizer]"
+_virtualizers = weakref.WeakKeyDictionary()
+
+
+def scene_virtualizer(scene: QtWidgets.QGraphicsScene) -> SceneVirtualizer | None:
+    """
+    The enabled SceneVirtualizer of a scene, if any.
+    """
+    return _virtualizers.get(scene)
@@ -0,0 +1,29 @@
+import os
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import pytest
+from qtpy import QtGui, QtWidgets
+
+from QtNodes.controller import NodeGraphController
+from QtNodes.factory import NodeType, PortType
+
+
+@pytest.fixture(scope="session")
+def qapp():
+    return QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+
+@pytest.fixture
+def controller(qapp):
+    controller = NodeGraphController()
+    factory = controller.factory
+    factory.port_types["image"] = PortType("image", color=QtGui.QColor(127, 32, 32))
+    factory.node_types["merge"] = NodeType(
+        "merge", "image", {"a": "image", "b": "image"}, {"out": "image"}
+    )
+    factory.node_types["constant"] = NodeType(
+        "constant", "image", {}, {"image": "image"}
+    )
+    yield controller
+    controller.clear()
@@ -0,0 +1,281 @@
+import asyncio
+
+import pytest
+
+from QtNodes.evaluation import (
+    AsyncEvaluator,
+    BatchEvaluator,
+    ComputeError,
+    Evaluator,
+    IncrementalEvaluator,
+    ParallelEvaluator,
+    ResultCache,
+)
+from QtNodes.factory import NodeType
+from QtNodes.model import GraphModel
+from QtNodes.plan import CompiledEvaluator
+
+
+def build_graph(factory):
+    """
+    Two constants feeding a diamond of merges, merge's b input of the first merge
+    is left unconnected.
+    """
+    factory.registerCompute("constant", lambda: 2)
+    factory.registerCompute("merge", lambda a, b: (a or 0) * 3 + (b or 0))
+    model = GraphModel()
+    c1 = factory.createNodeRecord(model, "constant").id
+    c2 = factory.createNodeRecord(model, "constant").id
+    m1 = factory.createNodeRecord(model, "merge").id
+    m2 = factory.createNodeRecord(model, "merge").id
+    m3 = factory.createNodeRecord(model, "merge").id
+    model.addEdge(c1, "image", m1, "a")
+    model.addEdge(c2, "image", m2, "b")
+    model.addEdge(m1, "out", m2, "a")
+    model.addEdge(m1, "out", m3, "a")
+    model.addEdge(m2, "out", m3, "b")
+    return model, (c1, c2, m1, m2, m3)
+
+
+def test_pull_evaluator(controller):
+    model, (c1, c2, m1, m2, m3) = build_graph(controller.factory)
+    evaluator = Evaluator(model, controller.factory)
+    evaluator.setInputValue(m1, "b", 5)
+
+    results = evaluator.evaluate()
+    assert results[m1] == {"out": 11}
+    assert results[m2] == {"out": 35}
+    assert evaluator.evaluateOutput(m3, "out") == 68
+
+    # only what the requested nodes depend on is computed
+    assert set(evaluator.evaluate([m2])) == {c1, c2, m1, m2}
+
+
+@pytest.mark.parametrize("evaluator_type", [ParallelEvaluator, IncrementalEvaluator])
+def test_evaluators_match_pull(controller, evaluator_type):
+    model, ids = build_graph(controller.factory)
+    expected = Evaluator(model, controller.factory)
+    evaluator = evaluator_type(model, controller.factory)
+    for e in (expected, evaluator):
+        e.setInputValue(ids[2], "b", 5)
+
+    assert evaluator.evaluate() == expected.evaluate()
+    assert evaluator.evaluate([ids[3]]) == expected.evaluate([ids[3]])
+    if isinstance(evaluator, ParallelEvaluator):
+        evaluator.shutdown()
+
+
+def test_async_evaluator_matches_pull(controller):
+    model, ids = build_graph(controller.factory)
+    expected = Evaluator(model, controller.factory)
+    evaluator = AsyncEvaluator(Evaluator(model, controller.factory))
+    for e in (expected, evaluator.evaluator):
+        e.setInputValue(ids[2], "b", 5)
+
+    assert asyncio.run(evaluator.evaluate()) == expected.evaluate()
+
+
+def test_batch_evaluator_matches_pull(controller):
+    model, ids = build_graph(controller.factory)
+    samples = [1, 5, -4]
+    evaluator = BatchEvaluator(model, controller.factory)
+    evaluator.setBatchInputValue(ids[2], "b", samples)
+    batched = evaluator.evaluate()
+
+    expected = Evaluator(model, controller.factory)
+    for i, value in enumerate(samples):
+        expected.setInputValue(ids[2], "b", value)
+        for node_id, outputs in expected.evaluate().items():
+            for port, result in outputs.items():
+                assert batched[node_id][port][i] == result
+
+
+def test_incremental_invalidation(controller):
+    model, (c1, c2, m1, m2, m3) = build_graph(controller.factory)
+    evaluator = IncrementalEvaluator(model, controller.factory)
+    evaluator.evaluate()
+    assert evaluator.computed == {c1, c2, m1, m2, m3}
+    evaluator.evaluate()
+    assert evaluator.computed == set()
+
+    evaluator.setInputValue(m1, "b", 5)
+    assert not evaluator.isDirty(c2)
+    evaluator.evaluate()
+    assert evaluator.computed == {m1, m2, m3}
+
+    # going back to earlier inputs is served from the cache
+    evaluator.setInputValue(m1, "b", None)
+    evaluator.evaluate()
+    assert evaluator.computed == set()
+
+    edge = model.portEdges(model.node(m2).inputKey("b"))[0]
+    model.removeEdge(edge.id)
+    assert {n for n in (c1, c2, m1, m2, m3) if evaluator.isDirty(n)} == {m2, m3}
+    expected = Evaluator(model, controller.factory).evaluate()
+    assert evaluator.evaluate()[m3] == expected[m3]
+
+    # m3 was computed for three different sets of inputs
+    cached = len(evaluator.cache)
+    model.removeNode(m3)
+    assert len(evaluator.cache) == cached - 3
+
+
+def test_cache_hits_with_array_outputs(controller):
+    np = pytest.importorskip("numpy")
+    factory = controller.factory
+    factory.registerCompute("constant", lambda: np.ones((4, 4)))
+    factory.registerCompute("merge", lambda a, b: a + b)
+    model = GraphModel()
+    c1 = factory.createNodeRecord(model, "constant").id
+    c2 = factory.createNodeRecord(model, "constant").id
+    merge = factory.createNodeRecord(model, "merge").id
+    model.addEdge(c1, "image", merge, "a")
+    model.addEdge(c2, "image", merge, "b")
+
+    evaluator = IncrementalEvaluator(model, factory)
+    assert (evaluator.evaluate()[merge]["out"] == 2).all()
+    evaluator.invalidate(merge)
+    evaluator.evaluate()
+    assert evaluator.computed == set()
+
+    # recomputing a constant gives its result a new version
+    evaluator.invalidate(c1)
+    evaluator.cache.discardNode(c1)
+    evaluator.evaluate()
+    assert evaluator.computed == {c1, merge}
+
+    # unconnected array inputs are keyed by their contents
+    model.removeEdge(model.portEdges(model.node(merge).inputKey("b"))[0].id)
+    evaluator.setInputValue(merge, "b", np.zeros((4, 4)))
+    evaluator.evaluate()
+    assert evaluator.computed == {merge}
+    evaluator.setInputValue(merge, "b", np.zeros((4, 4)))
+    evaluator.evaluate()
+    assert evaluator.computed == set()
+    # including ones which don't export a buffer
+    evaluator.setInputValue(merge, "b", np.ones((4, 8))[:, ::2])
+    assert (evaluator.evaluate()[merge]["out"] == 2).all()
+    assert evaluator.computed == {merge}
+    evaluator.setInputValue(merge, "b", np.ones((4, 8))[:, ::2])
+    evaluator.evaluate()
+    assert evaluator.computed == set()
+
+
+def test_cache_discard_node(controller):
+    model = GraphModel()
+    factory = controller.factory
+    a = factory.createNodeRecord(model, "constant")
+    b = factory.createNodeRecord(model, "merge")
+
+    cache = ResultCache()
+    cache.insert(a, "k1", {"image": 1})
+    cache.insert(a, "k2", {"image": 2})
+    cache.insert(b, "k1", {"out": 3})
+    assert len(cache) == 3
+
+    cache.discardNode(a.id)
+    assert len(cache) == 1
+    assert cache.get(a, "k1") is None
+    assert cache.get(b, "k1") == {"out": 3}
+
+    cache.budget = 0
+    cache.insert(a, "k3", {"image": 4})
+    assert len(cache) == 0 and cache.size() == 0
+    cache.discardNode(b.id)
+
+
+def test_cache_key_includes_compute(controller):
+    model = GraphModel()
+    factory = controller.factory
+    factory.registerCompute("merge", lambda a, b: (a or 0) + (b or 0))
+    record = factory.createNodeRecord(model, "merge")
+
+    evaluator = IncrementalEvaluator(model, factory)
+    evaluator.setInputValue(record.id, "a", 2)
+    evaluator.setInputValue(record.id, "b", 3)
+    assert evaluator.evaluate()[record.id] == {"out": 5}
+
+    factory.registerCompute("merge", lambda a, b: a * b)
+    evaluator.invalidate(record.id)
+    assert evaluator.evaluate()[record.id] == {"out": 6}
+    assert evaluator.computed == {record.id}
+
+
+def test_compiled_evaluator_matches_pull(controller):
+    model, (c1, c2, m1, m2, m3) = build_graph(controller.factory)
+    evaluator = CompiledEvaluator(model, controller.factory)
+    expected = Evaluator(model, controller.factory)
+    for e in (evaluator, expected):
+        e.setInputValue(m1, "b", 5)
+    assert evaluator.evaluate() == expected.evaluate()
+    assert evaluator.evaluate([m2]) == expected.evaluate([m2])
+
+    # input values are read on every run, without compiling a new plan
+    plan = evaluator.plan([m3])
+    evaluator.setInputValue(m1, "b", 1)
+    expected.setInputValue(m1, "b", 1)
+    assert evaluator.evaluate([m3]) == expected.evaluate([m3])
+    assert evaluator.plan([m3]) is plan
+
+
+def test_compiled_plan_follows_model_changes(controller):
+    model, (c1, c2, m1, m2, m3) = build_graph(controller.factory)
+    factory = controller.factory
+    evaluator = CompiledEvaluator(model, factory)
+    plan = evaluator.plan([m3])
+    assert plan.isValid(model)
+
+    edge = model.portEdges(model.node(m2).inputKey("b"))[0]
+    model.removeEdge(edge.id)
+    assert not plan.isValid(model)
+    assert evaluator.evaluate() == Evaluator(model, factory).evaluate()
+    assert evaluator.plan([m3]) is not plan
+
+    plan = evaluator.plan([m3])
+    model.addEdge(c2, "image", m2, "b")
+    assert evaluator.evaluate([m3]) == Evaluator(model, factory).evaluate([m3])
+
+    m4 = factory.createNodeRecord(model, "merge").id
+    model.addEdge(m3, "out", m4, "a")
+    assert evaluator.evaluate()[m4] == {"out": 3 * 38}
+
+    model.removeNode(m1)
+    results = evaluator.evaluate()
+    assert m1 not in results
+    assert results == Evaluator(model, factory).evaluate()
+
+
+def test_compiled_plan_port_names(controller):
+    factory = controller.factory
+    factory.node_types["odd"] = NodeType(
+        "odd", "image", {"in put": "image", "class": "image"}, {"out-put": "image"}
+    )
+    factory.registerCompute("odd", lambda **kwargs: kwargs["in put"] - kwargs["class"])
+    factory.registerCompute("constant", lambda: 2)
+    model = GraphModel()
+    constant = factory.createNodeRecord(model, "constant").id
+    odd = factory.createNodeRecord(model, "odd").id
+    model.addEdge(constant, "image", odd, "in put")
+
+    evaluator = CompiledEvaluator(model, factory)
+    evaluator.setInputValue(odd, "class", 5)
+    assert evaluator.evaluate()[odd] == {"out-put": -3}
+
+
+def test_compiled_plan_multiple_outputs(controller):
+    factory = controller.factory
+    factory.node_types["split"] = NodeType(
+        "split", "image", {"a": "image"}, {"lo": "image", "hi": "image"}
+    )
+    factory.registerCompute("split", lambda a: {"lo": a - 1, "hi": a + 1})
+    model = GraphModel()
+    split = factory.createNodeRecord(model, "split").id
+    evaluator = CompiledEvaluator(model, factory)
+    evaluator.setInputValue(split, "a", 4)
+    assert evaluator.evaluate() == {split: {"lo": 3, "hi": 5}}
+
+    factory.registerCompute("split", lambda a: (a - 1, a + 1))
+    evaluator.invalidate()
+    with pytest.raises(ComputeError) as error:
+        evaluator.evaluate()
+    assert error.value.node_id == split
@@ -0,0 +1,45 @@
+from qtpy import QtCore, QtGui
+
+from QtNodes import view
+from QtNodes.instrumentation import instrumentation
+from QtNodes.node import NodeItem
+from QtNodes.scene_events import SceneEventRouter
+
+
+def render(scene):
+    image = QtGui.QImage(400, 400, QtGui.QImage.Format.Format_ARGB32)
+    painter = QtGui.QPainter(image)
+    scene.render(painter, QtCore.QRectF(image.rect()), QtCore.QRectF(0, 0, 400, 400))
+    painter.end()
+
+
+def test_probes_count_existing_and_new_items(controller):
+    first = controller.createNode("merge")
+    render(controller.scene)
+    instrumentation.setEnabled(True)
+    try:
+        second = controller.createNode("merge")
+        second.setPos(200, 0)
+        render(controller.scene)
+        stats = instrumentation.endFrame()
+    finally:
+        instrumentation.setEnabled(False)
+
+    assert stats.count("NodeItem.paint") == 2
+    assert stats.count("AddItemToSceneCommand.redo") == 1
+    assert not stats.count("draw_grid")
+    for node in (first, second):
+        assert "paint" not in vars(node)
+
+
+def test_disabled_probes_leave_originals(controller):
+    instrumentation.setEnabled(True)
+    instrumentation.setEnabled(False)
+    assert not hasattr(NodeItem.paint, "__wrapped__")
+    assert not hasattr(SceneEventRouter.eventFilter, "__wrapped__")
+    assert not hasattr(view.draw_grid, "__wrapped__")
+    assert "__init__" not in vars(SceneEventRouter) or not hasattr(
+        SceneEventRouter.__init__, "__wrapped__"
+    )
+    node = controller.createNode("merge")
+    assert "paint" not in vars(node)
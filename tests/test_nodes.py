@@ -0,0 +1,63 @@
+from qtpy import QtCore
+
+from QtNodes.connection import layout_queue
+from QtNodes.node import node_layout
+
+
+def test_clone_nodes_reconnects_clones(controller):
+    a, b, c = controller.createNodes(
+        [
+            ("merge", QtCore.QPointF(0, 0)),
+            ("merge", QtCore.QPointF(400, 0)),
+            ("merge", QtCore.QPointF(800, 0)),
+        ]
+    )
+    controller.createConnections(
+        [
+            (a.outputPort("out"), b.inputPort("a")),
+            (b.outputPort("out"), c.inputPort("b")),
+        ]
+    )
+    offset = QtCore.QPointF(0, 300)
+    controller.cloneNodes([a, b], [a.pos() + offset, b.pos() + offset])
+
+    clones = [n for n in controller.nodes() if n not in (a, b, c)]
+    assert len(clones) == 2
+    new_a, new_b = sorted(clones, key=lambda n: n.x())
+    # only the connection between cloned nodes is cloned
+    (connection,) = new_a.outputPort("out").iterConnections()
+    assert connection.inputPort() is new_b.inputPort("a")
+    assert new_b.outputPort("out").numConnections() == 0
+    assert controller.model.numEdges() == 3
+
+    # anchors are valid straight away, without processing events
+    assert new_a.outputPort("out").anchor() == a.outputPort("out").anchor() + offset
+    layout_queue.flush()
+    assert connection.line().p2() == b.inputPort("a").anchor() + offset
+
+    controller.undo_stack.undo()
+    assert controller.model.numNodes() == 3
+    assert controller.model.numEdges() == 2
+    controller.undo_stack.redo()
+    assert controller.model.numNodes() == 5
+    assert controller.model.numEdges() == 3
+    assert controller.model.validate() == []
+
+
+def test_nodes_of_a_type_share_a_layout(controller):
+    a, b = controller.createNodes(
+        [("merge", QtCore.QPointF(0, 0)), ("merge", QtCore.QPointF(400, 0))]
+    )
+    constant = controller.createNode("constant")
+    assert a.nodeLayout() is b.nodeLayout()
+    assert a.nodeLayout() is not constant.nodeLayout()
+    hits = node_layout.cache_info().hits
+    c = controller.createNode("merge")
+    assert c.nodeLayout() is a.nodeLayout()
+    assert node_layout.cache_info().hits > hits
+
+    # ports are laid out relative to the node, so the shared layout holds
+    # wherever the node is
+    port = b.inputPort("a")
+    assert port.anchor() == b.scenePos() + a.portLayout(a.inputPort("a")).anchor
+    assert a.size() == b.size() == a.nodeLayout().size
@@ -0,0 +1,85 @@
+from qtpy import QtCore, QtGui, QtWidgets
+
+from QtNodes.node import NodeItem
+from QtNodes.render_cache import MAX_ZOOM_BUCKET, RenderCache, zoom_bucket
+
+
+def pixmap(size):
+    image = QtGui.QPixmap(size, size)
+    image.fill(QtCore.Qt.GlobalColor.red)
+    return image
+
+
+def paint(node, scale):
+    image = QtGui.QImage(400, 400, QtGui.QImage.Format.Format_ARGB32)
+    painter = QtGui.QPainter(image)
+    painter.scale(scale, scale)
+    node.paint(painter, QtWidgets.QStyleOptionGraphicsItem(), None)
+    painter.end()
+
+
+def test_render_cache_evicts_least_recently_used(qapp):
+    cost = RenderCache.cost(pixmap(10))
+    cache = RenderCache(budget=3 * cost)
+    for key in "abc":
+        cache.insert(key, pixmap(10))
+    assert len(cache) == 3 and cache.size() == 3 * cost
+
+    assert cache.get("a") is not None
+    cache.insert("d", pixmap(10))
+    assert cache.get("b") is None
+    assert [cache.get(k) is not None for k in "acd"] == [True] * 3
+
+    # replacing an entry only counts the new pixmap
+    cache.insert("d", pixmap(10))
+    assert cache.size() == 3 * cost
+
+    cache.setBudget(cost)
+    assert len(cache) == 1 and cache.get("d") is not None
+    cache.insert("e", pixmap(20))
+    assert len(cache) == 0 and cache.size() == 0
+
+
+def test_nodes_of_a_type_share_images(controller, qapp, monkeypatch):
+    cache = RenderCache()
+    monkeypatch.setattr(NodeItem, "render_cache", cache)
+    first = controller.createNode("merge")
+    second = controller.createNode("merge")
+    constant = controller.createNode("constant")
+
+    assert first.renderKey() == second.renderKey()
+    assert first.cachedPixmap(1.0) is second.cachedPixmap(1.0)
+    constant.cachedPixmap(1.0)
+    assert len(cache) == 2
+
+    font = second.font()
+    font.setPointSize(font.pointSize() * 2)
+    second.setFont(font)
+    # font changes are only sent once the item is polished
+    qapp.processEvents()
+    assert first.renderKey() != second.renderKey()
+    assert second.size() != first.size()
+    second.cachedPixmap(1.0)
+    assert len(cache) == 3
+
+
+def test_zoom_past_largest_bucket_paints_directly(controller, monkeypatch):
+    cache = RenderCache()
+    monkeypatch.setattr(NodeItem, "render_cache", cache)
+    node = controller.createNode("merge")
+
+    paint(node, 1.0)
+    paint(node, 1.1)
+    assert len(cache) == 1
+    assert zoom_bucket(MAX_ZOOM_BUCKET * 4) == MAX_ZOOM_BUCKET
+
+    painted = []
+    paint_contents = NodeItem.paintContents
+    monkeypatch.setattr(
+        NodeItem,
+        "paintContents",
+        lambda self, *args: painted.append(self) or paint_contents(self, *args),
+    )
+    paint(node, MAX_ZOOM_BUCKET * 2)
+    assert painted == [node]
+    assert len(cache) == 1
@@ -0,0 +1,126 @@
+from qtpy import QtCore, QtGui, QtWidgets
+
+from QtNodes.connection import layout_queue
+from QtNodes.instrumentation import instrumentation
+from QtNodes.node import NodeItem
+from QtNodes.scene_events import ClonePreviewItem, HitKind
+
+
+def build_pair(controller):
+    a, b = controller.createNodes(
+        [("merge", QtCore.QPointF(0, 0)), ("merge", QtCore.QPointF(400, 0))]
+    )
+    (connection,) = controller.createConnections(
+        [(a.outputPort("out"), b.inputPort("a"))]
+    )
+    return a, b, connection
+
+
+def hit_test(controller, pos):
+    return controller.event_router.hitTest(controller.scene, pos)
+
+
+def test_hit_test_order(controller):
+    a, b, connection = build_pair(controller)
+
+    # ports sit on the node's edge, they win over the node body
+    port = a.outputPort("out")
+    hit = hit_test(controller, port.anchor())
+    assert (hit.kind, hit.item) == (HitKind.Port, port)
+
+    hit = hit_test(controller, a.sceneBoundingRect().center())
+    assert (hit.kind, hit.item) == (HitKind.Node, a)
+
+    hit = hit_test(controller, connection.line().center())
+    assert (hit.kind, hit.item) == (HitKind.Connection, connection)
+
+    hit = hit_test(controller, QtCore.QPointF(200, 500))
+    assert hit.kind == HitKind.Empty and hit.item is None
+
+
+def test_hit_test_follows_stacking_order(controller):
+    a, b, connection = build_pair(controller)
+    line = connection.line()
+
+    # a node under the middle of the connection, the connection is stacked above
+    c = controller.createNode("merge")
+    rect = c.boundingRect()
+    c.setPos(line.center() - rect.center())
+    connection.setZValue(c.zValue() + 1)
+    hit = hit_test(controller, line.center())
+    assert (hit.kind, hit.item) == (HitKind.Connection, connection)
+
+    c.setZValue(connection.zValue() + 1)
+    hit = hit_test(controller, line.center())
+    assert (hit.kind, hit.item) == (HitKind.Node, c)
+
+    # a node covering another node's port hides it
+    port = b.inputPort("a")
+    c.setPos(port.anchor() - rect.center())
+    hit = hit_test(controller, port.anchor())
+    assert (hit.kind, hit.item) == (HitKind.Node, c)
+
+    c.setZValue(b.zValue() - 1)
+    hit = hit_test(controller, port.anchor())
+    assert (hit.kind, hit.item) == (HitKind.Port, port)
+
+
+def test_layouts_are_coalesced_per_frame(controller, qapp):
+    a, b, connection = build_pair(controller)
+    instrumentation.setEnabled(True)
+    try:
+        for i in range(10):
+            a.setPos(i, 0)
+            b.setPos(400, i)
+        assert layout_queue.isPending()
+        # laid out on the next pass of the event loop, not per move
+        assert connection.line().p1() != a.outputPort("out").anchor()
+        qapp.processEvents()
+        stats = instrumentation.endFrame()
+    finally:
+        instrumentation.setEnabled(False)
+
+    assert not layout_queue.isPending()
+    assert stats.count("ConnectionItem.layout") == 1
+    assert connection.line().p2() == b.inputPort("a").anchor()
+
+
+def test_clone_preview_cost_is_bounded(controller, monkeypatch):
+    images = []
+    outlines = []
+    cached_pixmap = NodeItem.cachedPixmap
+    add_rounded_rect = QtGui.QPainterPath.addRoundedRect
+    monkeypatch.setattr(
+        NodeItem,
+        "cachedPixmap",
+        lambda self, *args: images.append(self) or cached_pixmap(self, *args),
+    )
+    monkeypatch.setattr(
+        QtGui.QPainterPath,
+        "addRoundedRect",
+        lambda self, *args: outlines.append(1) or add_rounded_rect(self, *args),
+    )
+
+    nodes = []
+    for i in range(ClonePreviewItem.max_outline_nodes + 100):
+        node = controller.factory.createNode("constant")
+        node.setPos(i % 64 * 200, i // 64 * 100)
+        nodes.append(node)
+
+    image = QtGui.QImage(100, 100, QtGui.QImage.Format.Format_ARGB32)
+    for count in (10, 100, len(nodes)):
+        images.clear()
+        outlines.clear()
+        preview = ClonePreviewItem(nodes[:count])
+        painter = QtGui.QPainter(image)
+        preview.paint(painter, QtWidgets.QStyleOptionGraphicsItem(), None)
+        painter.end()
+
+        # past max_outline_nodes the rest only add to the drawn bounds
+        shown = min(count, ClonePreviewItem.max_outline_nodes)
+        assert len(images) == min(count, ClonePreviewItem.max_image_nodes)
+        assert len(images) + len(outlines) == shown
+        bounds = nodes[0].sceneBoundingRect()
+        for node in nodes[:count]:
+            bounds = bounds.united(node.sceneBoundingRect())
+        assert preview.boundingRect().contains(bounds)
@@ -0,0 +1,134 @@
+import json
+import struct
+
+import pytest
+from qtpy import QtCore
+
+from QtNodes import serialization
+from QtNodes.model import GraphModel
+
+
+def build_graph(controller):
+    nodes = controller.createNodes(
+        [
+            ("constant", QtCore.QPointF(-120.5, 40)),
+            ("merge", QtCore.QPointF(100, 200.25)),
+            ("merge", QtCore.QPointF(300, -75)),
+        ]
+    )
+    controller.createConnections(
+        [
+            (nodes[0].outputPort("image"), nodes[1].inputPort("a")),
+            (nodes[0].outputPort("image"), nodes[2].inputPort("b")),
+            (nodes[1].outputPort("out"), nodes[2].inputPort("a")),
+        ]
+    )
+    return controller.model
+
+
+def graph_state(model: GraphModel):
+    nodes = sorted(
+        (n.id, n.type_name, n.category, n.x, n.y, n.inputs, n.outputs)
+        for n in model.nodes()
+    )
+    edges = sorted(
+        (e.id, e.output_node, e.output_port, e.input_node, e.input_port)
+        for e in model.edges()
+    )
+    return nodes, edges
+
+
+@pytest.mark.parametrize("flavour", ["json", "binary", "stream"])
+def test_round_trip(controller, tmp_path, flavour):
+    model = build_graph(controller)
+    path = str(tmp_path / "graph")
+    if flavour == "stream":
+        serialization.save_stream(model, path)
+    else:
+        serialization.save(model, path, binary=flavour == "binary")
+
+    loaded = serialization.load(path)
+    assert graph_state(loaded) == graph_state(model)
+    assert loaded.validate() == []
+
+    entries = list(serialization.iter_load(path))
+    assert entries[0] == ("header", 3, 3)
+    assert len(entries) == 7
+
+
+def test_round_trip_through_controller(controller, tmp_path):
+    state = graph_state(build_graph(controller))
+    path = str(tmp_path / "graph.json")
+    controller.saveGraph(path)
+    controller.loadGraph(path)
+
+    assert graph_state(controller.model) == state
+    assert len(controller.connections()) == 3
+    positions = sorted((n.nodeId(), n.x(), n.y()) for n in controller.nodes())
+    assert positions == [(n[0], n[3], n[4]) for n in state[0]]
+
+
+def test_newer_version_is_rejected(controller, tmp_path):
+    model = build_graph(controller)
+    newer = serialization.SCHEMA_VERSION + 1
+
+    data = serialization.graph_to_dict(model)
+    data["version"] = newer
+    with pytest.raises(ValueError, match="newer than supported"):
+        serialization.from_json(json.dumps(data))
+
+    binary = bytearray(serialization.to_binary(model))
+    offset = len(serialization.BINARY_MAGIC)
+    binary[offset : offset + 2] = struct.pack("<H", newer)
+    with pytest.raises(ValueError, match="newer than supported"):
+        serialization.from_binary(bytes(binary))
+
+    path = tmp_path / "graph.jsonl"
+    serialization.save_stream(model, str(path))
+    header, _, rest = path.read_text().partition("\n")
+    header = json.loads(header)
+    header["version"] = newer
+    path.write_text(json.dumps(header) + "\n" + rest)
+    with pytest.raises(ValueError, match="newer than supported"):
+        serialization.load(str(path))
+
+
+def test_programmatic_move_is_saved(controller, tmp_path):
+    node = controller.createNode("merge")
+    node.setPos(500, 250)
+    record = controller.model.node(node.nodeId())
+    assert (record.x, record.y) == (500, 250)
+
+    path = str(tmp_path / "graph.json")
+    controller.saveGraph(path)
+    controller.loadGraph(path)
+
+    loaded = controller.nodes()
+    assert len(loaded) == 1
+    assert (loaded[0].x(), loaded[0].y()) == (500, 250)
+
+
+def test_undone_move_updates_model(controller):
+    node = controller.createNode("merge")
+    controller.moveNodes([node], QtCore.QPointF(30, 40), "drag")
+    assert controller.model.node(node.nodeId()).x == 30
+
+    controller.undo_stack.undo()
+    record = controller.model.node(node.nodeId())
+    assert (record.x, record.y) == (0, 0)
+
+
+def test_clear_cancels_incremental_load(controller, tmp_path):
+    controller.createNodes(("constant", QtCore.QPointF(i * 100, 0)) for i in range(50))
+    path = str(tmp_path / "graph.json")
+    controller.saveGraph(path)
+
+    first = controller.loadGraphIncrementally(path, chunk_size=10)
+    assert first.step()
+    second = controller.loadGraphIncrementally(path, chunk_size=10)
+    assert not first.isRunning()
+    assert second.isRunning()
+
+    controller.clear()
+    assert not second.isRunning()
+    assert controller.model.numNodes() == 0
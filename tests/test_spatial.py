@@ -0,0 +1,96 @@
+from qtpy import QtCore, QtWidgets
+
+from QtNodes.scene_events import HitKind, SceneHit
+from QtNodes.spatial import _Grid, scene_index
+
+
+def build_pair(controller):
+    return controller.createNodes(
+        [("merge", QtCore.QPointF(0, 0)), ("merge", QtCore.QPointF(400, 0))]
+    )
+
+
+def mouse_event(kind, pos):
+    event = QtWidgets.QGraphicsSceneMouseEvent(kind)
+    event.setScenePos(pos)
+    return event
+
+
+def test_port_at_within_radius(controller):
+    a, b = build_pair(controller)
+    index = scene_index(controller.scene)
+    target = b.inputPort("a")
+    pos = target.anchor() + QtCore.QPointF(3, 4)
+
+    assert index.portAt(pos, 10) is target
+    assert index.portAt(pos, 4) is None
+    assert sorted(d for d, _ in index.portsNear(pos, 10)) == [5]
+
+    other = b.inputPort("b")
+    assert index.portAt(pos, 100, lambda port: port is other) is other
+    assert index.portAt(pos, 100, lambda port: False) is None
+
+    # moved ports are found at their new anchor
+    b.setPos(1000, 1000)
+    assert index.portAt(pos, 10) is None
+    assert index.portAt(target.anchor(), 1) is target
+
+
+def test_segment_cells():
+    grid = _Grid(10)
+    assert grid.segmentCells(5, 5, 35, 5) == [(0, 0), (1, 0), (2, 0), (3, 0)]
+    assert grid.segmentCells(5, 5, 5, 35) == [(0, 0), (0, 1), (0, 2), (0, 3)]
+    assert grid.segmentCells(5, 5, 5, 5) == [(0, 0)]
+
+    diagonal = [(0, 0), (1, 0), (1, 1), (2, 1), (2, 2)]
+    assert grid.segmentCells(5, 5, 25, 25) == diagonal
+    assert sorted(grid.segmentCells(25, 25, 5, 5)) == sorted(diagonal)
+    assert grid.segmentCells(-5, 5, -25, 5) == [(-3, 0), (-2, 0), (-1, 0)]
+
+
+def test_connection_at_spans_cells(controller):
+    a, b = build_pair(controller)
+    b.setPos(400, 300)
+    (connection,) = controller.createConnections(
+        [(a.outputPort("out"), b.inputPort("a"))]
+    )
+    index = scene_index(controller.scene)
+    line = connection.line()
+    for t in (0.1, 0.5, 0.9):
+        assert index.connectionAt(line.pointAt(t), 2) is connection
+    assert index.connectionAt(line.center() + QtCore.QPointF(0, 50), 2) is None
+
+
+def test_items_leaving_the_scene_are_removed(controller):
+    a, b = build_pair(controller)
+    controller.createConnections([(a.outputPort("out"), b.inputPort("a"))])
+    index = scene_index(controller.scene)
+    index.refresh()
+    assert len(index) == 7
+
+    controller.removeNodes([a, b])
+    index.refresh()
+    assert len(index) == 0
+    assert index.portAt(b.inputPort("a").anchor(), 10) is None
+
+    controller.undo_stack.undo()
+    assert index.portAt(b.inputPort("a").anchor(), 1) is b.inputPort("a")
+
+
+def test_snap_target(controller):
+    a, b = build_pair(controller)
+    scene = controller.scene
+    interaction = controller.connection_interaction
+    source = a.outputPort("out")
+    target = b.inputPort("b")
+    near = target.anchor() + QtCore.QPointF(interaction.snap_radius / 2, 0)
+
+    press = mouse_event(QtCore.QEvent.Type.GraphicsSceneMousePress, source.anchor())
+    assert interaction.press(scene, press, SceneHit(HitKind.Port, source))
+    assert interaction.snapTarget(scene, near) is target
+    # the source's own node and incompatible ports are skipped
+    assert interaction.snapTarget(scene, source.anchor()) is None
+
+    release = mouse_event(QtCore.QEvent.Type.GraphicsSceneMouseRelease, near)
+    assert interaction.release(scene, release)
+    assert [c.inputPort() for c in source.iterConnections()] == [target]
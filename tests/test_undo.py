@@ -0,0 +1,141 @@
+import gc
+
+from qtpy import QtCore
+
+from QtNodes import commands
+from QtNodes.node import NodeItem
+
+
+def build_chain(controller, count):
+    nodes = controller.createNodes(
+        ("merge", QtCore.QPointF(i * 200, 0)) for i in range(count)
+    )
+    controller.createConnections(
+        (nodes[i].outputPort("out"), nodes[i + 1].inputPort("a"))
+        for i in range(count - 1)
+    )
+    return [n.nodeId() for n in nodes]
+
+
+def test_undo_limit_on_non_empty_stack(controller):
+    for _ in range(5):
+        controller.createNode("merge")
+    controller.setUndoLimit(2)
+
+    live = [
+        controller.undo_stack.command(i)
+        for i in range(controller.undo_stack.count())
+        if not controller.undo_stack.command(i).isObsolete()
+    ]
+    assert len(live) == 2
+
+    controller.undo_stack.undo()
+    controller.undo_stack.undo()
+    assert controller.model.numNodes() == 3
+    # the evicted commands below are discarded instead of undone
+    assert controller.undo_stack.index() == 0
+    assert controller.undo_stack.count() == 2
+    assert not controller.undo_stack.canUndo()
+
+
+def test_budget_evicts_oldest_commands(controller):
+    controller.undo_budget = 1
+    build_chain(controller, 50)
+    controller.removeNodes(controller.nodes())
+    assert controller.undoCost() == 0
+    assert all(
+        controller.undo_stack.command(i).isObsolete()
+        for i in range(controller.undo_stack.count())
+    )
+
+
+def test_cost_is_compressed_snapshot_size(controller):
+    build_chain(controller, 200)
+    controller.removeNodes(controller.nodes())
+    command = controller.undo_stack.command(controller.undo_stack.index() - 1)
+    assert 0 < commands.command_cost(command) < 200 * 64
+
+
+def test_remove_node_children_are_walked(controller):
+    build_chain(controller, 3)
+    node = controller.node(2)
+    controller.removeNode(node)
+    command = controller.undo_stack.command(controller.undo_stack.index() - 1)
+    assert len(list(commands.iter_commands(command))) == 4
+    assert commands.command_cost(command) > 0
+    assert commands.held_items(command) == 3
+
+    controller.undo_held_items = 1
+    controller.trimUndoHistory()
+    assert commands.held_items(command) == 0
+
+
+def test_undo_after_release_rebuilds_items(controller):
+    ids = build_chain(controller, 300)
+    controller.undo_held_items = 0
+    controller.removeNodes(controller.nodes())
+    for i in range(controller.undo_stack.count()):
+        for c in commands.iter_commands(controller.undo_stack.command(i)):
+            if isinstance(c, commands.GraphEditCommand):
+                c.release()
+    gc.collect()
+    assert not any(isinstance(o, NodeItem) for o in gc.get_objects())
+
+    controller.undo_stack.undo()
+    model = controller.model
+    assert sorted(r.id for r in model.nodes()) == sorted(ids)
+    assert model.numEdges() == 299
+    assert model.validate() == []
+    assert controller.node(ids[0]).outputPort("out").numConnections() == 1
+    assert (model.node(ids[1]).x, model.node(ids[1]).y) == (200, 0)
+
+    controller.undo_stack.redo()
+    assert model.numNodes() == 0
+    controller.undo_stack.undo()
+    assert model.numNodes() == 300
+    assert len(controller.connections()) == 299
+
+
+def test_empty_batches_push_nothing(controller):
+    node = controller.createNode("merge")
+    count = controller.undo_stack.count()
+    assert controller.createNodes([]) == []
+    assert controller.createConnections([]) == []
+    # an invalid pair is skipped, leaving nothing to push
+    pairs = [(node.inputPort("a"), node.inputPort("b"))]
+    assert controller.createConnections(pairs) == []
+    assert controller.undo_stack.count() == count
+
+
+def test_push_cost_is_flat(controller, monkeypatch):
+    measured = []
+    command_cost = commands.command_cost
+    monkeypatch.setattr(
+        commands, "command_cost", lambda c: measured.append(c) or command_cost(c)
+    )
+    for count in (100, 2000):
+        while controller.undo_stack.count() < count:
+            controller.createNode("merge")
+        measured.clear()
+        for _ in range(10):
+            controller.createNode("merge")
+        # only the pushed command is measured, not the whole history
+        assert len(measured) == 10
+
+
+def test_evicted_commands_are_deleted(controller):
+    controller.undo_limit = 10
+    stack = controller.undo_stack
+    for _ in range(500):
+        controller.createNode("merge")
+    history = controller.undo_history
+    assert stack.count() - history.evicted() == 10
+    assert stack.count() < 2 * commands.UndoHistory.MIN_COMPACT + 10
+
+    for _ in range(10):
+        stack.undo()
+    assert controller.model.numNodes() == 490
+    assert stack.index() == 0
+    assert not stack.canUndo()
+    stack.redo()
+    assert controller.model.numNodes() == 491
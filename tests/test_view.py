@@ -0,0 +1,39 @@
+from qtpy import QtCore, QtGui, QtWidgets
+
+from QtNodes import view
+from QtNodes.items import DetailLevel, detail_level
+
+
+def test_grid_tiles_stay_bounded(qapp, monkeypatch):
+    sizes = []
+    grid_tile = view.grid_tile
+
+    def record_tile(size, rgba):
+        sizes.append(size)
+        return grid_tile(size, rgba)
+
+    monkeypatch.setattr(view, "grid_tile", record_tile)
+    image = QtGui.QImage(200, 200, QtGui.QImage.Format.Format_ARGB32)
+    for scale in (0.01, 0.5, 1.0, 4.0, 100.0, 10000.0):
+        painter = QtGui.QPainter(image)
+        painter.scale(scale, scale)
+        transform = painter.worldTransform().inverted()[0]
+        view.draw_grid(painter, transform.mapRect(QtCore.QRectF(image.rect())), 25)
+        painter.end()
+
+    assert sizes
+    assert all(view.MIN_GRID_SPACING <= s <= view.MAX_GRID_TILE for s in sizes)
+
+
+def test_detail_level_uses_view_thresholds(qapp):
+    image = QtGui.QImage(10, 10, QtGui.QImage.Format.Format_ARGB32)
+    painter = QtGui.QPainter(image)
+    painter.scale(0.4, 0.4)
+    option = QtWidgets.QStyleOptionGraphicsItem()
+    assert detail_level(painter, option) == DetailLevel.NoText
+
+    graph_view = view.NodeGraphView()
+    graph_view.shape_detail_threshold = 0.45
+    graph_view.text_detail_threshold = 0.6
+    assert detail_level(painter, option, graph_view.viewport()) == DetailLevel.Shapes
+    painter.end()
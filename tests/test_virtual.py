@@ -0,0 +1,114 @@
+from qtpy import QtCore, QtWidgets
+
+from QtNodes.view import NodeGraphView
+
+
+def test_queries_return_only_materialized_items(controller):
+    controller.createNodes(("merge", QtCore.QPointF(i * 2000, 0)) for i in range(20))
+    view = QtWidgets.QGraphicsView(controller.scene)
+    view.resize(400, 300)
+    view.centerOn(0, 0)
+    controller.setVirtualized(True)
+
+    materialized = controller.virtualizer.numMaterialized()
+    assert 0 < materialized < 20
+    assert len(controller.nodes()) == materialized
+    assert len(controller.nodesOfType("merge")) == materialized
+    assert len(controller.nodesInCategory("image")) == materialized
+    assert controller.virtualizer.numMaterialized() == materialized
+
+    # looking a node up by id still creates its item
+    far = max(controller.model.nodes(), key=lambda r: r.x)
+    assert far.item is None
+    assert controller.node(far.id) is not None
+    assert len(controller.nodes()) == materialized + 1
+
+
+def build_row(controller, count=20):
+    """
+    A chain of nodes far enough apart that a small view only shows a few.
+    """
+    nodes = controller.createNodes(
+        ("merge", QtCore.QPointF(i * 2000, 0)) for i in range(count)
+    )
+    controller.createConnections(
+        (nodes[i].outputPort("out"), nodes[i + 1].inputPort("a"))
+        for i in range(count - 1)
+    )
+    ids = [n.nodeId() for n in nodes]
+    view = NodeGraphView()
+    view.setScene(controller.scene)
+    view.resize(400, 300)
+    view.centerOn(0, 0)
+    controller.setVirtualized(True)
+    return ids, view
+
+
+def has_item(controller, node_id):
+    return controller.model.node(node_id).item is not None
+
+
+def test_scrolling_creates_and_releases_items(controller, qapp):
+    ids, view = build_row(controller)
+    assert has_item(controller, ids[0])
+    assert not has_item(controller, ids[-1])
+
+    view.centerOn((len(ids) - 1) * 2000, 0)
+    qapp.processEvents()
+    assert has_item(controller, ids[-1])
+    assert not has_item(controller, ids[0])
+    assert controller.virtualizer.numMaterialized() < len(ids)
+    # a connection has an item exactly when both of its nodes do
+    for edge in controller.model.edges():
+        ends = (edge.output_node, edge.input_node)
+        assert (edge.item is not None) == all(has_item(controller, n) for n in ends)
+
+
+def test_selected_nodes_are_kept(controller, qapp):
+    ids, view = build_row(controller)
+    controller.node(ids[0]).setSelected(True)
+    view.centerOn(19 * 2000, 0)
+    qapp.processEvents()
+    assert has_item(controller, ids[0])
+    assert not has_item(controller, ids[1])
+
+    controller.node(ids[0]).setSelected(False)
+    view.updateVisibleItems()
+    qapp.processEvents()
+    assert not has_item(controller, ids[0])
+
+
+def test_remove_and_undo_off_screen_nodes(controller, qapp):
+    ids, view = build_row(controller)
+    model = controller.model
+    off_screen = ids[10:12]
+    controller.removeNodes([controller.node(i) for i in off_screen])
+    qapp.processEvents()
+    assert not any(model.hasNode(i) for i in off_screen)
+    assert model.numEdges() == 16
+
+    controller.undo_stack.undo()
+    qapp.processEvents()
+    assert all(model.hasNode(i) for i in off_screen)
+    assert model.numEdges() == 19
+    assert model.validate() == []
+    # restored off-screen nodes don't keep their items
+    assert not any(has_item(controller, i) for i in off_screen)
+
+    controller.undo_stack.redo()
+    assert model.numNodes() == 18
+
+
+def test_load_graph_while_virtualized(controller, qapp, tmp_path):
+    ids, view = build_row(controller)
+    path = str(tmp_path / "graph.json")
+    controller.saveGraph(path)
+
+    controller.loadGraph(path)
+    qapp.processEvents()
+    model = controller.model
+    assert sorted(r.id for r in model.nodes()) == sorted(ids)
+    assert model.numEdges() == 19
+    assert 0 < controller.virtualizer.numMaterialized() < len(ids)
+    assert has_item(controller, ids[0])
+    assert controller.node(ids[-1]).outputPort("out") is not None